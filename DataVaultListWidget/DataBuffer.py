@@ -0,0 +1,191 @@
+"""
+Array-backed column stores used by Dataset to hold data received from the data vault.
+"""
+import numpy as np
+
+
+class DataBuffer(object):
+    """
+    A growable column store backed by a single 2D numpy array.
+    Rows are appended in amortized O(1) time by doubling the capacity
+    of the underlying array whenever it runs out of space.
+    Rows can also be discarded from the front (e.g. to enforce a retention policy).
+    The stored rows are exposed as a zero-copy view of the underlying array.
+    """
+
+    def __init__(self, columns, capacity=0):
+        """
+        Arguments:
+            columns     (int): the number of columns (i.e. independent + dependent variables).
+            capacity    (int): the number of rows to preallocate.
+        """
+        self.columns = columns
+        self._array = np.zeros((max(int(capacity), 0), columns))
+        self._start = 0
+        self._size = 0
+        self._appended = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        """
+        The number of rows which can be held before the buffer has to grow.
+        """
+        return self._array.shape[0]
+
+    @property
+    def size(self):
+        """
+        The number of rows currently stored.
+        """
+        return self._size
+
+    @property
+    def offset(self):
+        """
+        The total number of rows which have been discarded from the front of the buffer,
+        i.e. the absolute index of the first stored row.
+        """
+        return self._appended - self._size
+
+    @property
+    def data(self):
+        """
+        Returns a view of the stored rows in chronological order. No data is copied.
+        Note: the view may become detached from the buffer once the buffer grows,
+        so it should not be held onto across appends.
+        """
+        return self._array[self._start: self._start + self._size]
+
+    def append(self, rows):
+        """
+        Appends rows to the end of the buffer.
+        Arguments:
+            rows    (array-like): a 2D array of shape (num_rows, columns).
+        """
+        rows = np.asarray(rows, dtype=float)
+        if rows.size == 0:
+            return
+        rows = rows.reshape(-1, self.columns)
+        num_rows = rows.shape[0]
+        # reallocate if we have run out of space at the end of the array
+        if self._start + self._size + num_rows > self.capacity:
+            # only double the capacity if the array is actually full,
+            # otherwise just compact the stored rows to the front
+            if self._start == 0:
+                self._reallocate(max(self._size + num_rows, 2 * self.capacity))
+            else:
+                self._reallocate(max(self._size + num_rows, 2 * self._size))
+        end = self._start + self._size
+        self._array[end: end + num_rows] = rows
+        self._size += num_rows
+        self._appended += num_rows
+
+    def discard(self, num_rows):
+        """
+        Discards rows from the front of the buffer.
+        The storage is reclaimed the next time the buffer is reallocated.
+        Arguments:
+            num_rows    (int): the number of rows to discard.
+        """
+        num_rows = min(max(int(num_rows), 0), self._size)
+        self._start += num_rows
+        self._size -= num_rows
+
+    def reserve(self, capacity):
+        """
+        Ensures the buffer can hold at least the given number of rows without growing.
+        Arguments:
+            capacity    (int): the minimum number of rows to hold.
+        """
+        if capacity <= self.capacity - self._start:
+            return
+        self._reallocate(capacity)
+
+    def clear(self):
+        """
+        Removes all rows and releases the underlying storage.
+        """
+        self._array = np.zeros((0, self.columns))
+        self._start = 0
+        self._size = 0
+
+    def _reallocate(self, capacity):
+        """
+        Moves the stored rows to the front of a new array of the given capacity.
+        """
+        array_tmp = np.empty((int(capacity), self.columns))
+        array_tmp[:self._size] = self.data
+        self._array = array_tmp
+        self._start = 0
+
+
+class RingBuffer(DataBuffer):
+    """
+    A fixed-size circular column store which only keeps the most recent rows.
+    Each row is written twice, once into each half of a mirrored array,
+    so the stored rows can always be exposed in chronological order as a single
+    contiguous (zero-copy) view, even after the buffer has wrapped around.
+    """
+
+    def __init__(self, columns, max_rows):
+        """
+        Arguments:
+            columns     (int): the number of columns (i.e. independent + dependent variables).
+            max_rows    (int): the maximum number of rows to keep.
+        """
+        super(RingBuffer, self).__init__(columns)
+        self.max_rows = max(int(max_rows), 1)
+        self._array = np.zeros((2 * self.max_rows, columns))
+        # position of the next row to be written, in [0, max_rows)
+        self._head = 0
+
+    @property
+    def capacity(self):
+        return self.max_rows
+
+    @property
+    def data(self):
+        end = self._head + self.max_rows
+        return self._array[end - self._size: end]
+
+    def append(self, rows):
+        rows = np.asarray(rows, dtype=float)
+        if rows.size == 0:
+            return
+        rows = rows.reshape(-1, self.columns)
+        num_rows = rows.shape[0]
+        self._appended += num_rows
+        # only the most recent rows can be kept
+        if num_rows > self.max_rows:
+            rows = rows[-self.max_rows:]
+            num_rows = self.max_rows
+        # write rows into both halves, wrapping around to the start if needed
+        first = min(num_rows, self.max_rows - self._head)
+        self._write(self._head, rows[:first])
+        self._write(0, rows[first:])
+        self._head = (self._head + num_rows) % self.max_rows
+        self._size = min(self._size + num_rows, self.max_rows)
+
+    def discard(self, num_rows):
+        num_rows = min(max(int(num_rows), 0), self._size)
+        self._size -= num_rows
+
+    def reserve(self, capacity):
+        # a ring buffer has a fixed size
+        pass
+
+    def clear(self):
+        self._array = np.zeros((2 * self.max_rows, self.columns))
+        self._head = 0
+        self._size = 0
+
+    def _write(self, position, rows):
+        """
+        Writes rows into both halves of the mirrored array.
+        """
+        num_rows = rows.shape[0]
+        self._array[position: position + num_rows] = rows
+        self._array[position + self.max_rows: position + self.max_rows + num_rows] = rows
@@ -1,6 +1,8 @@
 import numpy as np
 from twisted.internet.defer import inlineCallbacks, returnValue, DeferredLock
 
+from .DataBuffer import DataBuffer, RingBuffer
+
 
 class Dataset(object):
     """
@@ -16,9 +18,28 @@ class Dataset(object):
         # dataset storage variables
         self.dataset_location = dataset_location
         self.data_vault = data_vault
-        self.data = None
-        self.points_per_grab = 1000
-        self.last_index = 0
+        self.buffer = None
+        # grab size grows with the backlog of data waiting on the data vault
+        self.min_points_per_grab = 1000
+        self.max_points_per_grab = 100000
+        self.points_per_grab = self.min_points_per_grab
+        # only one fetch may be outstanding at a time; signals received
+        # during a fetch re-arm it instead of queueing another fetch
+        self.fetching = False
+        self.refetch = False
+        # fetch statistics
+        self.signals_received = 0
+        self.fetches_issued = 0
+        self.rows_fetched = 0
+        self.rows_last_fetch = 0
+        # retention policy (None means data is kept forever)
+        self.max_rows = None
+        self.max_span = None
+        # retention policies requested by each consumer (e.g. graph)
+        self.retention = {}
+        # registry which shares this dataset between graphs (if any)
+        self.registry = None
+        self.closed = False
         self.updateCounter = 0
         # startup sequence
         self.connectDataVault()
@@ -46,7 +67,7 @@ class Dataset(object):
         except Exception as e:
             _, all_dep = yield self.data_vault.variables(context=self.context)
             dataset_shape = (0, 1 + len(all_dep))
-        self.data = np.zeros(dataset_shape)
+        self.buffer = self._makeBuffer(dataset_shape[1], dataset_shape[0])
         self.accessingData.release()
 
     @inlineCallbacks
@@ -59,7 +80,132 @@ class Dataset(object):
         yield self.data_vault.removeListener(listener=self.updateData, source=None, ID=11111, context=self.context)
 
 
+    # LIFETIME
+    def release(self):
+        """
+        Releases the dataset once a consumer (e.g. graph) no longer needs it.
+        Datasets shared via a DatasetRegistry are only closed once every consumer has released them.
+        """
+        if self.registry is not None:
+            self.registry.release(self)
+        else:
+            self.close()
+
+    @inlineCallbacks
+    def close(self):
+        """
+        Stops listening for new data and releases the memory held by the dataset.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        # wait for any outstanding fetch to finish
+        yield self.accessingData.acquire()
+        try:
+            yield self.disconnectDataSignal()
+        except Exception as e:
+            print('Error in dataset.close: unable to remove listener.')
+            print('\terror:', e)
+        finally:
+            self.buffer = None
+            self.accessingData.release()
+
+
+    # RETENTION
+    def setRetention(self, max_rows=None, max_span=None, consumer=None):
+        """
+        Sets the retention policy for the dataset, i.e. how much data is kept in memory.
+        If max_rows is set, the dataset is stored in a fixed-size circular buffer.
+        If the dataset is shared, each consumer sets its own policy, and the dataset
+        keeps enough data to satisfy the most demanding one.
+        Arguments:
+            max_rows    (int)   : the maximum number of rows to keep. None keeps all rows.
+            max_span    (float) : the maximum span of the independent variable to keep
+                                    (e.g. a time window). None keeps all rows.
+            consumer    (object): the consumer (e.g. graph) requesting the policy.
+        """
+        self.retention[consumer] = (max_rows, max_span)
+        self._updateRetention()
+
+    def removeRetention(self, consumer=None):
+        """
+        Removes the retention policy requested by a consumer.
+        Arguments:
+            consumer    (object): the consumer (e.g. graph) which requested the policy.
+        """
+        self.retention.pop(consumer, None)
+        self._updateRetention()
+
+    def _updateRetention(self):
+        """
+        Combines the retention policies of all consumers, and re-buffers the data if the policy changed.
+        """
+        max_rows, max_span = None, None
+        if len(self.retention) > 0:
+            rows_list, span_list = zip(*self.retention.values())
+            if None not in rows_list:
+                max_rows = max(rows_list)
+            if None not in span_list:
+                max_span = max(span_list)
+        if (max_rows == self.max_rows) and (max_span == self.max_span):
+            return
+        self.max_rows = max_rows
+        self.max_span = max_span
+        # move existing data into a buffer with the new policy
+        if self.buffer is not None:
+            buffer_old = self.buffer
+            self.buffer = self._makeBuffer(buffer_old.columns, buffer_old.size)
+            self.buffer.append(buffer_old.data)
+            self._applyRetention()
+
+    def _makeBuffer(self, columns, capacity):
+        """
+        Creates the buffer which holds the data according to the retention policy.
+        """
+        if self.max_rows is not None:
+            return RingBuffer(columns, self.max_rows)
+        return DataBuffer(columns, capacity=capacity)
+
+    def _applyRetention(self):
+        """
+        Discards rows which are older than the retention time span.
+        Assumes the independent variable is monotonically increasing (e.g. time).
+        """
+        if (self.max_span is None) or (self.buffer.size == 0):
+            return
+        x = self.buffer.data[:, 0]
+        self.buffer.discard(np.searchsorted(x, x[-1] - self.max_span, side='left'))
+
+
     # GETTERS
+    @property
+    def data(self):
+        """
+        Returns a zero-copy view of all the retained data, in chronological order.
+        """
+        if self.buffer is None:
+            return None
+        return self.buffer.data
+
+    @property
+    def offset(self):
+        """
+        The number of rows which have been discarded by the retention policy,
+        i.e. the absolute index of the first retained row.
+        """
+        if self.buffer is None:
+            return 0
+        return self.buffer.offset
+
+    @property
+    def last_index(self):
+        """
+        The number of rows currently retained.
+        """
+        if self.buffer is None:
+            return 0
+        return self.buffer.size
+
     @inlineCallbacks
     def getParameters(self):
         parameters = yield self.data_vault.parameters(context=self.context)
@@ -90,27 +236,78 @@ class Dataset(object):
         self.accessingData.release()
         returnValue(labels)
 
+    def getFetchStatistics(self):
+        """
+        Returns statistics on how data has been fetched from the data vault.
+        Returns:
+            dict:   the number of data_available signals received, fetches issued,
+                    and rows received (in total, per fetch, and in the last fetch).
+        """
+        rows_per_fetch = 0
+        if self.fetches_issued > 0:
+            rows_per_fetch = self.rows_fetched / self.fetches_issued
+        return {
+            'signals_received': self.signals_received,
+            'fetches_issued': self.fetches_issued,
+            'rows_fetched': self.rows_fetched,
+            'rows_per_fetch': rows_per_fetch,
+            'rows_last_fetch': self.rows_last_fetch,
+            'points_per_grab': self.points_per_grab
+        }
+
     def updateData(self, c, msg):
-        self.updateCounter += 1
-        self.getData()
+        """
+        Called when the data vault signals that new data is available.
+        Signals are coalesced so that at most one fetch is outstanding.
+        """
+        self.signals_received += 1
+        if self.fetching:
+            self.refetch = True
+        else:
+            self.getData()
 
     @inlineCallbacks
     def getData(self):
         """
-        Gets data in bunches at a time and adds them to self.data, which holds the dataset.
+        Gets data in bunches at a time and adds them to self.buffer, which holds the dataset.
+        Keeps fetching while there is a backlog of data (i.e. a full grab was received)
+        or while new signals arrived during the last fetch.
+        The grab size doubles while there is a backlog and halves once it is cleared.
         """
-        # acquire communication
-        yield self.accessingData.acquire()
-        # get data from the datavault
-        data_tmp = yield self.data_vault.get(self.points_per_grab, context=self.context)
-        data_tmp = np.array(data_tmp)
-        next_index = self.last_index + np.shape(data_tmp)[0]
-        # add to array if we have the space
-        if next_index <= np.shape(self.data)[0]:
-            self.data[self.last_index: next_index] = data_tmp
-        # otherwise append to array
-        else:
-            self.data = np.append(self.data, data_tmp, axis=0)
-        self.last_index = next_index
-        # release communication
-        self.accessingData.release()
+        if self.closed:
+            return
+        self.fetching = True
+        try:
+            while True:
+                self.refetch = False
+                # acquire communication
+                yield self.accessingData.acquire()
+                if self.closed:
+                    self.accessingData.release()
+                    break
+                try:
+                    # get data from the datavault
+                    data_tmp = yield self.data_vault.get(self.points_per_grab, context=self.context)
+                    data_tmp = np.array(data_tmp)
+                    # append to buffer (grows geometrically if we run out of space)
+                    self.buffer.append(data_tmp)
+                    self._applyRetention()
+                finally:
+                    # release communication
+                    self.accessingData.release()
+                # update statistics
+                rows = np.shape(data_tmp)[0] if data_tmp.size else 0
+                self.fetches_issued += 1
+                self.rows_fetched += rows
+                self.rows_last_fetch = rows
+                if rows > 0:
+                    self.updateCounter += 1
+                # adapt grab size to the backlog
+                if rows >= self.points_per_grab:
+                    self.points_per_grab = min(2 * self.points_per_grab, self.max_points_per_grab)
+                    continue
+                self.points_per_grab = max(self.points_per_grab // 2, self.min_points_per_grab)
+                if not self.refetch:
+                    break
+        finally:
+            self.fetching = False
@@ -0,0 +1,71 @@
+from .Dataset import Dataset
+
+
+class DatasetRegistry(object):
+    """
+    Shares Dataset objects between graphs.
+    Each dataset in the data vault is opened at most once, so that every graph
+    plotting it shares a single fetch stream and a single buffer.
+    Datasets are reference counted, and are closed once they have been released
+    by every graph that acquired them.
+    """
+
+    def __init__(self, cxn, data_vault, reactor):
+        """
+        Arguments:
+            cxn         : the labrad connection used to create contexts for each dataset.
+            data_vault  : the data vault server.
+            reactor     : the reactor.
+        """
+        self.cxn = cxn
+        self.data_vault = data_vault
+        self.reactor = reactor
+        # holds datasets and their reference counts
+        self.datasets = {}
+        self.refcounts = {}
+
+    def acquire(self, dataset_location):
+        """
+        Returns the Dataset for a dataset location, creating it if it isn't already open.
+        Each call must be balanced by a call to release.
+        Arguments:
+            dataset_location    ([str], str): the directory and name of the dataset in the data vault.
+        Returns:
+            Dataset: the shared dataset.
+        """
+        key = self.makeKey(dataset_location)
+        if key not in self.datasets:
+            cxt = self.cxn.context()
+            dataset = Dataset(self.data_vault, cxt, dataset_location, self.reactor)
+            dataset.registry = self
+            self.datasets[key] = dataset
+            self.refcounts[key] = 0
+        self.refcounts[key] += 1
+        return self.datasets[key]
+
+    def release(self, dataset):
+        """
+        Releases a dataset acquired with acquire.
+        The dataset is closed once it is no longer used.
+        Arguments:
+            dataset (Dataset): the dataset to release.
+        """
+        key = self.makeKey(dataset.dataset_location)
+        if self.datasets.get(key) is not dataset:
+            print('Error in datasetregistry.release: dataset not in registry.')
+            print('\tdataset_location:', dataset.dataset_location)
+            return
+        self.refcounts[key] -= 1
+        if self.refcounts[key] <= 0:
+            del self.datasets[key]
+            del self.refcounts[key]
+            dataset.close()
+
+    def makeKey(self, dataset_location):
+        """
+        Creates a key unique to each dataset.
+        Arguments:
+            dataset_location    ([str], str): the directory and name of the dataset in the data vault.
+        """
+        directory, dataset_name = dataset_location
+        return (tuple(directory), dataset_name)
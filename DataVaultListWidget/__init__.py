@@ -1,4 +1,6 @@
-__all__ = ["DataVaultList", "Dataset"]
+__all__ = ["DataVaultList", "Dataset", "DataBuffer", "DatasetRegistry"]
 
 from .Dataset import Dataset
+from .DataBuffer import DataBuffer
+from .DatasetRegistry import DatasetRegistry
 from .DataVaultListWidget import DataVaultList
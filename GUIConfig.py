@@ -15,6 +15,12 @@ pg.setConfigOption('antialias', False)
 #     pg.setConfigOption('useOpenGL', True)
 #     pg.setConfigOption('enableExperimental', True)
 
+# time between frames of the graph update loop (in seconds)
+frame_interval = 0.25
+# maximum time spent updating graphs in each frame (in seconds);
+# graphs which don't fit in a frame are updated in the next one
+frame_budget = 0.05
+
 
 """
 Configuration classes for the different graph widget types.
@@ -33,12 +39,22 @@ class graphConfig(object):
     """
     Config for an individual graph within a GridGraphWindow (i.e. a grapher unit).
     Sets graphing-related settings such as axes limits and horizontal/vertical lines.
+    Also sets the retention policy for datasets plotted on the graph:
+        max_rows: the maximum number of rows kept for each dataset (stored as a circular buffer).
+        max_span: the maximum span of the x-axis kept for each dataset (e.g. a time window).
+    A retention value of None keeps all data.
+    Histogram graphs keep at most max_datasets datasets, evicting the least recently used ones
+    (None keeps all datasets).
+    Histogram bins are set by bin_width and bin_range (see HistogramAccumulator):
+        bin_width: the width of each bin. If None, the width is taken from the spacing of the data.
+        bin_range: fixes the bins to cover (xmin, xmax). If None, the bins adapt to the data.
     """
 
     def __init__(self, name, ylim=[0, 1],
                  isImages=False, isHist=False,
                  show_points=True, grid_on=False, scatter_plot='all',
-                 line_param=None, vline=None, vline_param=None, hline=None, hline_param=None):
+                 line_param=None, vline=None, vline_param=None, hline=None, hline_param=None,
+                 max_rows=None, max_span=None, max_datasets=20, bin_width=None, bin_range=None):
         self.name = name
         self.ylim = ylim
         self.graphs = 1
@@ -52,6 +68,11 @@ class graphConfig(object):
         self.vline_param = vline_param
         self.hline = hline
         self.hline_param = hline_param
+        self.max_rows = max_rows
+        self.max_span = max_span
+        self.max_datasets = max_datasets
+        self.bin_width = bin_width
+        self.bin_range = bin_range
 
 
 class gridGraphConfig():
@@ -81,17 +102,17 @@ If a gridGraphConfig object holds multiple graphConfig objects, their positions
 tabs = [
     # system monitor tab displays system essentials
     gridGraphConfig('System Monitor', [
-        graphConfig('Lakeshore 336 Temperature'),               0, 0,
-        graphConfig('TwisTorr74 Pressure'),                     1, 0,
-        graphConfig('NIOPS03 Pressure'),                        0, 1,
-        graphConfig('RF Pickoff'),                              1, 1
+        graphConfig('Lakeshore 336 Temperature', max_rows=100000),  0, 0,
+        graphConfig('TwisTorr74 Pressure', max_rows=100000),        1, 0,
+        graphConfig('NIOPS03 Pressure', max_rows=100000),           0, 1,
+        graphConfig('RF Pickoff', max_rows=100000),                 1, 1
     ]),
     # laser monitor tab monitors laser frequencies via wavemeter
     gridGraphConfig('Laser Monitor', [
-        graphConfig('397nm'),                                   0, 0,
-        graphConfig('423nm'),                                   1, 0,
-        graphConfig('854nm'),                                   0, 1,
-        graphConfig('866nm'),                                   1, 1,
+        graphConfig('397nm', max_rows=100000),                      0, 0,
+        graphConfig('423nm', max_rows=100000),                      1, 0,
+        graphConfig('854nm', max_rows=100000),                      0, 1,
+        graphConfig('866nm', max_rows=100000),                      1, 1,
     ]),
     gridGraphConfig('RGA', [
         graphConfig('RGA Sweeps'),                           0, 0
@@ -2,7 +2,9 @@
 The main GUI which holds everything and puts everything together.
 """
 import GUIConfig
+from time import perf_counter
 from PyQt5.QtWidgets import QWidget, QGridLayout
+from twisted.internet.task import LoopingCall
 
 from RealSimpleGrapher.pyqtgraph_widgets import *
 from EGGS_labrad.clients.Widgets import QDetachableTabWidget
@@ -23,11 +25,96 @@ class GridGraphWindow(QWidget):
         self.initUI(g_list, row_list, column_list)
 
     def initUI(self, g_list, row_list, column_list):
+        # store the graphs so they can be updated when the tab is shown
+        self.g_list = g_list
         layout = QGridLayout(self)
         for k in range(len(g_list)):
             layout.addWidget(g_list[k], row_list[k], column_list[k])
 
 
+class FrameScheduler(object):
+    """
+    Drives the update loops of all graphs from a single LoopingCall.
+    Only visible graphs are updated, so graphs on hidden tabs cost nothing.
+    Each frame updates graphs in round-robin order until the frame budget is used up,
+    and the next frame continues from where the last one stopped.
+    Hidden graphs catch up on their datasets when they are next updated.
+    """
+
+    def __init__(self, interval, budget):
+        """
+        Arguments:
+            interval    (float): the time between frames, in seconds.
+            budget      (float): the maximum time to spend updating graphs in each frame, in seconds.
+        """
+        self.interval = interval
+        self.budget = budget
+        # holds (widget, update function) pairs
+        self.widgets = []
+        self.position = 0
+        self.loop = LoopingCall(self.frame)
+
+    def start(self):
+        self.loop.start(self.interval)
+
+    def stop(self):
+        if self.loop.running:
+            self.loop.stop()
+
+    def add(self, widget, update):
+        """
+        Adds a widget to the scheduler.
+        Arguments:
+            widget  (QWidget) : the widget to update.
+            update  (callable): the function which updates the widget.
+        """
+        self.widgets.append((widget, update))
+
+    def remove(self, widget):
+        """
+        Removes a widget from the scheduler.
+        Arguments:
+            widget  (QWidget): the widget to remove.
+        """
+        self.widgets = [(widget_tmp, update) for widget_tmp, update in self.widgets if widget_tmp is not widget]
+        self.position = 0
+
+    def frame(self):
+        """
+        Updates visible widgets in round-robin order until the frame budget is used up.
+        At least one visible widget is updated each frame.
+        """
+        num_widgets = len(self.widgets)
+        start_time = perf_counter()
+        for i in range(num_widgets):
+            position = (self.position + i) % num_widgets
+            widget, update = self.widgets[position]
+            if not widget.isVisible():
+                continue
+            self._update(update)
+            # continue from the next widget in the next frame
+            if perf_counter() - start_time > self.budget:
+                self.position = (position + 1) % num_widgets
+                return
+        self.position = 0
+
+    def refresh(self, widgets):
+        """
+        Immediately updates the given widgets (e.g. when their tab is shown).
+        Arguments:
+            widgets ([QWidget]): the widgets to update.
+        """
+        for widget, update in self.widgets:
+            if widget in widgets:
+                self._update(update)
+
+    def _update(self, update):
+        try:
+            update()
+        except Exception as e:
+            print('Error in framescheduler.frame:', e)
+
+
 class GraphWindow(QDetachableTabWidget):
     """
     The main RSG GUI which does nearly everything.
@@ -46,10 +133,15 @@ class GraphWindow(QDetachableTabWidget):
         self.parent = parent
         self.reactor = reactor
         self.root = root
+        # a single frame scheduler updates all visible graphs
+        self.scheduler = FrameScheduler(GUIConfig.frame_interval, GUIConfig.frame_budget)
         # initialize the UI
         self.initUI()
         # set background
         self.setStyleSheet("background-color:black")
+        # update graphs as soon as their tab is shown, instead of waiting for their turn
+        self.currentChanged.connect(self.tabChanged)
+        self.scheduler.start()
 
     def initUI(self):
         reactor = self.reactor
@@ -70,12 +162,14 @@ class GraphWindow(QDetachableTabWidget):
                     gli.append(graph_tmp)
                     continue
                 elif config.isHist:
-                    graph_tmp = Hist_PyQtGraph(reactor, config, cxn=self.cxn, root=self.root)
+                    graph_tmp = Hist_PyQtGraph(reactor, config, cxn=self.cxn, root=self.root, live_update=False)
+                    self.scheduler.add(graph_tmp, graph_tmp.update_figure)
                     self.graphDict[name] = graph_tmp
                     gli.append(graph_tmp)
                     continue
                 else:
-                    graph_tmp = Graph_PyQtGraph(reactor, config, cxn=self.cxn, root=self.root)
+                    graph_tmp = Graph_PyQtGraph(reactor, config, cxn=self.cxn, root=self.root, live_update=False)
+                    self.scheduler.add(graph_tmp, graph_tmp._update_figure)
                 graph_tmp.set_ylimits(config.ylim)
                 self.graphDict[name] = graph_tmp
                 gli.append(graph_tmp)
@@ -85,6 +179,37 @@ class GraphWindow(QDetachableTabWidget):
             self.setMovable(True)
 
     def insert_tab(self, tab):
-        graph_tmp = Graph_PyQtGraph(tab, self.reactor, cxn=self.cxn, root=self.root)
+        graph_tmp = Graph_PyQtGraph(self.reactor, GUIConfig.graphConfig(tab), cxn=self.cxn, root=self.root, live_update=False)
+        self.scheduler.add(graph_tmp, graph_tmp._update_figure)
         self.graphDict[tab] = graph_tmp
         self.addTab(graph_tmp, tab)
+
+    def remove_tab(self, tab):
+        """
+        Removes a tab and stops updating its graphs.
+        Arguments:
+            tab (str): the name of the tab.
+        """
+        index = next((i for i in range(self.count()) if self.tabText(i) == tab), None)
+        if index is None:
+            print("Error in graphwindow.remove_tab: tab doesn't exist:", tab)
+            return
+        widget = self.widget(index)
+        for graph in getattr(widget, 'g_list', [widget]):
+            self.scheduler.remove(graph)
+            for name in [name for name, graph_tmp in self.graphDict.items() if graph_tmp is graph]:
+                del self.graphDict[name]
+        self.tabDict = {name: widget_tmp for name, widget_tmp in self.tabDict.items() if widget_tmp is not widget}
+        self.removeTab(index)
+        widget.deleteLater()
+
+    def tabChanged(self, index):
+        """
+        Brings the graphs on a newly shown tab up to date.
+        Arguments:
+            index   (int): the index of the tab.
+        """
+        widget = self.widget(index)
+        if widget is None:
+            return
+        self.scheduler.refresh(getattr(widget, 'g_list', [widget]))
@@ -1,8 +1,13 @@
-from RealSimpleGrapher.analysis import FitWrapper
+from numpy import array, zeros, nanmin, nanmax, inf, isfinite
+from twisted.internet.task import LoopingCall
+from twisted.internet.threads import deferToThread
+from twisted.internet.defer import inlineCallbacks
+
+from RealSimpleGrapher.analysis import FitWrapper, FitCancelled
 
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QComboBox,\
-    QTableWidget, QTableWidgetItem, QPushButton, QDoubleSpinBox, QLabel
+    QTableWidget, QTableWidgetItem, QPushButton, QDoubleSpinBox, QSpinBox, QLabel, QCheckBox
 
 
 class RowInfo(object):
@@ -10,10 +15,28 @@ class RowInfo(object):
     Container for the widgets with each row in the parameters table.
     """
 
-    def __init__(self, vary, manual_value, fitted_value):
+    def __init__(self, vary, manual_value, fitted_value, error=None, lower=None, upper=None):
         self.vary_select = vary
         self.manual_value = manual_value
         self.fitted_value = fitted_value
+        self.error = error
+        self.lower = lower
+        self.upper = upper
+
+
+class FitCurve(object):
+    """
+    Holds a fit curve in the same format as a Dataset, so it can be plotted by a graph.
+    The data is replaced in place, and the graph redraws the artist once updateCounter advances.
+    """
+
+    def __init__(self):
+        self.data = zeros((0, 2))
+        self.updateCounter = 0
+
+    def setData(self, data):
+        self.data = data
+        self.updateCounter += 1
 
 
 class FitWindow(QWidget):
@@ -21,18 +44,34 @@ class FitWindow(QWidget):
     A window for selecting fitting parameters.
     """
 
-    def __init__(self, dataset, index, parent):
+    def __init__(self, dataset, index, parent, artist_ident=None):
+        """
+        Arguments:
+            artist_ident    (dataset_location, dataset_name, trace_name): the identifier of the fitted trace.
+                            The fit curve is added as a trace of the same dataset.
+        """
         super(FitWindow, self).__init__()
         self.dataset = dataset
         self.index = index
         self.parent = parent
         self.fw = FitWrapper(dataset, index)
         self.row_info_dict = {}
-        self.ident = (None, 'Fit: ' + str(self.dataset.dataset_name))
+        self.fitting = False
+        # holds the fit curve, which is updated in place
+        self.curve = FitCurve()
+        # which parameters the curve shows (i.e. 'fit' or 'manual')
+        self.curve_params = None
+        if artist_ident is not None:
+            self.ident = (artist_ident[0], artist_ident[1], 'Fit: ' + str(artist_ident[2]))
+        else:
+            self.ident = (None, None, 'Fit: ' + str(self.dataset.dataset_name))
+        # live fitting
+        self.live_fit_loop = LoopingCall(self.liveFit)
+        self.last_fit_counter = None
         self.initUI()
 
     def initUI(self):
-        trace_name = self.ident[1]
+        trace_name = self.ident[2]
         self.setWindowTitle(trace_name)
         mainLayout = QVBoxLayout(self)
         buttons = QHBoxLayout()
@@ -41,26 +80,61 @@ class FitWindow(QWidget):
         for model in self.fw.models:
             self.model_select.addItem(model)
         self.parameterTable = QTableWidget()
-        self.parameterTable.setColumnCount(4)
+        self.parameterTable.setColumnCount(7)
+        self.statsLabel = QLabel(self)
+        self.statsLabel.setWordWrap(True)
+        self.errorSelect = QComboBox(self)
+        for method in self.fw.error_methods:
+            self.errorSelect.addItem(method)
+        self.startsSelect = QSpinBox(self)
+        self.startsSelect.setRange(1, 1000)
+        self.startsSelect.setPrefix('Starts: ')
+        self.startsSelect.setToolTip('Number of starting points of the fit (multi-start), for models with many local minima.')
+        self.errorSelect.setToolTip('How the errors are estimated: from the jacobian,\n'
+                                    'by bootstrapping if the jacobian is unreliable, or always by bootstrapping.')
         self.fitButton = QPushButton('Fit', self)
+        self.cancelButton = QPushButton('Cancel', self)
+        self.cancelButton.setEnabled(False)
         self.plotButton = QPushButton('Plot manual', self)
+        self.liveFitCheck = QCheckBox('Live fit', self)
+        self.liveFitInterval = QDoubleSpinBox(self)
+        self.liveFitInterval.setDecimals(1)
+        self.liveFitInterval.setRange(0.1, 3600)
+        self.liveFitInterval.setValue(1.0)
+        self.liveFitInterval.setSuffix(' s')
         self.fw.setModel(str(self.model_select.currentText()))
         # lay out
         mainLayout.addWidget(self.model_select)
         mainLayout.addWidget(self.parameterTable)
+        mainLayout.addWidget(self.statsLabel)
         mainLayout.addLayout(buttons)
         buttons.addWidget(self.fitButton)
+        buttons.addWidget(self.cancelButton)
         buttons.addWidget(self.plotButton)
+        buttons.addWidget(self.startsSelect)
+        buttons.addWidget(self.errorSelect)
+        buttons.addWidget(self.liveFitCheck)
+        buttons.addWidget(self.liveFitInterval)
         # connect signals to slots
         self.model_select.activated.connect(self.onActivated)
         self.fitButton.clicked.connect(self.onClick)
+        self.cancelButton.clicked.connect(self.onCancel)
+        self.errorSelect.activated.connect(self.onErrorMethodChanged)
+        self.startsSelect.valueChanged.connect(self.onStartsChanged)
+        self.liveFitCheck.stateChanged.connect(self.onLiveFitToggled)
+        self.liveFitInterval.valueChanged.connect(self.onLiveFitIntervalChanged)
         self.plotButton.clicked.connect(self.onPlot)
         self.setupParameterTable()
+        # redraw the curve for the visible range when the view changes
+        try:
+            self.parent.parent.pw.sigRangeChanged.connect(self.onRangeChanged)
+        except AttributeError:
+            pass
         self.show()
 
     def setupParameterTable(self):
         self.parameterTable.clear()
-        headerLabels = ['Vary', 'Param', 'Manual', 'Fitted']
+        headerLabels = ['Vary', 'Param', 'Manual', 'Lower', 'Upper', 'Fitted', 'Error']
         self.parameterTable.setHorizontalHeaderLabels(headerLabels)
         self.parameterTable.horizontalHeader().setStretchLastSection(True)
 
@@ -71,8 +145,16 @@ class FitWindow(QWidget):
             label = QLabel(p)
             manual_value = QDoubleSpinBox()
             fitted_value = QTableWidgetItem()
+            error = QTableWidgetItem()
+            # bounds are typed in, and left empty for no bound
+            lower, upper = self.fw.getBounds(p)
+            lower_bound = QTableWidgetItem(self.formatBound(lower))
+            upper_bound = QTableWidgetItem(self.formatBound(upper))
+            lower_bound.setToolTip('Lower bound of the fitted value (empty for none).\n'
+                                   'Multi-start samples starting points within the bounds.')
+            upper_bound.setToolTip(lower_bound.toolTip().replace('Lower', 'Upper'))
 
-            self.row_info_dict[p] = RowInfo(vary_select, manual_value, fitted_value)
+            self.row_info_dict[p] = RowInfo(vary_select, manual_value, fitted_value, error, lower_bound, upper_bound)
 
             vary_select.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
             if self.fw.getVary(p):
@@ -84,15 +166,22 @@ class FitWindow(QWidget):
             manual_value.setDecimals(6)
             manual_value.setRange(-1000000000, 1000000000)
             manual_value.setValue(manualValue)
+            manual_value.valueChanged.connect(self.onManualValueChanged)
 
             fittedValue = self.fw.getFittedValue(p)
             # fitted_value.setDecimals(6)
             # fitted_value.setRange(-1000000000, 1000000000)
             fitted_value.setText(str(fittedValue))
+            error.setFlags(Qt.ItemIsEnabled)
+            error.setText(self.formatError(self.fw.getFittedError(p)))
             self.parameterTable.setItem(i, 0, vary_select)
             self.parameterTable.setCellWidget(i, 1, label)
             self.parameterTable.setCellWidget(i, 2, manual_value)
-            self.parameterTable.setItem(i, 3, fitted_value)
+            self.parameterTable.setItem(i, 3, lower_bound)
+            self.parameterTable.setItem(i, 4, upper_bound)
+            self.parameterTable.setItem(i, 5, fitted_value)
+            self.parameterTable.setItem(i, 6, error)
+        self.updateStats()
 
     def updateParametersToFitter(self):
         params = self.fw.getParameters()
@@ -105,6 +194,34 @@ class FitWindow(QWidget):
             else:
                 self.fw.setVary(p, False)
             self.fw.setManualValue(p, manual_value)
+            lower = self.parseBound(p, row.lower, -inf)
+            upper = self.parseBound(p, row.upper, inf)
+            if lower < upper:
+                self.fw.setBounds(p, lower, upper)
+            else:
+                print('Error in fitwindow.updateParametersToFitter: lower bound of {} must be less than its upper bound.'.format(p))
+                self.fw.setBounds(p)
+
+    def parseBound(self, p, item, default):
+        """
+        Read a bound from the parameter table. Empty bounds are unbounded.
+        """
+        text = item.text().strip()
+        if text == '':
+            return default
+        try:
+            return float(text)
+        except ValueError:
+            print('Error in fitwindow.parseBound: invalid bound for {}: {}'.format(p, text))
+            return default
+
+    def formatBound(self, bound):
+        """
+        Format a bound for the parameter table. Infinite bounds are left empty.
+        """
+        if not isfinite(bound):
+            return ''
+        return '{:.6g}'.format(bound)
 
     def updateParametersFromFitter(self):
         """
@@ -115,27 +232,99 @@ class FitWindow(QWidget):
             row = self.row_info_dict[p]
             fitted_value = self.fw.getFittedValue(p)
             row.fitted_value.setText(str(fitted_value))
+            row.error.setText(self.formatError(self.fw.getFittedError(p)))
             row.manual_value.setValue(fitted_value)
+        self.updateStats()
+
+    def updateStats(self):
+        """
+        Show the goodness of fit and residual statistics of the last fit.
+        """
+        if self.fw.result is None:
+            self.statsLabel.setText('')
+        else:
+            self.statsLabel.setText(self.fw.result.summary())
+
+    def formatError(self, error):
+        """
+        Format the standard error of a fitted value for the parameter table.
+        """
+        if error is None:
+            return ''
+        return '{:.6g}'.format(error)
 
     def plotFit(self):
         """
         Plot the fitted parameters.
-        We need to wrap the data in a dataset object to use
-        add_artist in GraphWidget.
         """
-        class dataset:
-            def __init__(self, data):
-                self.data = data
-                self.updateCounter = 1
+        if self.dataset.data is None:
+            print('Error in fitwindow.plotFit: dataset has been closed.')
+            return
+        self.curve_params = 'fit'
+        self.plotCurve(self.fw.evaluateFittedParameters(*self.getView()))
 
-        data = self.fw.evaluateFittedParameters()
-        ds = dataset(data)
+    def getView(self):
+        """
+        Get the visible x-range of the graph and its width in pixels,
+        so the curve is only evaluated where it can be seen, at screen resolution.
+        The range is limited to the range of the data, otherwise the curve
+        would keep growing the view when the graph is autoranging.
+        Returns:
+            (xlim, num_points): arguments for FitWrapper.evaluateParameters,
+                                which are None if the curve should be evaluated over the whole dataset.
+        """
         try:
-            # remove the previous fit
-            self.parent.parent.remove_artist(self.ident)
-            self.parent.parent.add_artist(self.ident, ds, 0, no_points=True)
-        except Exception as e:
-            self.parent.parent.add_artist(self.ident, ds, 0, no_points=True)
+            graph = self.parent.parent
+        except AttributeError:
+            return None, None
+        try:
+            # the view range is in log space for log plots, which a linear grid can't sample well
+            if graph.artists[self.ident].logModeX:
+                return None, None
+        except (AttributeError, KeyError):
+            pass
+        try:
+            xlim = graph.pw.viewRange()[0]
+            width = int(graph.pw.plotItem.vb.width())
+        except AttributeError:
+            return None, None
+        # the dataset holds no data once it's closed
+        if self.dataset.data is None:
+            return None, None
+        x = self.dataset.data[:, 0]
+        if (width <= 0) or (len(x) == 0):
+            return None, None
+        xlim = (max(xlim[0], nanmin(x)), min(xlim[1], nanmax(x)))
+        if xlim[0] >= xlim[1]:
+            return None, None
+        # use two points per pixel
+        return xlim, 2 * width
+
+    def plotCurve(self, data):
+        """
+        Plot a curve onto the graph.
+        The data is wrapped in a FitCurve object to use add_artist in GraphWidget.
+        The artist is only added once, and is updated in place afterwards.
+        """
+        graph = self.parent.parent
+        # nothing to redraw if the evaluation was memoized
+        if (data is self.curve.data) and (self.ident in graph.artists):
+            return
+        self.curve.setData(data)
+        if self.ident not in graph.artists:
+            graph.add_artist(self.ident, self.curve, 0, no_points=True)
+
+    def removeCurve(self):
+        """
+        Remove the curve from the graph and the tracelist.
+        """
+        graph = self.parent.parent
+        if self.ident not in graph.artists:
+            return
+        try:
+            self.parent.removeTrace(self.ident)
+        except KeyError:
+            graph.remove_artist(self.ident)
 
     def onActivated(self):
         """
@@ -152,30 +341,157 @@ class FitWindow(QWidget):
         Send table parameters to fitter, perform fit,
         and then update parameter table with the results.
         """
+        return self.runFit()
+
+    @inlineCallbacks
+    def runFit(self, warm_start=False):
+        """
+        Perform a fit.
+        The fit is run in a separate thread so the GUI and live data aren't blocked,
+        and is performed on a copy of the data since the dataset may be updated during the fit.
+        Arguments:
+            warm_start  (bool): start the varied parameters from their previous fitted values
+                                instead of the manual values.
+        """
+        if self.fitting:
+            return
         self.updateParametersToFitter()
-        self.fw.doFit()
-        self.updateParametersFromFitter()
-        self.plotFit()
+        if warm_start:
+            for p in self.fw.getParameters():
+                fitted_value = self.fw.getFittedValue(p)
+                if self.fw.getVary(p) and (fitted_value is not None):
+                    self.fw.setManualValue(p, fitted_value)
+        self.last_fit_counter = self.dataset.updateCounter
+        self.setFitting(True)
+        try:
+            # the dataset holds no data once it's closed (e.g. after its trace is removed)
+            if self.dataset.data is None:
+                raise ValueError('dataset has been closed.')
+            data = array(self.dataset.data)
+            yield deferToThread(self.fw.doFit, data[:, 0], data[:, self.index + 1])
+        except FitCancelled:
+            print('Fit cancelled.')
+        except Exception as e:
+            print('Error in fitwindow.onClick: fit failed:', e)
+        else:
+            self.updateParametersFromFitter()
+            self.plotFit()
+        finally:
+            self.setFitting(False)
+
+    def onErrorMethodChanged(self):
+        """
+        Set how the errors are estimated. Takes effect on the next fit.
+        """
+        self.fw.setErrorMethod(str(self.errorSelect.currentText()))
+
+    def onStartsChanged(self, starts):
+        """
+        Set the number of starting points of the fit. Takes effect on the next fit.
+        """
+        self.fw.setMultiStart(starts)
+
+    def onManualValueChanged(self, value):
+        """
+        Redraw the curve while a manual parameter is being changed (if the manual curve is displayed).
+        """
+        if (self.curve_params == 'manual') and (not self.fitting):
+            self.onPlot()
+
+    def onRangeChanged(self):
+        """
+        Redraw the curve for the new view.
+        Model evaluations are memoized, so returning to a previous view is free.
+        Nothing is redrawn once the curve has been removed from the graph
+        (e.g. along with its dataset), or once the dataset is closed.
+        """
+        if self.fitting or (self.dataset.data is None):
+            return
+        try:
+            if self.ident not in self.parent.parent.artists:
+                return
+        except AttributeError:
+            return
+        if self.curve_params == 'fit':
+            self.plotFit()
+        elif self.curve_params == 'manual':
+            self.plotCurve(self.fw.evaluateManualParameters(*self.getView()))
+
+    def onCancel(self):
+        """
+        Abort the current fit.
+        """
+        self.fw.cancel()
+
+    def onLiveFitToggled(self, state):
+        """
+        Start/stop refitting automatically as new data arrives.
+        """
+        if state:
+            self.live_fit_loop.start(self.liveFitInterval.value(), now=True)
+        elif self.live_fit_loop.running:
+            self.live_fit_loop.stop()
+
+    def onLiveFitIntervalChanged(self, interval):
+        """
+        Restart the live fit loop with the new interval.
+        """
+        if self.live_fit_loop.running:
+            self.live_fit_loop.stop()
+            self.live_fit_loop.start(interval, now=False)
+
+    def liveFit(self):
+        """
+        Refit if the dataset has been updated since the last fit.
+        Called periodically by live_fit_loop, so fits are rate-limited to the live fit interval.
+        Each fit is warm-started from the previous solution.
+        """
+        # stop live fitting once the dataset is closed (e.g. after its trace is removed)
+        if self.dataset.data is None:
+            print('Error in fitwindow.liveFit: dataset has been closed, stopping live fit.')
+            self.liveFitCheck.setChecked(False)
+            if self.live_fit_loop.running:
+                self.live_fit_loop.stop()
+            return
+        if self.fitting or (self.dataset.updateCounter == self.last_fit_counter):
+            return
+        # need more points than varied parameters to fit
+        if len(self.dataset.data) <= len(self.fw.model.varied_positions()):
+            return
+        self.runFit(warm_start=True)
+
+    def setFitting(self, fitting):
+        """
+        Disable the controls while a fit is running.
+        """
+        self.fitting = fitting
+        self.model_select.setEnabled(not fitting)
+        self.parameterTable.setEnabled(not fitting)
+        self.fitButton.setEnabled(not fitting)
+        self.plotButton.setEnabled(not fitting)
+        self.errorSelect.setEnabled(not fitting)
+        self.startsSelect.setEnabled(not fitting)
+        self.cancelButton.setEnabled(fitting)
 
     def onPlot(self):
         """
         Plot the manual parameters.
-        See documentation for plotFit().
+        See documentation for plotCurve().
         """
-        class dataset:
-            def __init__(self, data):
-                self.data = data
-                self.updateCounter = 1
-
+        if self.dataset.data is None:
+            print('Error in fitwindow.onPlot: dataset has been closed.')
+            return
         self.updateParametersToFitter()
-        data = self.fw.evaluateManualParameters()
-        ds = dataset(data)
-        try:
-            # remove the previous plot
-            self.parent.parent.remove_artist(self.ident)
-            self.parent.parent.add_artist(self.ident, ds, 0, no_points=True)
-        except Exception as e:
-            self.parent.parent.add_artist(self.ident, ds, 0, no_points=True)
+        self.curve_params = 'manual'
+        self.plotCurve(self.fw.evaluateManualParameters(*self.getView()))
 
     def closeEvent(self, event):
-        self.parent.parent.remove_artist(self.ident)
+        try:
+            self.parent.parent.pw.sigRangeChanged.disconnect(self.onRangeChanged)
+        except (AttributeError, TypeError):
+            pass
+        if self.live_fit_loop.running:
+            self.live_fit_loop.stop()
+        self.fw.cancel()
+        self.fw.shutdown()
+        self.removeCurve()
@@ -1,7 +1,276 @@
 import numpy as np
 from fractions import Fraction
+from scipy.signal import find_peaks
+from twisted.internet.threads import deferToThread
+from twisted.internet.defer import inlineCallbacks
+
+from .FitWindowWidget import FitCurve
+
+from PyQt5.QtCore import QTimer, QEvent
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout,\
-    QTableWidget, QPushButton, QLabel, QCheckBox, QDoubleSpinBox
+    QTableWidget, QPushButton, QLabel, QCheckBox, QDoubleSpinBox, QComboBox
+
+
+def sideband_grid(mode_orders):
+    """
+    Returns every combination of sideband orders of the motional modes.
+    Arguments:
+        mode_orders ([int]): the maximum sideband order of each motional mode.
+    Returns:
+        np.array: the sideband order of each mode, of shape (num_modes, num_combinations).
+    """
+    ranges = [np.arange(-int(order), int(order) + 1) for order in mode_orders]
+    return np.stack([grid.ravel() for grid in np.meshgrid(*ranges, indexing='ij')])
+
+
+def enumerate_lines(carriers, mode_freqs, mode_orders, drive_freq=0., micromotion=False):
+    """
+    Enumerates the frequencies of all secular (and micromotion) sidebands of each carrier.
+    Arguments:
+        carriers    ([float]): the carrier frequencies.
+        mode_freqs  ([float]): the frequency of each motional mode.
+        mode_orders ([int])  : the maximum sideband order of each motional mode.
+        drive_freq  (float)  : the trap drive frequency.
+        micromotion (bool)   : whether to add the first order micromotion sidebands of every line.
+    Returns:
+        (np.array, np.array): the frequency of each line, and its total sideband order
+                                (micromotion sidebands add 0.5 to the order).
+    """
+    carriers = np.asarray(carriers, dtype=float)
+    orders = sideband_grid(mode_orders)
+    offsets = np.dot(np.asarray(mode_freqs, dtype=float), orders)
+    total_orders = np.sum(np.abs(orders), axis=0)
+
+    # add all secular sidebands
+    line_freqs = (carriers[:, np.newaxis] + offsets[np.newaxis, :]).ravel()
+    line_orders = np.tile(total_orders, len(carriers)).astype(float)
+
+    # add driven sidebands
+    if micromotion:
+        line_freqs = np.concatenate((line_freqs, line_freqs + drive_freq, line_freqs - drive_freq))
+        line_orders = np.concatenate((line_orders, line_orders + 0.5, line_orders + 0.5))
+    return line_freqs, line_orders
+
+
+def synthesize_spectrum(freqs, line_freqs, line_orders, width=0.010, cutoff=5.):
+    """
+    Sums a gaussian of height 0.5 ** order for each line over an evenly spaced frequency grid.
+    Each gaussian is only evaluated within cutoff * width of its line, and all of them are
+    accumulated at once, so the cost scales with the number of lines rather than lines x grid.
+    Arguments:
+        freqs       (np.array): the evenly spaced frequency grid.
+        line_freqs  (np.array): the frequency of each line.
+        line_orders (np.array): the sideband order of each line.
+        width       (float)   : the 1/e half-width of each gaussian.
+        cutoff      (float)   : the number of widths evaluated on either side of each line.
+    Returns:
+        np.array: the spectrum evaluated on freqs.
+    """
+    num_freqs = len(freqs)
+    if (num_freqs == 0) or (len(line_freqs) == 0):
+        return np.zeros(num_freqs)
+    step = freqs[1] - freqs[0] if num_freqs > 1 else 1.
+    half_window = int(np.ceil(cutoff * width / step))
+    # grid indices of the window around each line, of shape (num_lines, window)
+    start = np.rint((line_freqs - freqs[0]) / step).astype(int) - half_window
+    indices = start[:, np.newaxis] + np.arange(2 * half_window + 1)[np.newaxis, :]
+    valid = (indices >= 0) & (indices < num_freqs)
+    indices = np.clip(indices, 0, num_freqs - 1)
+    values = (0.5 ** line_orders)[:, np.newaxis] * np.exp(-(freqs[indices] - line_freqs[:, np.newaxis]) ** 2 / width ** 2)
+    return np.bincount(indices[valid], weights=values[valid], minlength=num_freqs)
+
+
+def select_transitions(transitions, manifolds, delta_ms):
+    """
+    Selects transitions by the sign of their S sublevel and their change in m.
+    Arguments:
+        transitions ([(str, float)]): the name (e.g. 'S-1/2D-5/2') and energy of each transition.
+        manifolds   ([str])         : the included S sublevels, i.e. '+' and/or '-'.
+        delta_ms    ([int])         : the included values of 2 * |delta m|.
+    Returns:
+        [(str, float)]: the selected transitions.
+    """
+    return [el for el in transitions
+            if (el[0][1] in manifolds) and (np.abs(float(el[0][1:3]) - float(el[0][6:8])) in delta_ms)]
+
+
+def line_terms(coefficients, mode_orders, micromotion=False):
+    """
+    Expresses the frequency of every line as a linear function of the spectrum parameters, i.e.
+        line frequencies = terms . [B field, line center, mode 1 freq, mode 2 freq, ...] + drive orders * drive freq.
+    Arguments:
+        coefficients    ([float]): the zeeman shift of each carrier per unit field.
+        mode_orders     ([int])  : the maximum sideband order of each motional mode.
+        micromotion     (bool)   : whether to add the first order micromotion sidebands of every line.
+    Returns:
+        (np.array, np.array, np.array): the terms of each line, of shape (num_lines, 2 + num_modes),
+                                        the micromotion order of each line, and its total sideband order.
+    """
+    coefficients = np.asarray(coefficients, dtype=float)
+    orders = sideband_grid(mode_orders)
+    num_carriers, num_sidebands = len(coefficients), orders.shape[1]
+    terms = np.empty((num_carriers * num_sidebands, 2 + len(orders)))
+    terms[:, 0] = np.repeat(coefficients, num_sidebands)
+    terms[:, 1] = 1.
+    terms[:, 2:] = np.tile(orders.T, (num_carriers, 1))
+    drive_orders = np.zeros(len(terms))
+    line_orders = np.tile(np.sum(np.abs(orders), axis=0), num_carriers).astype(float)
+    if micromotion:
+        terms = np.concatenate((terms, terms, terms))
+        drive_orders = np.concatenate((drive_orders, drive_orders + 1., drive_orders - 1.))
+        line_orders = np.concatenate((line_orders, line_orders + 0.5, line_orders + 0.5))
+    return terms, drive_orders, line_orders
+
+
+def find_lines(freqs, counts, prominence=None):
+    """
+    Finds the center frequency of each peak in a measured spectrum.
+    Peak centers are refined by fitting a parabola through each peak and its neighbours.
+    Arguments:
+        freqs       (np.array): the frequencies of the spectrum.
+        counts      (np.array): the measured spectrum.
+        prominence  (float)   : the minimum prominence of a peak. Defaults to a fifth of the range of the spectrum.
+    Returns:
+        (np.array, np.array): the center frequency and height of each peak.
+    """
+    freqs = np.asarray(freqs, dtype=float)
+    counts = np.asarray(counts, dtype=float)
+    finite = np.isfinite(freqs) & np.isfinite(counts)
+    freqs, counts = freqs[finite], counts[finite]
+    order = np.argsort(freqs, kind='stable')
+    freqs, counts = freqs[order], counts[order]
+    if len(freqs) < 3:
+        return np.zeros(0), np.zeros(0)
+    if prominence is None:
+        prominence = 0.2 * np.ptp(counts)
+    peaks, _ = find_peaks(counts, prominence=prominence)
+    # vertex of the parabola through each peak and its neighbours
+    peaks = peaks[(peaks > 0) & (peaks < len(freqs) - 1)]
+    x0, x1, x2 = freqs[peaks - 1], freqs[peaks], freqs[peaks + 1]
+    y0, y1, y2 = counts[peaks - 1], counts[peaks], counts[peaks + 1]
+    numerator = (x1 - x0) ** 2 * (y1 - y2) - (x1 - x2) ** 2 * (y1 - y0)
+    denominator = (x1 - x0) * (y1 - y2) - (x1 - x2) * (y1 - y0)
+    centers = x1.copy()
+    valid = denominator != 0
+    centers[valid] = x1[valid] - 0.5 * numerator[valid] / denominator[valid]
+    centers = np.clip(centers, x0, x2)
+    return centers, y1
+
+
+def nearest_lines(line_freqs, peak_freqs):
+    """
+    Finds the nearest line to each peak by a binary search over the sorted lines.
+    Arguments:
+        line_freqs  (np.array): the frequency of each line.
+        peak_freqs  (np.array): the frequency of each peak.
+    Returns:
+        (np.array, np.array): the index of the nearest line to each peak, and its distance from the peak.
+    """
+    order = np.argsort(line_freqs, kind='stable')
+    sorted_freqs = line_freqs[order]
+    right = np.clip(np.searchsorted(sorted_freqs, peak_freqs), 0, len(sorted_freqs) - 1)
+    left = np.clip(right - 1, 0, len(sorted_freqs) - 1)
+    use_left = np.abs(peak_freqs - sorted_freqs[left]) <= np.abs(sorted_freqs[right] - peak_freqs)
+    nearest = order[np.where(use_left, left, right)]
+    return nearest, np.abs(peak_freqs - line_freqs[nearest])
+
+
+class LineFit(object):
+    """
+    Holds the result of fitting a line model to measured peaks (see fit_lines).
+    """
+
+    def __init__(self, parameters, peak_freqs, lines, residuals, iterations, converged):
+        self.parameters = parameters
+        self.peak_freqs = peak_freqs
+        # index of the line assigned to each peak, or -1 if the peak wasn't assigned
+        self.lines = lines
+        self.residuals = residuals
+        self.iterations = iterations
+        self.converged = converged
+        self.num_matched = int(np.sum(lines >= 0))
+        self.rms = np.sqrt(np.mean(residuals[lines >= 0] ** 2)) if self.num_matched else np.nan
+
+
+def _match_lines(peak_freqs, line_freqs_of, parameters, vary, terms, tolerance, max_iterations):
+    """
+    Iterative closest point matching of peaks to lines (see fit_lines). Updates parameters in place.
+    Returns:
+        (np.array, int, bool): the line assigned to each peak (-1 if none), the number of iterations,
+                                and whether the assignment converged.
+    """
+    lines = np.full(len(peak_freqs), -1)
+    for iteration in range(1, max_iterations + 1):
+        line_freqs = line_freqs_of(parameters)
+        nearest, distance = nearest_lines(line_freqs, peak_freqs)
+        nearest[distance > tolerance] = -1
+        if np.array_equal(nearest, lines):
+            return lines, iteration, True
+        lines = nearest
+        matched = lines >= 0
+        if not np.any(matched):
+            break
+        # solve for the change in the parameters, so that directions without any
+        # matched lines (e.g. a mode without assigned sidebands) are left unchanged
+        residuals = peak_freqs[matched] - line_freqs[lines[matched]]
+        step, _, _, _ = np.linalg.lstsq(terms[lines[matched]][:, vary], residuals, rcond=None)
+        parameters[vary] += step
+    return lines, iteration, False
+
+
+def fit_lines(peak_freqs, terms, drive_orders, parameters, vary, drive_freq=0., tolerance=np.inf, max_iterations=50,
+              peak_heights=None, line_orders=None):
+    """
+    Fits the parameters of a line model to measured peak frequencies, by iterative closest point matching:
+    each peak is assigned to the nearest predicted line, the parameters are solved for by linear least squares
+    (since the line frequencies are linear in them), and the two steps are repeated until the assignment settles.
+    The parameters must start close enough to the solution that most peaks are assigned to the right line.
+    If the peak heights and line orders are given, the fit is done coarse to fine, which widens the range
+    of initial parameters that converge: the tallest peaks are first fitted to the carriers only,
+    then each higher sideband order is added along with as many of the next tallest peaks as it adds lines.
+    Arguments:
+        peak_freqs  (np.array): the measured peak frequencies.
+        terms, drive_orders   : the line model, as returned by line_terms.
+        parameters  ([float]) : the initial parameters, i.e. [B field, line center, mode 1 freq, ...].
+        vary        ([bool])  : whether to vary each parameter.
+        drive_freq  (float)   : the trap drive frequency.
+        tolerance   (float)   : peaks further than this from their nearest line are left unassigned.
+        max_iterations  (int) : the maximum number of assignment steps for each sideband order.
+        peak_heights (np.array): the height of each peak.
+        line_orders (np.array): the sideband order of each line, as returned by line_terms.
+    Returns:
+        LineFit: the fitted parameters and the assignment of the peaks.
+    """
+    peak_freqs = np.asarray(peak_freqs, dtype=float)
+    parameters = np.array(parameters, dtype=float)
+    vary = np.asarray(vary, dtype=bool)
+    lines = np.full(len(peak_freqs), -1)
+    if (len(terms) == 0) or (len(peak_freqs) == 0):
+        return LineFit(parameters, peak_freqs, lines, np.zeros(len(peak_freqs)), 0, False)
+
+    def line_freqs_of(parameters):
+        return np.dot(terms, parameters) + drive_orders * drive_freq
+
+    # coarse to fine stages, each with a subset of the lines and the peaks
+    stages = []
+    if (peak_heights is not None) and (line_orders is not None):
+        by_height = np.argsort(peak_heights, kind='stable')[::-1]
+        for order in np.unique(line_orders)[:-1]:
+            included = np.nonzero(line_orders <= order)[0]
+            num_lines = len(np.unique(np.round(line_freqs_of(parameters)[included], 6)))
+            stages.append((included, np.sort(by_height[:num_lines])))
+    stages.append((np.arange(len(terms)), np.arange(len(peak_freqs))))
+
+    iterations = 0
+    for included, peaks in stages:
+        stage_lines, stage_iterations, converged = _match_lines(
+            peak_freqs[peaks], lambda p: line_freqs_of(p)[included], parameters, vary, terms[included],
+            tolerance, max_iterations)
+        iterations += stage_iterations
+    lines[:] = np.where(stage_lines >= 0, included[stage_lines], -1)
+    line_freqs = line_freqs_of(parameters)
+    residuals = np.where(lines >= 0, peak_freqs - line_freqs[np.maximum(lines, 0)], np.nan)
+    return LineFit(parameters, peak_freqs, lines, residuals, iterations, converged)
 
 
 class ParamInfo(object):
@@ -17,19 +286,41 @@ class PredictSpectrum(QWidget):
     """
     Allows users to select parameters for a predicted spectrum
     and add it to the RSG.
+    Once plotted, the spectrum is redrawn whenever a parameter or the view changes.
     """
 
+    # frequency grid of the spectrum (in MHz)
+    fmin = -50.
+    fmax = 50.
+    step = 0.005
+    # time to wait for further changes before recomputing the spectrum (in ms)
+    update_delay = 100
+
     def __init__(self, parent):
         super(PredictSpectrum, self).__init__()
         # self.reactor=reactor
         self.parent = parent
         self.value_dict = {}
-        self.ident = (None, 'Predicted Spectrum')
+        # the spectrum is listed under its own header in the tracelist
+        self.ident = ('', 'Predicted Spectrum', 'Predicted Spectrum')
         self.Ca_data = Transitions_SD()
+        # holds the spectrum, which is updated in place
+        self.curve = FitCurve()
+        # incremented for each requested spectrum, so stale results can be discarded
+        self.sequence = 0
+        # the settings and view of the most recent request, so unchanged requests can be skipped
+        self.last_request = None
+        # identifiers of the traces which can be fitted, in the order of fitSelect
+        self.trace_idents = []
+        # debounces changes to the parameters and the view
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(self.update_delay)
+        self.update_timer.timeout.connect(self.updateSpectrum)
         self.initUI()
 
     def initUI(self):
-        trace_name = self.ident[1]
+        trace_name = self.ident[2]
         self.setWindowTitle(trace_name)
         mainLayout = QVBoxLayout(self)
         buttons = QHBoxLayout()
@@ -57,9 +348,42 @@ class PredictSpectrum(QWidget):
         self.deltam2 = QCheckBox("Delta m=2")
         self.deltam2.setChecked(True)
         mainLayout.addWidget(self.deltam2)
+        self.liveCheck = QCheckBox("Live Update")
+        self.liveCheck.setChecked(True)
+        mainLayout.addWidget(self.liveCheck)
+
+        # fitting the parameters to a measured spectrum
+        fitLayout = QHBoxLayout()
+        self.fitSelect = QComboBox(self)
+        self.fitSelect.setToolTip('The measured spectrum to fit the B field, line center, and mode frequencies to.\n'
+                                  'The parameters must be close enough that most peaks are near their predicted line.')
+        self.toleranceSelect = QDoubleSpinBox(self)
+        self.toleranceSelect.setDecimals(3)
+        self.toleranceSelect.setRange(0.001, 100)
+        self.toleranceSelect.setValue(0.1)
+        self.toleranceSelect.setPrefix('Tolerance: ')
+        self.toleranceSelect.setSuffix(' MHz')
+        self.toleranceSelect.setToolTip('Peaks further than this from their nearest predicted line are ignored.')
+        self.fitButton = QPushButton('Fit', self)
+        fitLayout.addWidget(self.fitSelect)
+        fitLayout.addWidget(self.toleranceSelect)
+        fitLayout.addWidget(self.fitButton)
+        mainLayout.addLayout(fitLayout)
+        self.statsLabel = QLabel(self)
+        self.statsLabel.setWordWrap(True)
+        mainLayout.addWidget(self.statsLabel)
+        self.updateTraces()
 
         self.plotButton.clicked.connect(self.onPlot)
+        self.fitButton.clicked.connect(self.onFit)
+        for check in (self.OPpos, self.OPneg, self.deltam0, self.deltam1, self.deltam2):
+            check.stateChanged.connect(self.onParameterChanged)
         self.setupParameterTable()
+        # redraw the spectrum for the visible range when the view changes
+        try:
+            self.parent.parent.pw.sigRangeChanged.connect(self.onParameterChanged)
+        except AttributeError:
+            pass
         self.show()
 
     def setupParameterTable(self):
@@ -79,97 +403,277 @@ class PredictSpectrum(QWidget):
             value.setDecimals(3)
             value.setRange(-100, 100)
             value.setValue(0)
+            value.valueChanged.connect(self.onParameterChanged)
             self.parameterTable.setCellWidget(i, 0, label)
             self.parameterTable.setCellWidget(i, 1, value)
 
-    def generate_spectrum(self):
+    def getSettings(self):
+        """
+        Read the spectrum parameters from the widgets,
+        so the spectrum can be computed outside of the main thread.
+        Returns:
+            (dict, [str], [int]): the value of each parameter, the included manifolds,
+                                    and the included values of 2 * delta m.
+        """
+        values = {name: info.value.value() for name, info in self.value_dict.items()}
+        manifolds = [sign for sign, check in (('-', self.OPneg), ('+', self.OPpos)) if check.isChecked()]
+        delta_ms = [delta_m for delta_m, check in ((0, self.deltam0), (2, self.deltam1), (4, self.deltam2))
+                    if check.isChecked()]
+        return values, manifolds, delta_ms
+
+    def getView(self):
+        """
+        Get the visible frequency range of the graph, limited to the frequency grid,
+        so the spectrum is only computed where it can be seen.
+        The whole spectrum is computed while the graph is autoranging, since the view
+        would otherwise shrink to whatever range was computed.
+        Returns:
+            (float, float): the visible range, or None if the whole spectrum should be computed.
+        """
+        try:
+            graph = self.parent.parent
+        except AttributeError:
+            return None
+        try:
+            # the view range is in log space for log plots
+            if graph.artists[self.ident].logModeX:
+                return None
+        except (AttributeError, KeyError):
+            pass
+        try:
+            if graph.pw.plotItem.vb.autoRangeEnabled()[0]:
+                return None
+            xlim = graph.pw.viewRange()[0]
+        except AttributeError:
+            return None
+        xlim = (max(xlim[0], self.fmin), min(xlim[1], self.fmax))
+        if xlim[0] >= xlim[1]:
+            return None
+        return xlim
+
+    def generate_spectrum(self, settings=None, xlim=None):
+        """
+        Compute the predicted spectrum.
+        Arguments:
+            settings    (tuple): the parameters returned by getSettings. Read from the widgets if None.
+            xlim        (float, float): the frequency range to compute. The whole grid is computed if None.
+        Returns:
+            np.array: the frequencies and the spectrum, as columns.
+        """
+        if settings is None:
+            settings = self.getSettings()
+        values, manifolds, delta_ms = settings
         # must be in gauss and MHz!!
-        b_field = self.value_dict['B Field'].value.value()
-        line_center = self.value_dict['Line Center'].value.value()
-        mode_1 = self.value_dict['Mode 1 Freq'].value.value()
-        order1 = int(self.value_dict['Orders1'].value.value())
-        mode_2 = self.value_dict['Mode 2 Freq'].value.value()
-        order2 = int(self.value_dict['Orders2'].value.value())
-        mode_3 = self.value_dict['Mode 3 Freq'].value.value()
-        order3 = int(self.value_dict['Orders3'].value.value())
-        drive_freq = self.value_dict['Drive Frequency'].value.value()
-        micromotion = int(self.value_dict['Micromotion'].value.value())
+        b_field = values['B Field']
+        line_center = values['Line Center']
+        mode_1 = values['Mode 1 Freq']
+        order1 = int(values['Orders1'])
+        mode_2 = values['Mode 2 Freq']
+        order2 = int(values['Orders2'])
+        mode_3 = values['Mode 3 Freq']
+        order3 = int(values['Orders3'])
+        drive_freq = values['Drive Frequency']
+        micromotion = int(values['Micromotion'])
 
         all_carriers = self.Ca_data.get_transition_energies(b_field * 1e-4, line_center)  # to Tesla and MHz
-        print(all_carriers)
 
         # choose which carriers to include
-        included_lines = []
-        if self.OPneg.isChecked() == True:
-            included_lines.extend([el for el in all_carriers if el[0][1] == '-'])
-        if self.OPpos.isChecked() == True:
-            included_lines.extend([el for el in all_carriers if el[0][1] == '+'])
-
-        final_lines = []
-        if self.deltam0.isChecked() == True:
-            final_lines.extend([el for el in included_lines if np.abs(float(el[0][1:3]) - float(el[0][6:8])) == 0])
-        if self.deltam1.isChecked() == True:
-            final_lines.extend([el for el in included_lines if np.abs(float(el[0][1:3]) - float(el[0][6:8])) == 2])
-        if self.deltam2.isChecked() == True:
-            final_lines.extend([el for el in included_lines if np.abs(float(el[0][1:3]) - float(el[0][6:8])) == 4])
+        final_lines = select_transitions(all_carriers, manifolds, delta_ms)
 
         carriers = [carrier[1] for carrier in final_lines]
-        sideband_orders = [[i, j, k] for i in range(-order1, order1 + 1) for j in range(-order2, order2 + 1) for k in
-                           range(-order3, order3 + 1)]
-        sideband_freqs = [mode_1, mode_2, mode_3]
-
-        # add all secular sidebands
-        all_lines = []
-        for freq in carriers:
-            for el in sideband_orders:
-                all_lines.append(((freq + sum(np.multiply(el, sideband_freqs))), sum(np.abs(el))))
-
-        # add driven sidebands
-        if micromotion:
-            micro_lines = []
-            for el in all_lines:
-                freq, order = el
-                micro_lines.append((freq + drive_freq, 0.5 + order))
-                micro_lines.append((freq - drive_freq, 0.5 + order))
-            all_lines.extend(micro_lines)
-
-        freqs = np.arange(-50, 50, 0.005)
-        spec = np.zeros_like(freqs)
-        for line in all_lines:
-            spec = np.add(spec, self.make_gaussian(line[0], freqs, line[1]))
+        line_freqs, line_orders = enumerate_lines(carriers, [mode_1, mode_2, mode_3], [order1, order2, order3],
+                                                  drive_freq, micromotion)
+
+        # only compute the part of the grid within view
+        num_freqs = int(round((self.fmax - self.fmin) / self.step))
+        start, stop = 0, num_freqs
+        if xlim is not None:
+            start = max(start, int(np.floor((xlim[0] - self.fmin) / self.step)))
+            stop = min(stop, int(np.ceil((xlim[1] - self.fmin) / self.step)) + 1)
+        freqs = self.fmin + self.step * np.arange(start, stop)
+        spec = synthesize_spectrum(freqs, line_freqs, line_orders)
         data = np.zeros((len(freqs), 2))
         data[:, 0] = freqs
         data[:, 1] = spec
 
         return data
 
-    def make_gaussian(self, center, freqs, amplitude):
-        # takes a center and makes a guassian around that point
-        gauss = (0.5 ** amplitude) * np.exp(-(freqs - center) ** 2 / (0.010 ** 2))
-        return gauss
-
-    def onPlot(self):
+    def fit_spectrum(self, data, settings, tolerance):
         """
-        Plot the manual parameters. See documentation
-        for plotFit()
+        Fit the B field, line center, and the frequencies of the modes with sidebands to a measured spectrum.
+        Arguments:
+            data        (np.array): the frequencies and the measured spectrum, as columns.
+            settings    (tuple): the initial parameters, as returned by getSettings.
+            tolerance   (float): peaks further than this from their nearest line are ignored.
+        Returns:
+            LineFit: the fit result, whose parameters are [B field, line center, mode 1 freq, mode 2 freq, mode 3 freq].
         """
+        values, manifolds, delta_ms = settings
+        mode_orders = [int(values['Orders1']), int(values['Orders2']), int(values['Orders3'])]
+        # zeeman shift of each carrier per gauss (the transition energies are linear in B)
+        transitions = select_transitions(self.Ca_data.get_transition_coefficients(), manifolds, delta_ms)
+        coefficients = [coefficient * 1e-4 for name, coefficient in transitions]
+        terms, drive_orders, line_orders = line_terms(coefficients, mode_orders, int(values['Micromotion']))
+        parameters = [values['B Field'], values['Line Center'],
+                      values['Mode 1 Freq'], values['Mode 2 Freq'], values['Mode 3 Freq']]
+        vary = [True, True] + [order > 0 for order in mode_orders]
+        peak_freqs, peak_heights = find_lines(data[:, 0], data[:, 1])
+        return fit_lines(peak_freqs, terms, drive_orders, parameters, vary, values['Drive Frequency'], tolerance,
+                         peak_heights=peak_heights, line_orders=line_orders)
+
+    def updateTraces(self):
+        """
+        Update the list of traces which can be fitted.
+        """
+        try:
+            artists = self.parent.parent.artists
+        except AttributeError:
+            return
+        current = self.trace_idents[self.fitSelect.currentIndex()] if self.fitSelect.currentIndex() >= 0 else None
+        self.trace_idents = [ident for ident in artists.keys() if ident != self.ident]
+        self.fitSelect.clear()
+        for ident in self.trace_idents:
+            self.fitSelect.addItem(str(ident[2]))
+        if current in self.trace_idents:
+            self.fitSelect.setCurrentIndex(self.trace_idents.index(current))
+
+    @inlineCallbacks
+    def onFit(self):
+        """
+        Fit the parameters to the selected trace, and update the parameter table with the result.
+        The fit is run in a separate thread on a copy of the data, since the dataset may be updated during the fit.
+        """
+        index = self.fitSelect.currentIndex()
+        if index < 0:
+            print('Error in PredictSpectrum.onFit: no trace selected.')
+            return
+        try:
+            artist_params = self.parent.parent.artists[self.trace_idents[index]]
+        except KeyError:
+            print('Error in PredictSpectrum.onFit: trace no longer exists.')
+            self.updateTraces()
+            return
+        self.fitButton.setEnabled(False)
+        try:
+            # the dataset holds no data once it's closed (e.g. after its trace is removed)
+            if artist_params.dataset.data is None:
+                raise ValueError('dataset has been closed.')
+            data = np.array(artist_params.dataset.data)[:, [0, artist_params.index + 1]]
+            result = yield deferToThread(self.fit_spectrum, data, self.getSettings(), self.toleranceSelect.value())
+        except Exception as e:
+            print('Error in PredictSpectrum.onFit: fit failed:', e)
+            return
+        finally:
+            self.fitButton.setEnabled(True)
+        if result.num_matched == 0:
+            self.statsLabel.setText('No peaks within tolerance of a predicted line ({:d} peaks found).'.format(
+                len(result.peak_freqs)))
+            return
+        # setting the values redraws the spectrum if it's plotted
+        for name, value in zip(['B Field', 'Line Center', 'Mode 1 Freq', 'Mode 2 Freq', 'Mode 3 Freq'],
+                               result.parameters):
+            self.value_dict[name].value.setValue(value)
+        self.statsLabel.setText('{:d}/{:d} peaks matched, rms residual: {:.2f} kHz, {:d} iterations{}'.format(
+            result.num_matched, len(result.peak_freqs), 1e3 * result.rms, result.iterations,
+            '' if result.converged else ' (not converged)'))
+        if self.ident not in self.parent.parent.artists:
+            self.onPlot()
+
+    def changeEvent(self, event):
+        # refresh the fittable traces whenever the window is activated
+        if (event.type() == QEvent.ActivationChange) and self.isActiveWindow():
+            self.updateTraces()
+        super(PredictSpectrum, self).changeEvent(event)
+
+    @inlineCallbacks
+    def updateSpectrum(self):
+        """
+        Compute the spectrum for the current parameters and view, and plot it.
+        The spectrum is computed in a separate thread so the GUI isn't blocked.
+        Only the result of the most recent request is plotted.
+        Nothing is computed if neither the parameters nor the view changed since the last request,
+        e.g. when the range of an autoranging graph changes.
+        """
+        settings = self.getSettings()
+        xlim = self.getView()
+        if (settings, xlim) == self.last_request:
+            return
+        self.last_request = (settings, xlim)
+        self.sequence += 1
+        sequence = self.sequence
+        try:
+            data = yield deferToThread(self.generate_spectrum, settings, xlim)
+        except Exception as e:
+            print('Error in PredictSpectrum.updateSpectrum: unable to compute spectrum:', e)
+            # allow the same request to be retried
+            if sequence == self.sequence:
+                self.last_request = None
+            return
+        # a newer spectrum was requested while this one was computed
+        if sequence != self.sequence:
+            return
+        self.plotCurve(data)
+
+    def plotCurve(self, data):
+        """
+        Plot the spectrum onto the graph.
+        The artist is only added once, and is updated in place afterwards.
+        Like fit curves, the spectrum is always drawn as a connected line (no_points),
+        since it's sampled on a fine grid rather than measured.
+        """
+        graph = self.parent.parent
+        self.curve.setData(data)
+        if self.ident not in graph.artists:
+            # the spectrum doesn't belong to a dataset, so add a header for it
+            if self.ident[:2] not in self.parent.dataset_dict:
+                self.parent.addDataset(self.ident[:2])
+            graph.add_artist(self.ident, self.curve, 0, no_points=True)
+
+    def removeCurve(self):
+        """
+        Remove the spectrum from the graph and the tracelist.
+        """
+        graph = self.parent.parent
+        if self.ident not in graph.artists:
+            return
+        try:
+            self.parent.removeTrace(self.ident)
+        except KeyError:
+            graph.remove_artist(self.ident)
 
-        class dataset:
-            def __init__(self, data):
-                self.data = data
-                self.updateCounter = 1
-
-        data = self.generate_spectrum()  ####Ths is where we add the lorenzians
-        ds = dataset(data)
+    def onParameterChanged(self, *args):
+        """
+        Schedule a redraw of the spectrum after a parameter or the view is changed.
+        Restarting the timer on every change means that the spectrum is only recomputed
+        once the changes pause.
+        """
         try:
-            # remove the previous plot
-            self.parent.parent.remove_artist(self.ident)
-            self.parent.parent.add_artist(self.ident, ds, 0, no_points=False)
-        except:
-            self.parent.parent.add_artist(self.ident, ds, 0, no_points=False)
+            plotted = self.ident in self.parent.parent.artists
+        except AttributeError:
+            return
+        if plotted and self.liveCheck.isChecked():
+            self.update_timer.start()
+
+    def onPlot(self):
+        """
+        Plot the predicted spectrum.
+        See documentation for updateSpectrum().
+        """
+        self.update_timer.stop()
+        # always plot, e.g. if the spectrum was removed from the graph
+        self.last_request = None
+        return self.updateSpectrum()
 
     def closeEvent(self, event):
-        self.parent.parent.remove_artist(self.ident)
+        try:
+            self.parent.parent.pw.sigRangeChanged.disconnect(self.onParameterChanged)
+        except (AttributeError, TypeError):
+            pass
+        self.update_timer.stop()
+        # discard any spectrum which is still being computed
+        self.sequence += 1
+        self.last_request = None
+        self.removeCurve()
 
 
 # everything must be in Gauss and MHz. Copied from SD scanner
@@ -274,6 +778,13 @@ class Transitions_SD(object):
                     ans.append((name, diff))
         return ans
 
+    def get_transition_coefficients(self):
+        """
+        Returns the zeeman shift of each transition per unit field, in MHz/T.
+        The transition energies are linear in B, i.e. zero_offset + coefficient * B.
+        """
+        return self.get_transition_energies(1.)
+
     def energies_to_magnetic_field(self, transitions):
         """
         Given two points in the form [(S-1/2D5+1/2, 1.0 MHz), (-1/2, 5+/2, 2.0 MHz)],
@@ -71,7 +71,9 @@ class TraceList(QTreeWidget):
             print('\tdataset_ident:', dataset_ident)
         else:
             dataset_item = self.dataset_dict.pop(dataset_ident, None)
-            dataset_item.takeChildren()
+            # forget the trace items, so they aren't kept (and checked) after the dataset is removed
+            for artist_item in dataset_item.takeChildren():
+                self.trace_dict.pop(artist_item.data(0, Qt.UserRole), None)
             # remove dataset item from QTreeWidget
             dataset_item_index = self.indexOfTopLevelItem(dataset_item)
             self.takeTopLevelItem(dataset_item_index)
@@ -117,7 +119,7 @@ class TraceList(QTreeWidget):
         # get objects
         dataset_ident = artist_ident[:2]
         dataset_item = self.dataset_dict[dataset_ident]
-        artist_item = self.trace_dict[artist_ident]
+        artist_item = self.trace_dict.pop(artist_ident)
         # remove child from dataset_item
         artist_index = dataset_item.indexOfChild(artist_item)
         dataset_item.takeChild(artist_index)
@@ -226,11 +228,13 @@ class TraceList(QTreeWidget):
             # toggle log-scaling for x-axis
             elif action == actionDict.get('logXAction'):
                 logx_state = not artist_params.logModeX
-                artist_params.artist.setLogMode(logx_state, None)
+                artist_params.logModeX = logx_state
+                artist_params.artist.setLogMode(logx_state, artist_params.logModeY)
             # toggle log-scaling for y-axis
             elif action == actionDict.get('logYAction'):
                 logy_state = not artist_params.logModeY
-                artist_params.artist.setLogMode(None, logy_state)
+                artist_params.logModeY = logy_state
+                artist_params.artist.setLogMode(artist_params.logModeX, logy_state)
             # show parameters in a separate window
             elif action == actionDict.get('parametersAction'):
                 dataset = artist_params.dataset
@@ -259,7 +263,7 @@ class TraceList(QTreeWidget):
                     artist_params.artist.setData(pen=new_color, symbol=None)
             # fit the selected artist/trace
             elif action == actionDict.get('fitAction'):
-                fw = FitWindow(artist_params.dataset, artist_params.index, self)
+                fw = FitWindow(artist_params.dataset, artist_params.index, self, artist_ident=artist_ident)
                 self.windows.append(fw)
                 fw.show()
             # export the trace
@@ -5,6 +5,16 @@ from . import fitting
 from .fitting import *
 __all__.extend(fitting.__all__)
 
+# batch fitting
+from . import batch_fitting
+from .batch_fitting import *
+__all__.extend(batch_fitting.__all__)
+
+# spectral estimates
+from . import spectral
+from .spectral import *
+__all__.extend(spectral.__all__)
+
 # fit_models
 from . import fit_models
 from .fit_models import *
@@ -0,0 +1,367 @@
+"""
+Batch fitting of a single model to many (x, y) series.
+Series are split into chunks which are fitted in parallel across a process pool.
+Within each chunk, every fit is warm-started from the solution of the previous fit,
+which is useful when the series are ordered (e.g. traces of a scan, or consecutive datasets).
+"""
+
+__all__ = ["BatchFitWrapper", "BatchFitResult"]
+
+from numpy import array, arange, column_stack, full, nan, inf
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from twisted.internet.defer import inlineCallbacks, returnValue
+
+from .fitting import FitWrapper, FitCancelled
+
+
+def _make_executor(max_workers=None):
+    """
+    Creates a process pool for batch fits.
+    Workers are spawned rather than forked, since batch fits are started from
+    a thread of the GUI process, which can't be forked safely.
+    """
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context('spawn'))
+
+
+def _shutdown_executor(executor):
+    """
+    Shuts down a process pool without waiting for it.
+    Queued tasks are cancelled on python 3.9+, and run to completion on older versions.
+    """
+    try:
+        executor.shutdown(wait=False, cancel_futures=True)
+    except TypeError:
+        executor.shutdown(wait=False)
+
+
+class _SeriesDataset(object):
+    """
+    Holds a single (x, y) series in the format expected by FitWrapper.
+    """
+
+    def __init__(self, x, y):
+        self.data = column_stack((x, y))
+
+
+def _make_fitter(model_name, settings, x, y):
+    """
+    Creates a FitWrapper for a series with the given fit settings.
+    """
+    fw = FitWrapper(_SeriesDataset(x, y), 0)
+    fw.setModel(model_name)
+    fw.setMethod(settings['method'])
+    fw.setLoss(settings['loss'])
+    for p, (vary, manual_value, bounds) in settings['parameters'].items():
+        fw.setVary(p, vary)
+        if bounds is not None:
+            fw.setBounds(p, *bounds)
+    return fw
+
+
+def _fit_chunk(model_name, settings, series_list, warm_start):
+    """
+    Fits a model to a chunk of series in order.
+    Must be a module-level function so it can be sent to worker processes.
+    Arguments:
+        model_name  (str)   : the name of the model in _MODEL_DICT.
+        settings    (dict)  : the fit settings, see BatchFitWrapper.getSettings.
+        series_list ([(x, y)]): the series to fit.
+        warm_start  (bool)  : whether to start each fit from the solution of the previous fit.
+    Returns:
+        [(list or None, float, int)]: the fitted values of all parameters (or None if the fit failed),
+                                      the cost, and the number of function evaluations of each fit.
+    """
+    results = []
+    previous = None
+    for x, y in series_list:
+        fw = _make_fitter(model_name, settings, x, y)
+        for p, (vary, manual_value, bounds) in settings['parameters'].items():
+            # use the previous solution for varied parameters
+            if warm_start and (previous is not None) and vary:
+                fw.setManualValue(p, previous[p])
+            elif manual_value is not None:
+                fw.setManualValue(p, manual_value)
+            else:
+                # force guess of initial parameters
+                fw.getManualValue(p)
+        try:
+            fit_result = fw.doFit()
+            previous = {p: fw.getFittedValue(p) for p in fw.getParameters()}
+            results.append(([previous[p] for p in fw.getParameters()], fit_result.cost, fit_result.nfev))
+        except Exception as e:
+            print('Error in batchfitwrapper: fit failed:', e)
+            results.append((None, nan, 0))
+    return results
+
+
+def _fit_starts(model_name, settings, starts, x, y):
+    """
+    Fits a model to a single series from each of a list of starting points.
+    Must be a module-level function so it can be sent to worker processes.
+    Arguments:
+        model_name  (str)   : the name of the model in _MODEL_DICT.
+        settings    (dict)  : the fit settings, see BatchFitWrapper.getSettings.
+        starts      ([dict]): the starting values of the varied parameters for each fit.
+        x, y    (np.array)  : the series to fit.
+    Returns:
+        [(list or None, float, int)]: the fitted values of all parameters (or None if the fit failed),
+                                      the cost, and the number of function evaluations of each fit.
+    """
+    results = []
+    fw = _make_fitter(model_name, settings, x, y)
+    for start in starts:
+        for p, (vary, manual_value, bounds) in settings['parameters'].items():
+            if vary and (p in start):
+                fw.setManualValue(p, start[p])
+            elif manual_value is not None:
+                fw.setManualValue(p, manual_value)
+            else:
+                fw.getManualValue(p)
+        try:
+            fit_result = fw.doFit()
+            results.append(([fw.getFittedValue(p) for p in fw.getParameters()], fit_result.cost, fit_result.nfev))
+        except Exception as e:
+            print('Error in batchfitwrapper: fit failed:', e)
+            results.append((None, nan, 0))
+    return results
+
+
+class BatchFitResult(object):
+    """
+    Holds the results of a batch fit as a table.
+    The table is a 2D array with columns [index, parameters..., cost], with one row per series.
+    Failed fits have their parameters set to NaN.
+    Since the table has the same format as Dataset.data, the result can be plotted
+    directly by a graph, e.g. graph.add_artist(ident, result, result.labels.index('center')),
+    which plots the fitted center vs the series index.
+    """
+
+    def __init__(self, parameters, indices, rows, nfev):
+        self.parameters = parameters
+        # names of the traces (i.e. all columns except the index)
+        self.labels = parameters + ['cost']
+        self.data = column_stack((indices, rows))
+        self.nfev = nfev
+        self.updateCounter = 1
+        self.dataset_name = 'Batch fit'
+
+    def getParameter(self, p):
+        """
+        Returns the fitted values of a parameter for all series.
+        """
+        return self.data[:, self.parameters.index(p) + 1]
+
+
+class BatchFitWrapper(object):
+    """
+    Fits a single model to many (x, y) series in parallel.
+    Parameters are configured in the same way as FitWrapper.
+    """
+
+    # interval (in seconds) at which a running batch fit checks whether it has been cancelled
+    cancel_interval = 0.1
+
+    def __init__(self, model, max_workers=None, chunk_size=None, warm_start=True, executor=None, cancel=None):
+        """
+        Arguments:
+            model       (str) : the name of the model in _MODEL_DICT.
+            max_workers (int) : the number of worker processes. Series are fitted in-process if 1.
+                                Defaults to the number of CPUs.
+            chunk_size  (int) : the number of series fitted sequentially by each worker.
+                                Defaults to splitting the series evenly across the workers.
+            warm_start  (bool): whether to start each fit from the solution of the previous fit in its chunk.
+            executor    (ProcessPoolExecutor): the process pool to use, e.g. one shared between batch fits.
+                                Defaults to a pool owned by this wrapper, which is kept until shutdown.
+            cancel      (Event): aborts the batch fit when set, in which case it raises FitCancelled.
+        """
+        self.model_name = model
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.warm_start = warm_start
+        self.executor = executor
+        self._owns_executor = False
+        self.cancel = cancel
+        # a FitWrapper holds the parameter settings
+        self.fw = FitWrapper(None, 0)
+        self.fw.setModel(model)
+        self.manual_values = {}
+
+    def getParameters(self):
+        return self.fw.getParameters()
+
+    def setVary(self, p, value):
+        self.fw.setVary(p, value)
+
+    def setManualValue(self, p, value):
+        """
+        Sets the initial value of a parameter.
+        Parameters without a manual value are guessed from each series.
+        """
+        self.manual_values[p] = value
+
+    def setBounds(self, p, lower=-inf, upper=inf):
+        self.fw.setBounds(p, lower, upper)
+
+    def setMethod(self, method):
+        self.fw.setMethod(method)
+
+    def setLoss(self, loss):
+        self.fw.setLoss(loss)
+
+    def getSettings(self):
+        """
+        Returns the fit settings in a picklable format.
+        """
+        parameters = {}
+        for p in self.getParameters():
+            parameters[p] = (self.fw.getVary(p), self.manual_values.get(p), self.fw.model.parameters[p].bounds)
+        return {'method': self.fw.method, 'loss': self.fw.loss, 'parameters': parameters}
+
+    def fit(self, series_list, indices=None):
+        """
+        Fits the model to each series.
+        This blocks until all fits are done, so should be called via deferToThread from the GUI.
+        Arguments:
+            series_list ([(x, y)])  : the series to fit.
+            indices     ([float])   : the value of the index column for each series (e.g. a scan parameter).
+                                      Defaults to the position of each series in series_list.
+        Returns:
+            BatchFitResult: the table of fitted parameters.
+        """
+        series_list = [(array(x, dtype=float), array(y, dtype=float)) for x, y in series_list]
+        num_series = len(series_list)
+        if indices is None:
+            indices = arange(num_series)
+        settings = self.getSettings()
+        results = self._map(_fit_chunk, series_list, settings, self.warm_start)
+        return self._makeResult(results, indices)
+
+    def fitStarts(self, x, y, starts):
+        """
+        Fits the model to a single series from many starting points, e.g. for a multi-start fit.
+        This blocks until all fits are done, so should be called via deferToThread from the GUI.
+        Arguments:
+            x, y    (np.array)  : the series to fit.
+            starts      ([dict]): the starting values of the varied parameters for each fit.
+                                  Parameters missing from a start use their manual value (or are guessed).
+        Returns:
+            BatchFitResult: the table of fitted parameters, with one row per starting point.
+        """
+        x, y = array(x, dtype=float), array(y, dtype=float)
+        settings = self.getSettings()
+        results = self._map(_fit_starts, starts, settings, x, y)
+        return self._makeResult(results, arange(len(starts)))
+
+    def _map(self, func, items, settings, *args):
+        """
+        Splits items into contiguous chunks (so that warm starts follow the order of the items),
+        and calls func(model_name, settings, chunk, *args) on each chunk across the process pool.
+        Returns:
+            list: the results of all chunks, in order.
+        """
+        num_items = len(items)
+        max_workers = self.max_workers
+        if max_workers is None:
+            from os import cpu_count
+            max_workers = cpu_count() or 1
+        chunk_size = self.chunk_size
+        if chunk_size is None:
+            chunk_size = -(-num_items // max_workers)
+        chunk_size = max(chunk_size, 1)
+        chunks = [items[i: i + chunk_size] for i in range(0, num_items, chunk_size)]
+        if (max_workers == 1) or (len(chunks) <= 1):
+            chunk_results = []
+            for chunk in chunks:
+                self._checkCancelled()
+                chunk_results.append(func(self.model_name, settings, chunk, *args))
+        else:
+            executor = self._getExecutor(max_workers)
+            futures = [executor.submit(func, self.model_name, settings, chunk, *args) for chunk in chunks]
+            try:
+                pending = futures
+                while pending:
+                    self._checkCancelled()
+                    _, pending = wait(pending, timeout=self.cancel_interval, return_when=FIRST_COMPLETED)
+                # the pool may have been shut down (cancelling the chunks) by whoever cancelled the fit
+                self._checkCancelled()
+                chunk_results = [future.result() for future in futures]
+            except BaseException as e:
+                # don't leave the remaining chunks queued in the pool
+                for future in futures:
+                    future.cancel()
+                if isinstance(e, BrokenProcessPool) and self._owns_executor:
+                    self.shutdown()
+                raise
+        return [result for chunk_result in chunk_results for result in chunk_result]
+
+    def _checkCancelled(self):
+        if (self.cancel is not None) and self.cancel.is_set():
+            raise FitCancelled()
+
+    def _getExecutor(self, max_workers):
+        """
+        Returns the process pool, creating one owned by this wrapper if none was given.
+        """
+        if self.executor is None:
+            self.executor = _make_executor(max_workers)
+            self._owns_executor = True
+        return self.executor
+
+    def shutdown(self):
+        """
+        Shuts down the process pool if it is owned by this wrapper.
+        A new pool is created by the next batch fit.
+        """
+        if self._owns_executor and (self.executor is not None):
+            _shutdown_executor(self.executor)
+            self.executor = None
+            self._owns_executor = False
+
+    def _makeResult(self, results, indices):
+        """
+        Creates the table of fitted parameters from the results of each fit.
+        """
+        parameters = self.getParameters()
+        rows = full((len(results), len(parameters) + 1), nan)
+        nfev = 0
+        for i, (values, cost, nfev_tmp) in enumerate(results):
+            if values is not None:
+                rows[i, :-1] = values
+            rows[i, -1] = cost
+            nfev += nfev_tmp
+        return BatchFitResult(parameters, array(indices, dtype=float), rows, nfev)
+
+    def fitDataset(self, dataset):
+        """
+        Fits the model to every trace of a dataset.
+        Arguments:
+            dataset (Dataset): the dataset to fit.
+        Returns:
+            BatchFitResult: the table of fitted parameters, with one row per trace.
+        """
+        data = array(dataset.data)
+        return self.fit([(data[:, 0], data[:, i]) for i in range(1, data.shape[1])])
+
+    @inlineCallbacks
+    def getDirectorySeries(self, data_vault, directory, context=None, index=0):
+        """
+        Gets a trace from every dataset within a data vault directory, in order.
+        Arguments:
+            data_vault          : the data vault server.
+            directory   ([str]) : the directory in the data vault.
+            context             : the labrad context to use.
+            index       (int)   : the index of the trace (i.e. dependent variable) within each dataset.
+        Returns:
+            ([str], [(x, y)]): the names of the datasets and their traces, which can be passed to fit.
+        """
+        yield data_vault.cd(directory, context=context)
+        _, dataset_names = yield data_vault.dir(context=context)
+        series_list = []
+        for dataset_name in dataset_names:
+            yield data_vault.open(dataset_name, context=context)
+            data = yield data_vault.get(context=context)
+            data = array(data)
+            series_list.append((data[:, 0], data[:, index + 1]))
+        returnValue((list(dataset_names), series_list))
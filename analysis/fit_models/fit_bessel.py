@@ -1,9 +1,12 @@
 """
 Fitter class for Bessel functions.
 """
-from scipy.special import jv
+import numpy as np
+from functools import lru_cache
+from scipy.special import jv, jvp
 from numpy import argmax, min
 from .model import Model, ParameterInfo
+from RealSimpleGrapher.analysis.spectral import spectral_peaks
 
 
 class Bessel(Model):
@@ -15,29 +18,47 @@ class Bessel(Model):
             'fwhm': ParameterInfo('fwhm', 2, self.guess_fwhm),
             'offset': ParameterInfo('offset', 3, self.guess_offset),
             'modDepth': ParameterInfo('modDepth', 4, self.guess_modDepth),
-            'driveRF': ParameterInfo('driveRF', 5, self.guess_driveRF)
+            'driveRF': ParameterInfo('driveRF', 5, self.guess_driveRF),
+            'sidebands': ParameterInfo('sidebands', 6, lambda x, y: 6, vary=False)
         }
 
     def model(self, x, p):
         '''
         Base Bessel function modulated spectrum model for micromotion.
-        Using definition from Pruttivarasin thesis. 
-        p = [center, scale, gamma, offset, modulation depth]
+        Using definition from Pruttivarasin thesis.
+        The spectrum is a sum of lorentzians at center + k * driveRF for k in [-sidebands, sidebands],
+        weighted by J_k(modDepth)^2. Large modulation depths need more sidebands.
+        p = [center, scale, gamma, offset, modulation depth, driveRF, sidebands]
         '''
         p[2] = abs(p[2])  # fwhm is positive
-        return p[3] + p[1] * p[2] * 0.5 * ((jv(-6, p[4]) ** 2 / ((x - p[0] - 6 * p[5]) ** 2 + (0.5 * p[2]) ** 2)) +
-                                           (jv(-5, p[4]) ** 2 / ((x - p[0] - 5 * p[5]) ** 2 + (0.5 * p[2]) ** 2)) +
-                                           (jv(-4, p[4]) ** 2 / ((x - p[0] - 4 * p[5]) ** 2 + (0.5 * p[2]) ** 2)) +
-                                           (jv(-3, p[4]) ** 2 / ((x - p[0] - 3 * p[5]) ** 2 + (0.5 * p[2]) ** 2)) +
-                                           (jv(-2, p[4]) ** 2 / ((x - p[0] - 2 * p[5]) ** 2 + (0.5 * p[2]) ** 2)) +
-                                           (jv(-1, p[4]) ** 2 / ((x - p[0] - p[5]) ** 2 + (0.5 * p[2]) ** 2)) +
-                                           (jv(0, p[4]) ** 2 / ((x - p[0]) ** 2 + (0.5 * p[2]) ** 2)) +
-                                           (jv(1, p[4]) ** 2 / ((x - p[0] + p[5]) ** 2 + (0.5 * p[2]) ** 2)) +
-                                           (jv(2, p[4]) ** 2 / ((x - p[0] + 2 * p[5]) ** 2 + (0.5 * p[2]) ** 2)) +
-                                           (jv(3, p[4]) ** 2 / ((x - p[0] + 3 * p[5]) ** 2 + (0.5 * p[2]) ** 2)) +
-                                           (jv(4, p[4]) ** 2 / ((x - p[0] + 4 * p[5]) ** 2 + (0.5 * p[2]) ** 2)) +
-                                           (jv(5, p[4]) ** 2 / ((x - p[0] + 5 * p[5]) ** 2 + (0.5 * p[2]) ** 2)) +
-                                           (jv(6, p[4]) ** 2 / ((x - p[0] + 6 * p[5]) ** 2 + (0.5 * p[2]) ** 2)))
+        center, scale, fwhm, offset, mod_depth, drive, sidebands = p[:7]
+        orders, weights, _ = sideband_weights(mod_depth, sidebands)
+        gamma = 0.5 * fwhm
+        detuning = np.asarray(x)[np.newaxis, :] - center + orders[:, np.newaxis] * drive
+        return offset + scale * gamma * np.dot(weights, 1. / (detuning ** 2 + gamma ** 2))
+
+    def jacobian(self, x, p):
+        '''
+        Analytic derivatives of the model w.r.t. all parameters except sidebands.
+        The spectrum is a sum of lorentzians L_k = 1 / ((x - center + k * driveRF)^2 + gamma^2)
+        weighted by J_k(modDepth)^2, where gamma = fwhm / 2.
+        '''
+        center, scale, fwhm, offset, mod_depth, drive, sidebands = p[:7]
+        orders, weights, d_weights = sideband_weights(mod_depth, sidebands)
+        gamma = 0.5 * abs(fwhm)
+        detuning = np.asarray(x)[np.newaxis, :] - center + orders[:, np.newaxis] * drive
+        lorentz = 1. / (detuning ** 2 + gamma ** 2)
+        spectrum = np.dot(weights, lorentz)
+        # derivative of each lorentzian w.r.t. its detuning, negated
+        d_lorentz = 2 * detuning * lorentz ** 2
+        d_center = scale * gamma * np.dot(weights, d_lorentz)
+        d_scale = gamma * spectrum
+        d_gamma = scale * (spectrum - 2 * gamma ** 2 * np.dot(weights, lorentz ** 2))
+        d_fwhm = 0.5 * np.sign(fwhm) * d_gamma
+        d_offset = np.ones_like(spectrum)
+        d_mod_depth = scale * gamma * np.dot(d_weights, lorentz)
+        d_drive = -scale * gamma * np.dot(weights * orders, d_lorentz)
+        return [d_center, d_scale, d_fwhm, d_offset, d_mod_depth, d_drive, None]
 
     def guess_center(self, x, y):
         max_index = argmax(y)
@@ -55,5 +76,32 @@ class Bessel(Model):
     def guess_modDepth(self, x, y):
         return 0.2
 
+    def frequency_candidates(self, x, y):
+        # sidebands spaced by driveRF form a comb, whose spectrum peaks at multiples of 1 / driveRF
+        return {'driveRF': [1. / f for f in spectral_peaks(x, y) if f > 0]}
+
     def guess_driveRF(self, x, y):
         return 48.537
+
+
+def sideband_weights(mod_depth, sidebands):
+    '''
+    Returns the sideband orders k in [-sidebands, sidebands], their weights J_k(mod_depth)^2,
+    and the derivatives of the weights w.r.t. mod_depth.
+    '''
+    return _sideband_weights(float(mod_depth), int(round(sidebands)))
+
+
+@lru_cache(maxsize=128)
+def _sideband_weights(mod_depth, sidebands):
+    '''
+    Cached, since the weights only change with the parameters and not with x.
+    The arrays are shared between calls, so are read-only.
+    '''
+    orders = np.arange(-abs(sidebands), abs(sidebands) + 1)
+    bessel = jv(orders, mod_depth)
+    weights = bessel ** 2
+    d_weights = 2 * bessel * jvp(orders, mod_depth)
+    for array in (orders, weights, d_weights):
+        array.setflags(write=False)
+    return orders, weights, d_weights
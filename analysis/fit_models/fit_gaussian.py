@@ -1,7 +1,7 @@
 """
 Fitter class for Linear fits.
 """
-from numpy import exp, argmax
+from numpy import exp, argmax, ones_like
 from .model import Model, ParameterInfo
 
 
@@ -30,6 +30,20 @@ class Gaussian(Model):
         b = p[3]
         return A * exp(-(x - mu) ** 2 / (2 * sigma_squared)) + b
 
+    def jacobian(self, x, p):
+        '''
+        Analytic derivatives of the model w.r.t. all parameters.
+        '''
+        mu = p[0]
+        A = p[1]
+        sigma = p[2]
+        gaussian = exp(-(x - mu) ** 2 / (2 * sigma ** 2))
+        d_mu = A * gaussian * (x - mu) / sigma ** 2
+        d_A = gaussian
+        d_sigma = A * gaussian * (x - mu) ** 2 / sigma ** 3
+        d_b = ones_like(gaussian)
+        return [d_mu, d_A, d_sigma, d_b]
+
     def guess_mean(self, x, y):
         max_index = argmax(y)
         return x[max_index]
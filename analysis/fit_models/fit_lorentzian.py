@@ -1,7 +1,7 @@
 """
 Fitter class for Lorentzians.
 """
-from numpy import argmax, min
+from numpy import argmax, min, sign, ones_like
 from .model import Model, ParameterInfo
 
 
@@ -26,6 +26,20 @@ class Lorentzian(Model):
         p[2] = abs(p[2])  # fwhm is positive
         return p[3] + p[1] * 0.5 * p[2] / ((x - p[0]) ** 2 + (0.5 * p[2]) ** 2)
 
+    def jacobian(self, x, p):
+        '''
+        Analytic derivatives of the model w.r.t. all parameters.
+        '''
+        center, scale, fwhm, offset = p[:4]
+        half_width = 0.5 * abs(fwhm)
+        detuning = x - center
+        denominator = detuning ** 2 + half_width ** 2
+        d_center = scale * half_width * 2 * detuning / denominator ** 2
+        d_scale = half_width / denominator
+        d_fwhm = 0.5 * sign(fwhm) * scale * (detuning ** 2 - half_width ** 2) / denominator ** 2
+        d_offset = ones_like(d_scale)
+        return [d_center, d_scale, d_fwhm, d_offset]
+
     def guess_center(self, x, y):
         max_index = argmax(y)
         return x[max_index]
@@ -3,6 +3,7 @@ Fitter class for Rabi flops.
 """
 import numpy as np
 from .model import Model, ParameterInfo
+from RealSimpleGrapher.analysis.spectral import spectral_peaks
 
 from RealSimpleGrapher.analysis.rabi import rabi_coupling as rc
 from RealSimpleGrapher.analysis.rabi import motional_distribution as md
@@ -10,6 +11,11 @@ from RealSimpleGrapher.analysis.rabi import motional_distribution as md
 
 class Rabi(Model):
 
+    # maximum population allowed outside the truncated hilbert space
+    tolerance = 1e-6
+    # maximum dimension of the truncated hilbert space
+    max_nmax = 10000
+
     def __init__(self):
         self.parameters = {
             'omega_rabi': ParameterInfo('f_rabi', 0, self.guess_omega_rabi),
@@ -28,13 +34,12 @@ class Rabi(Model):
         sideband_order = p[4]
         excitation_scaling = p[5]
         
-        nmax = 1000
+        # only keep the fock states which hold population
+        p_n, _ = md.thermal_truncated(nbar, self.tolerance, self.max_nmax)
+        nmax = len(p_n)
 
         omega = rc.compute_rabi_coupling(eta, sideband_order, nmax)
         ones = np.ones_like(x)
-        p_n = md.thermal(nbar, nmax)
-        # if 1 - p_n.sum() > 1e-6:
-        #     raise Exception ('Hilbert space too small, missing population')
         if delta == 0:
             #prevents division by zero if delta == 0, omega == 0
             effective_omega = 1.
@@ -45,12 +50,59 @@ class Rabi(Model):
         result = excitation_scaling * result
         return result
 
+    def jacobian(self, x, p):
+        '''
+        Analytic derivatives w.r.t. omega_rabi, nbar, and excitation_scaling.
+        The remaining derivatives are computed numerically.
+        '''
+        omega_rabi = p[0]
+        nbar = p[1]
+        eta = p[2]
+        delta = p[3]
+        sideband_order = p[4]
+        excitation_scaling = p[5]
+
+        p_n, _ = md.thermal_truncated(nbar, self.tolerance, self.max_nmax)
+        omega = rc.compute_rabi_coupling(eta, sideband_order, len(p_n))
+        omega_gen = np.sqrt(omega**2 + delta**2)
+        if delta == 0:
+            effective_omega = 1.
+        else:
+            effective_omega = omega/omega_gen
+        phase = np.outer(omega_gen*omega_rabi/2, x)
+        sin_squared = np.sin(phase)**2
+        flop = np.dot(p_n * effective_omega, sin_squared)
+        # d/dw sin^2(W w x/2) = sin(W w x) * W x/2
+        d_omega_rabi = excitation_scaling * np.dot(p_n * effective_omega * omega_gen/2, np.sin(2*phase)) * x
+        # d/dnbar p_n = p_n * (n - nbar) / (nbar * (nbar + 1))
+        d_nbar = None
+        if nbar > 0:
+            n = np.arange(len(p_n))
+            d_p_n = p_n * (n - nbar) / (nbar * (nbar + 1.))
+            d_nbar = excitation_scaling * np.dot(d_p_n * effective_omega, sin_squared)
+        return [d_omega_rabi, d_nbar, None, None, None, flop]
+
+    def warnings(self, p):
+        '''
+        Warns if max_nmax truncates more than tolerance of the thermal population at nbar = p[1].
+        '''
+        p_n, truncation_error = md.thermal_truncated(p[1], self.tolerance, self.max_nmax)
+        if truncation_error > self.tolerance:
+            return ['thermal distribution truncated to max_nmax = {:d} fock states, '
+                    '{:.2g} of the population is missing'.format(len(p_n), truncation_error)]
+        return []
+
     def guess_omega_rabi(self, x, y):
         '''
-        Take the first time the flop goes above the average excitation of the whole scan
+        The excitation oscillates as sin(omega_rabi * t / 2) ** 2, i.e. at omega_rabi / (2 * pi),
+        so take the largest peak in the spectrum of the flop.
+        Otherwise take the first time the flop goes above the average excitation of the whole scan
         to be pi/4
         '''
-        
+        peaks = spectral_peaks(x, y, num_peaks=1)
+        if len(peaks) > 0:
+            return 2 * np.pi * peaks[0]
+
         mean = np.mean(y)
         for x0, y0 in zip(x,y):
             if y0 > mean: break
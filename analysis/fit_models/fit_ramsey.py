@@ -1,17 +1,18 @@
 """
 Fitter class for Ramsey experiments.
 """
-from numpy import pi, exp, cos
+from numpy import pi, exp, cos, isfinite
 from .model import Model, ParameterInfo
+from RealSimpleGrapher.analysis.spectral import spectral_peaks, estimate_oscillation
 
 
 class RamseyDecay(Model):
 
     def __init__(self):
         self.parameters = {
-            'freq': ParameterInfo('freq', 0, lambda x, y: 10000, vary=True),
-            'tau': ParameterInfo('tau', 1, lambda x, y: 1000, vary=True),
-            'startfrom': ParameterInfo('startfrom', 2, lambda x, y: 0, vary=True),
+            'freq': ParameterInfo('freq', 0, self.guess_freq, vary=True),
+            'tau': ParameterInfo('tau', 1, self.guess_tau, vary=True),
+            'startfrom': ParameterInfo('startfrom', 2, self.guess_startfrom, vary=True),
             'decayto': ParameterInfo('decayto', 3, lambda x, y: 0.5, vary=False),
         }
 
@@ -23,3 +24,26 @@ class RamseyDecay(Model):
         decayto = p[3]
 
         return (startfrom - decayto) * exp(-t / tau) * cos(w * t) + decayto
+
+    def frequency_candidates(self, x, y):
+        # x is in us
+        return {'freq': [1e6 * f for f in spectral_peaks(x, y)]}
+
+    def guess_freq(self, x, y):
+        oscillation = estimate_oscillation(x, y)
+        if oscillation is None:
+            return 10000
+        return 1e6 * oscillation.frequency
+
+    def guess_tau(self, x, y):
+        oscillation = estimate_oscillation(x, y, decay=True)
+        if (oscillation is None) or (not isfinite(oscillation.tau)):
+            return 1000
+        return oscillation.tau
+
+    def guess_startfrom(self, x, y):
+        # the model has no phase, so use the estimated value at t = 0
+        oscillation = estimate_oscillation(x, y, decay=True)
+        if oscillation is None:
+            return 0
+        return oscillation.offset + oscillation.amplitude * cos(oscillation.phase)
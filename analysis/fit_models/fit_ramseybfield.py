@@ -3,6 +3,7 @@ Fitter class for Ramsey B-field.
 """
 from numpy import pi, cos, exp
 from .model import Model, ParameterInfo
+from RealSimpleGrapher.analysis.spectral import spectral_peaks
 
 
 class RamseyBfield(Model):
@@ -29,3 +30,8 @@ class RamseyBfield(Model):
         wd = 2 * pi * p[5]
 
         return (startfrom - decayto) * exp(-t / tau) * cos(wd * t - (wB / w) * (cos(w * t) - 1)) + decayto
+
+    def frequency_candidates(self, x, y):
+        # the spectrum has peaks at |detuning +/- k * freq|, and x is in us
+        peaks = [1e6 * f for f in spectral_peaks(x, y)]
+        return {'freq': peaks, 'detuning': [0.] + peaks}
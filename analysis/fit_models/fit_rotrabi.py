@@ -10,6 +10,11 @@ import scipy.constants as scc
 
 class RotRabi(Model):
 
+    # maximum memory of the temporaries created for each chunk of l values (in bytes)
+    chunk_bytes = 16 * 2 ** 20
+    # whether to use the symmetry of the l distribution if delta is zero
+    use_symmetry = True
+
     def __init__(self):
         self.parameters = {
             'omega_rabi': ParameterInfo('f_rabi', 0, self.guess_omega_rabi),
@@ -31,15 +36,68 @@ class RotRabi(Model):
         delta = p[5]
         scale = p[6]
 
-        # calculate the radius of the ion 'ring' (half the distance between the ions)
-        r = (scc.e ** 2 / (40 * scc.atomic_mass * 4 * math.pi ** 2 * (
-                    f_trap ** 2 - f_rot ** 2) * 1e12 * 16 * math.pi * scc.epsilon_0)) ** (1. / 3)
-        self.omega_r = scc.hbar / (4 * 40 * scc.atomic_mass * r ** 2)
+        self.omega_r = self.calc_omega_r(f_trap, f_rot)
 
         result = self.rot_rabi_flop(1e-6 * x, sideband_order, stdev_l, omega_rabi, delta, scale)
 
         return result
 
+    def jacobian(self, x, p):
+        """
+        Analytic derivatives w.r.t. omega_rabi, delta, and scale.
+        The remaining derivatives are computed numerically.
+        """
+        omega_rabi = p[0]
+        stdev_l = p[1]
+        sideband_order = p[2]
+        f_trap = p[3]
+        f_rot = p[4]
+        delta = p[5]
+        scale = p[6]
+
+        self.omega_r = self.calc_omega_r(f_trap, f_rot)
+        times = 1e-6 * x
+        sigma_l = min(stdev_l, 3000.0)
+
+        # Convert to SI units
+        Omega = omega_rabi * 2 * np.pi * 1e6
+        delta_rad = delta * 2 * np.pi * 1e3
+
+        (l_vals, weights) = self.calc_ls_weights(sigma_l, delta_rad)
+        delta_ls = 2 * self.omega_r * sideband_order * l_vals - delta_rad
+        Omega_gen_squared = Omega ** 2 + delta_ls ** 2
+        Omega_gen = np.sqrt(Omega_gen_squared)
+
+        # each term is Omega^2 / W^2 * sin^2(W t / 2), where W is the generalized rabi frequency
+        flop = np.zeros(len(times))
+        d_Omega = np.zeros(len(times))
+        d_delta_l = np.zeros(len(times))
+        for chunk in self.chunks(len(l_vals), len(times), 3):
+            phase = np.outer(Omega_gen[chunk] / 2, times)
+            sin_squared = np.sin(phase) ** 2
+            sin_double = np.sin(2 * phase)
+            w, W2, W, d = weights[chunk], Omega_gen_squared[chunk], Omega_gen[chunk], delta_ls[chunk]
+            flop += np.dot(w * Omega ** 2 / W2, sin_squared)
+            d_Omega += (np.dot(w * (2 * Omega / W2 - 2 * Omega ** 3 / W2 ** 2), sin_squared)
+                        + np.dot(w * Omega ** 3 / (2 * W2 * W), sin_double) * times)
+            d_delta_l += (np.dot(w * (-2 * Omega ** 2 * d / W2 ** 2), sin_squared)
+                          + np.dot(w * Omega ** 2 * d / (2 * W2 * W), sin_double) * times)
+        if self.use_symmetry and (delta_rad == 0):
+            # the excitation is even in delta, so the contributions of l and -l cancel
+            d_delta_l[:] = 0
+        d_omega_rabi = scale * 2 * np.pi * 1e6 * d_Omega
+        d_delta = -scale * 2 * np.pi * 1e3 * d_delta_l
+        return [d_omega_rabi, None, None, None, None, d_delta, flop]
+
+    def calc_omega_r(self, f_trap, f_rot):
+        """
+        Returns the rotational energy scale hbar / (2 * I) of the ion ring.
+        """
+        # calculate the radius of the ion 'ring' (half the distance between the ions)
+        r = (scc.e ** 2 / (40 * scc.atomic_mass * 4 * math.pi ** 2 * (
+                    f_trap ** 2 - f_rot ** 2) * 1e12 * 16 * math.pi * scc.epsilon_0)) ** (1. / 3)
+        return scc.hbar / (4 * 40 * scc.atomic_mass * r ** 2)
+
     def rot_rabi_flop(self, times, order, sigma_l, Omega_MHz, delta_kHz=0.0, scale=1.0):
         if sigma_l > 3000:
             sigma_l = 3000.0
@@ -49,12 +107,36 @@ class RotRabi(Model):
         delta = delta_kHz * 2 * np.pi * 1e3
 
         # Get distribution of l's, their respective detunings, and calculate the excitation vs. time
-        (l_vals, c_ls) = self.calc_ls_cls(sigma_l)
+        (l_vals, weights) = self.calc_ls_weights(sigma_l, delta)
         delta_ls = 2 * self.omega_r * order * l_vals - delta  # Array of detunings, one for each l
-        exc = scale * np.sum(np.outer(c_ls ** 2 * Omega ** 2 / (Omega ** 2 + delta_ls ** 2), np.ones(len(times))) \
-                             * np.sin(np.outer(np.sqrt(Omega ** 2 + delta_ls ** 2) / 2, times)) ** 2, axis=0)
+        Omega_gen_squared = Omega ** 2 + delta_ls ** 2
+
+        # sum over chunks of l's, so memory doesn't grow with sigma_l
+        exc = np.zeros(len(times))
+        for chunk in self.chunks(len(l_vals), len(times), 2):
+            exc += np.dot(weights[chunk] * Omega ** 2 / Omega_gen_squared[chunk],
+                          np.sin(np.outer(np.sqrt(Omega_gen_squared[chunk]) / 2, times)) ** 2)
 
-        return exc
+        return scale * exc
+
+    def calc_ls_weights(self, sigma_l, delta):
+        """Returns the l values and their weights |c_l|^2 (see calc_ls_cls).
+        If delta is zero, the excitation of -l equals that of l, since the detunings are antisymmetric
+        and the weights symmetric in l. In that case (and if use_symmetry is set) only the l >= 0 are
+        returned, with the weights of l > 0 doubled, which halves the work."""
+        (l_vals, c_ls) = self.calc_ls_cls(sigma_l)
+        weights = np.abs(c_ls) ** 2
+        if self.use_symmetry and (delta == 0):
+            positive = l_vals >= 0
+            l_vals, weights = l_vals[positive], weights[positive]
+            weights[l_vals > 0] *= 2
+        return (l_vals, weights)
+
+    def chunks(self, num_ls, num_times, temporaries):
+        """Returns slices which split the l values into chunks, so that the (chunk, num_times)
+        temporaries of each chunk take at most chunk_bytes of memory."""
+        size = max(1, int(self.chunk_bytes // (8 * temporaries * max(num_times, 1))))
+        return [slice(i, i + size) for i in range(0, num_ls, size)]
 
     def calc_ls_cls(self, sigma_l):
         """Returns an array of l values and their amplitudes, given a standard deviation sigma_l
@@ -10,6 +10,11 @@ import scipy.constants as scc
 
 class RotRamsey(Model):
 
+    # maximum memory of the temporaries created for each chunk of l values (in bytes)
+    chunk_bytes = 16 * 2**20
+    # whether to use the symmetry of the l distribution if delta is zero
+    use_symmetry = True
+
     def __init__(self):
         self.parameters = {
             'omega_rabi': ParameterInfo('f_rabi', 0, lambda x, y: 0.01, vary=True),
@@ -31,14 +36,72 @@ class RotRamsey(Model):
         delta = p[5]
         scale = p[6]
 
-        #calculate the radius of the ion 'ring' (half the distance between the ions)        
-        r = (scc.e**2/(40*scc.atomic_mass*4*math.pi**2*(f_trap**2-f_rot**2)*1e12*16*math.pi*scc.epsilon_0))**(1./3)
-        self.omega_r = scc.hbar/(4*40*scc.atomic_mass*r**2)
+        self.omega_r = self.calc_omega_r(f_trap, f_rot)
 
         result = self.rot_ramsey(1e-6*x,sideband_order,stdev_l,omega_rabi,delta,scale)
 
         return result
 
+    def jacobian(self, x, p):
+        """
+        Analytic derivatives w.r.t. omega_rabi and scale.
+        The remaining derivatives are computed numerically.
+        """
+        omega_rabi = p[0]
+        stdev_l = p[1]
+        sideband_order = p[2]
+        f_trap = p[3]
+        f_rot = p[4]
+        delta = p[5]
+        scale = p[6]
+
+        self.omega_r = self.calc_omega_r(f_trap, f_rot)
+        times = 1e-6*x
+        sigma_l = min(stdev_l, 3000.0)
+
+        # Convert to SI units
+        Omega = omega_rabi*2*np.pi*1e6
+        delta_rad = delta*2*np.pi*1e3
+
+        (l_vals, weights) = self.calc_ls_weights(sigma_l, delta)
+        delta_ls = 2*self.omega_r*sideband_order*l_vals - delta_rad
+        Omega_gens = np.sqrt(Omega**2 + delta_ls**2)
+        u1s = np.pi*Omega_gens/(4*Omega)
+
+        # the excitation of each l is (A * (B cos(u2) - C sin(u2)))^2
+        A = 2*Omega/Omega_gens**2*np.sin(u1s)
+        B = Omega_gens*np.cos(u1s)
+        C = delta_ls*np.sin(u1s)
+
+        # derivatives w.r.t. Omega (u2 doesn't depend on Omega)
+        d_Omega_gens = Omega/Omega_gens
+        d_u1s = -np.pi*delta_ls**2/(4*Omega**2*Omega_gens)
+        d_A = 2*np.sin(u1s)*(1/Omega_gens**2 - 2*Omega**2/Omega_gens**4) + 2*Omega/Omega_gens**2*np.cos(u1s)*d_u1s
+        d_B = d_Omega_gens*np.cos(u1s) - Omega_gens*np.sin(u1s)*d_u1s
+        d_C = delta_ls*np.cos(u1s)*d_u1s
+
+        flop = np.zeros(len(times))
+        d_flop = np.zeros(len(times))
+        for chunk in self.chunks(len(l_vals), len(times), 6):
+            u2s = 1/2.0*np.outer(delta_ls[chunk], times)
+            cos_u2s = np.cos(u2s)
+            sin_u2s = np.sin(u2s)
+            amplitude = A[chunk, np.newaxis]*(B[chunk, np.newaxis]*cos_u2s - C[chunk, np.newaxis]*sin_u2s)
+            d_amplitude = (d_A[chunk, np.newaxis]*(B[chunk, np.newaxis]*cos_u2s - C[chunk, np.newaxis]*sin_u2s)
+                           + A[chunk, np.newaxis]*(d_B[chunk, np.newaxis]*cos_u2s - d_C[chunk, np.newaxis]*sin_u2s))
+            flop += np.dot(weights[chunk], amplitude**2)
+            d_flop += np.dot(weights[chunk], 2*amplitude*d_amplitude)
+        d_omega_rabi = scale*2*np.pi*1e6*d_flop
+        return [d_omega_rabi, None, None, None, None, None, flop]
+
+    def calc_omega_r(self, f_trap, f_rot):
+        """
+        Returns the rotational energy scale hbar / (2 * I) of the ion ring.
+        """
+        #calculate the radius of the ion 'ring' (half the distance between the ions)
+        r = (scc.e**2/(40*scc.atomic_mass*4*math.pi**2*(f_trap**2-f_rot**2)*1e12*16*math.pi*scc.epsilon_0))**(1./3)
+        return scc.hbar/(4*40*scc.atomic_mass*r**2)
+
     def rot_ramsey(self, times, order, sigma_l, Omega_MHz, delta_kHz=0.0, scale=1.0):
         if sigma_l > 3000:
             sigma_l = 3000.0
@@ -48,17 +111,41 @@ class RotRamsey(Model):
         delta = delta_kHz*2*np.pi*1e3
         
         # Get distribution of l's, their respective detunings, and calculate the excitation vs. time
-        (l_vals, c_ls) = self.calc_ls_cls(sigma_l)
+        (l_vals, weights) = self.calc_ls_weights(sigma_l, delta)
         delta_ls = 2*self.omega_r*order*l_vals - delta  # Array of detunings, one for each l
         Omega_gens = np.sqrt(Omega**2 + delta_ls**2) #generalized Rabi frequencies
         u1s = np.pi*Omega_gens/(4*Omega)
-        u2s = 1/2.0*np.outer(delta_ls, times)
-        exc = scale * np.sum(np.outer(np.abs(c_ls)**2, np.ones(len(times)))
-                           *(np.outer(2*Omega/Omega_gens**2*np.sin(u1s), np.ones(len(times)))
-                           *(np.outer(Omega_gens*np.cos(u1s), np.ones(len(times))) * np.cos(u2s)
-                            -np.outer(delta_ls*np.sin(u1s), np.ones(len(times))) * np.sin(u2s)    ))**2, axis=0)
+        A = 2*Omega/Omega_gens**2*np.sin(u1s)
+        B = Omega_gens*np.cos(u1s)
+        C = delta_ls*np.sin(u1s)
+
+        # sum over chunks of l's, so memory doesn't grow with sigma_l
+        exc = np.zeros(len(times))
+        for chunk in self.chunks(len(l_vals), len(times), 3):
+            u2s = 1/2.0*np.outer(delta_ls[chunk], times)
+            amplitude = A[chunk, np.newaxis]*(B[chunk, np.newaxis]*np.cos(u2s) - C[chunk, np.newaxis]*np.sin(u2s))
+            exc += np.dot(weights[chunk], amplitude**2)
+
+        return scale * exc
+
+    def calc_ls_weights(self, sigma_l, delta):
+        """Returns the l values and their weights |c_l|^2 (see calc_ls_cls).
+        If delta is zero, the excitation of -l equals that of l, since the detunings are antisymmetric
+        and the weights symmetric in l. In that case (and if use_symmetry is set) only the l >= 0 are
+        returned, with the weights of l > 0 doubled, which halves the work."""
+        (l_vals, c_ls) = self.calc_ls_cls(sigma_l)
+        weights = np.abs(c_ls)**2
+        if self.use_symmetry and (delta == 0):
+            positive = l_vals >= 0
+            l_vals, weights = l_vals[positive], weights[positive]
+            weights[l_vals > 0] *= 2
+        return (l_vals, weights)
 
-        return exc
+    def chunks(self, num_ls, num_times, temporaries):
+        """Returns slices which split the l values into chunks, so that the (chunk, num_times)
+        temporaries of each chunk take at most chunk_bytes of memory."""
+        size = max(1, int(self.chunk_bytes // (8*temporaries*max(num_times, 1))))
+        return [slice(i, i + size) for i in range(0, num_ls, size)]
 
     def calc_ls_cls(self, sigma_l):
         """Returns an array of l values and their amplitudes, given a standard deviation sigma_l
@@ -3,14 +3,15 @@ Fitter class for Sinusoids.
 """
 from numpy import pi, sin
 from .model import Model, ParameterInfo
+from RealSimpleGrapher.analysis.spectral import estimate_sinusoid
 
 
 class Sinusoid2(Model):
 
     def __init__(self):
         self.parameters = {
-            'contrast': ParameterInfo('contrast', 0, lambda x, y: 0.5, vary=True),
-            'phi0': ParameterInfo('phi0', 1, lambda x, y: 0, vary=True),
+            'contrast': ParameterInfo('contrast', 0, self.guess_contrast, vary=True),
+            'phi0': ParameterInfo('phi0', 1, self.guess_phi0, vary=True),
             'offset': ParameterInfo('offset', 2, lambda x, y: 0, vary=False),
         }
 
@@ -22,3 +23,16 @@ class Sinusoid2(Model):
         phi_rad = x * pi / 180.0
         phi0_rad = phi0 * pi / 180.0
         return 0.5 + contrast / 2.0 * sin(2 * (phi_rad - phi0_rad)) + offset
+
+    def frequency_candidates(self, x, y):
+        # the frequency is fixed, so spread the phase over one period
+        return {'phi0': [180 * k / 8. for k in range(8)]}
+
+    def guess_contrast(self, x, y):
+        oscillation = estimate_sinusoid(x, y, 2 / 360.)
+        return 2 * oscillation.amplitude
+
+    def guess_phi0(self, x, y):
+        # amplitude * cos(2 * phi + phase) = amplitude * sin(2 * (phi - phi0)), with phi in degrees
+        oscillation = estimate_sinusoid(x, y, 2 / 360.)
+        return ((-oscillation.phase * 180 / pi - 90) / 2) % 180
@@ -3,23 +3,64 @@ Fitting wrapper class.
 """
 __all__ = ["Model", "ParameterInfo"]
 
+from numpy import sqrt, finfo, zeros, asarray, abs as np_abs
+
 
 class ParameterInfo(object):
-    def __init__(self, parameter, index, guess_func, vary=True):
+    def __init__(self, parameter, index, guess_func, vary=True, bounds=None):
         self.parameter = parameter
         self.vary = vary
         self.guess_func = guess_func
         self.index = index
+        # (lower, upper) limits on the fitted value, or None if unbounded
+        self.bounds = bounds
 
 
 class Model(object):
 
+    # compiled (template, varied, fixed) layout of the parameters, see compile_layout
+    _layout = None
+    # maps parameter index to ParameterInfo, built on first use by param_from_index
+    _index_map = None
+
     def __init__(self):
         pass
 
     def model(self):
         pass
 
+    def jacobian(self, x, p):
+        '''
+        Optionally overridden by subclasses to provide analytic derivatives of the model.
+        Returns a list with one entry for each parameter (in order of index), where each
+        entry is either the derivative of the model w.r.t. the parameter evaluated at x,
+        or None if the derivative isn't available analytically.
+        Returning None means no derivatives are available.
+        '''
+        return None
+
+    def frequency_candidates(self, x, y):
+        '''
+        Optionally overridden by oscillatory models, whose residuals have many local minima.
+        Returns a dict mapping parameter names to lists of candidate starting values
+        (e.g. frequencies of peaks in the spectrum of the data), used to seed multi-start fits.
+        '''
+        return {}
+
+    def warnings(self, p):
+        '''
+        Optionally overridden by models which approximate the model, e.g. by truncation.
+        Returns a list of messages describing where the model is inaccurate
+        for the full parameter list p, e.g. at the fitted values.
+        '''
+        return []
+
+    def has_jacobian(self):
+        '''
+        Whether the model provides analytic derivatives.
+        '''
+        return type(self).jacobian is not Model.jacobian
+
     def guess_param(self, param, x, y):
         return self.parameters[param].guess_func(x, y)
 
@@ -33,58 +74,111 @@ class Model(object):
         N - k parameters.
 
         Procedure:
-        full_params is an empty N-element list passed to model()
-        First, fill in the parameters which are not varied
-        into full_params.
-        Then, whichever places are unfilled in full_params,
-        fill them with the elements of p, an N - k parameter list.
-        Evaluate model on full_params.
+        full_parameters() copies the template of the compiled layout,
+        which already holds the k fixed parameters at their manual values,
+        and places the N - k elements of p at the positions of the varied parameters.
+        Evaluate model on the resulting N-element list.
+        The layout is compiled once per fit (see compile_layout), so
+        each evaluation is a list copy and N - k assignments.
+        '''
+
+        return self.model(x, self.full_parameters(p))
+
+    def reduced_jacobian(self, x, p):
+        '''
+        Returns the jacobian of reduced_model(), i.e. a (len(x), len(p)) array holding
+        the derivatives of the model w.r.t. the varied parameters.
+        Derivatives which the model doesn't provide analytically are
+        computed using forward finite differences.
+        '''
+        full_params = self.full_parameters(p)
+        columns = self.jacobian(x, full_params.copy())
+        if columns is None:
+            columns = [None for k in full_params]
+
+        varied_positions = self._get_layout()[1]
+        jac = zeros((len(x), len(varied_positions)))
+        f0 = None
+        for i, index in enumerate(varied_positions):
+            if columns[index] is not None:
+                jac[:, i] = columns[index]
+                continue
+            # finite difference
+            if f0 is None:
+                f0 = self.model(x, full_params.copy())
+            step = sqrt(finfo(float).eps) * max(1., np_abs(full_params[index]))
+            params_step = full_params.copy()
+            params_step[index] = full_params[index] + step
+            jac[:, i] = (self.model(x, params_step) - f0) / step
+        return jac
+
+    def full_parameters(self, p):
         '''
+        Returns the full parameter list for model(), where
+        the varied parameters are taken from p and the fixed parameters
+        are taken from their manual values.
+        A new list is returned on each call, since some models modify their parameters.
+        '''
+        template, varied, fixed = self._get_layout()
+        full_params = template[:]
+        # plain floats keep the scalar arithmetic within the models fast
+        for index, value in zip(varied, asarray(p, dtype=float).tolist()):
+            full_params[index] = value
+        return full_params
+
+    def compile_layout(self):
+        '''
+        Compiles the fixed/varied layout of the parameters into index lists and a
+        template list holding the manual values of the fixed parameters, so that
+        reduced_model() doesn't have to walk the parameter dict on every call.
+        Used by FitWrapper.doFit for the duration of a fit. Changes to vary or to the
+        manual values are ignored until the layout is compiled again or cleared.
+        '''
+        self._layout = self._make_layout()
 
-        n = len(self.parameters.keys())
-        full_params = [None for k in range(n)]
+    def clear_layout(self):
+        '''
+        Clears the compiled layout, so that the parameters are read on each call.
+        '''
+        self._layout = None
 
-        for key in self.parameters.keys():
-            if not self.parameters[key].vary:
-                index = self.parameters[key].index
-                value = self.parameters[key].manual_value
-                full_params[index] = value
+    def _get_layout(self):
+        if self._layout is not None:
+            return self._layout
+        return self._make_layout()
 
-        varied_positions = self.varied_positions()
-        for index, k in zip(varied_positions, p):
-            full_params[index] = k
-        return self.model(x, full_params)
+    def _make_layout(self):
+        template = [None for k in range(len(self.parameters))]
+        varied = []
+        fixed = []
+        for param in self.parameters.values():
+            if param.vary:
+                varied.append(param.index)
+            else:
+                fixed.append(param.index)
+                template[param.index] = param.manual_value
+        return template, sorted(varied), sorted(fixed)
 
     def varied_positions(self):
         '''
         Indices of the parameters to vary in the fit.
         '''
-        varied = []
-        for param in self.parameters.keys():
-            if self.parameters[param].vary:
-                varied.append(self.parameters[param].index)
-        varied = sorted(varied)
-        return varied
+        return list(self._get_layout()[1])
 
     def fixed_positions(self):
         '''
         Indices of the parameters to hold fixed in the fit.
         '''
-        fixed = []
-        for param in self.parameters.keys():
-            if not self.parameters[param].vary:
-                fixed.append(self.parameters[param].index)
-        fixed = sorted(fixed)
-        return fixed
+        return list(self._get_layout()[2])
 
     def param_from_index(self, index):
         '''
         Return a parameter from the index.
         '''
-
-        for param in self.parameters.keys():
-            if self.parameters[param].index == index:
-                return self.parameters[param]
-
-        # parameter not found
-        raise Exception('Parameter not found')
+        if self._index_map is None:
+            self._index_map = {param.index: param for param in self.parameters.values()}
+        try:
+            return self._index_map[index]
+        except KeyError:
+            # parameter not found
+            raise Exception('Parameter not found')
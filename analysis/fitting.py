@@ -3,10 +3,17 @@ Generic fitter class.
 FitWrapper is used by TraceListWidget.FitWindowWidget.FitWindow.
 """
 
-__all__ = ["FitWrapper"]
+__all__ = ["FitWrapper", "FitResult", "MultiStartResult", "FitCancelled"]
 
 from scipy import optimize
-from numpy import linspace, zeros
+from time import perf_counter
+from threading import Event
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
+from numpy import linspace, zeros, inf, nan, clip, isfinite, sqrt, diag, full, finfo, mean, std, cov,\
+    atleast_2d, column_stack, arange, tile, nanargmin, nanmin, sum as np_sum, max as np_max, abs as np_abs, all as np_all
+from numpy.linalg import svd
+from numpy.random import default_rng
 
 from .fit_models import *
 
@@ -27,16 +34,205 @@ _MODEL_DICT = {
 }
 
 
+class FitCancelled(Exception):
+    '''
+    Raised by FitWrapper.doFit if the fit is cancelled.
+    '''
+    pass
+
+
+class FitResult(object):
+    '''
+    Holds the outcome of a fit.
+    '''
+
+    def __init__(self, result, parameters):
+        '''
+        result: the OptimizeResult returned by optimize.least_squares
+        parameters: the names of the varied parameters, in order
+        '''
+        self.parameters = parameters
+        self.x = result.x
+        self.cost = result.cost
+        self.fun = result.fun
+        self.jac = result.jac
+        self.method = None
+        self.success = result.success
+        self.status = result.status
+        self.message = result.message
+        # number of function (model) and jacobian evaluations
+        self.nfev = result.nfev
+        self.njev = result.njev
+        # goodness of fit
+        num_points = len(self.fun)
+        self.dof = num_points - len(self.x)
+        self.chi_square = np_sum(self.fun ** 2)
+        self.reduced_chi_square = self.chi_square / self.dof if self.dof > 0 else nan
+        self.residual_mean = mean(self.fun) if num_points > 0 else nan
+        self.residual_std = std(self.fun) if num_points > 0 else nan
+        self.residual_max = np_max(np_abs(self.fun)) if num_points > 0 else nan
+        # uncertainties
+        self.error_method = 'jacobian'
+        self.condition_number = inf
+        self.jacobian_reliable = False
+        self.covariance = full((len(self.x), len(self.x)), inf)
+        self.stderr = full(len(self.x), inf)
+        self._computeCovariance()
+        # the MultiStartResult if the fit was seeded by a multi-start search
+        self.multistart = None
+        # where the model is inaccurate at the solution, see Model.warnings
+        self.warnings = []
+
+    def _computeCovariance(self):
+        '''
+        Estimates the covariance of the fitted parameters from the jacobian at the solution,
+        i.e. inv(J^T J) scaled by the reduced chi-square, since the data has no error bars.
+        Uses the SVD of J, dropping singular values which are negligible.
+        '''
+        if (self.jac is None) or (len(self.x) == 0) or (self.dof <= 0):
+            return
+        jac = atleast_2d(self.jac)
+        if not np_all(isfinite(jac)):
+            return
+        _, s, VT = svd(jac, full_matrices=False)
+        threshold = finfo(float).eps * max(jac.shape) * s[0]
+        rank = np_sum(s > threshold)
+        self.condition_number = s[0] / s[-1] if s[-1] > 0 else inf
+        # the estimate is unreliable if parameters are degenerate or poorly determined
+        self.jacobian_reliable = (rank == len(s)) and (self.condition_number < 1. / sqrt(finfo(float).eps))
+        if rank < len(s):
+            return
+        self.covariance = (VT.T / s ** 2) @ VT * self.reduced_chi_square
+        self.stderr = sqrt(diag(self.covariance))
+
+    def setBootstrap(self, samples):
+        '''
+        Replaces the uncertainties with those estimated by bootstrapping.
+        samples: a (num_samples, len(x)) array of the varied parameters fitted to each resampling
+            of the data. Samples where the fit failed are NaN.
+        '''
+        samples = samples[np_all(isfinite(samples), axis=1)]
+        if len(samples) < 2:
+            return
+        self.error_method = 'bootstrap'
+        self.covariance = atleast_2d(cov(samples, rowvar=False))
+        self.stderr = sqrt(diag(self.covariance))
+
+    def getError(self, p):
+        '''
+        Returns the standard error of a varied parameter, or None if the parameter was held fixed.
+        '''
+        if p not in self.parameters:
+            return None
+        return self.stderr[self.parameters.index(p)]
+
+    def __str__(self):
+        njev = self.njev if self.njev is not None else 0
+        return '{:s} fit: {:d} function evaluations, {:d} jacobian evaluations, cost = {:.6g} ({:s})'.format(
+            self.method, self.nfev, njev, self.cost, self.message)
+
+    def summary(self):
+        '''
+        Returns the goodness of fit and residual statistics as a single line of text.
+        '''
+        summary = 'reduced chi-square = {:.4g} ({:d} dof), residuals: mean = {:.3g}, std = {:.3g}, max = {:.3g}, errors: {:s}'.format(
+            self.reduced_chi_square, self.dof, self.residual_mean, self.residual_std, self.residual_max, self.error_method)
+        if self.multistart is not None:
+            summary += '\n' + str(self.multistart)
+        for warning in self.warnings:
+            summary += '\nwarning: ' + warning
+        return summary
+
+
+class MultiStartResult(object):
+    '''
+    Holds the outcome of a multi-start search, i.e. the local fits from each starting point.
+    '''
+
+    def __init__(self, parameters, solutions, costs, nfev, wall_time, requested=None):
+        '''
+        parameters: the names of the varied parameters, in order
+        solutions: a (starts, len(parameters)) array of the fitted values from each start (NaN if the fit failed)
+        costs: the cost of the fit from each start (NaN if the fit failed)
+        nfev: the total number of function evaluations
+        wall_time: the time taken by the search (in s)
+        requested: the number of starts requested, which may exceed the number run
+            since duplicate starts are dropped. Defaults to the number run.
+        '''
+        self.parameters = parameters
+        self.solutions = solutions
+        self.costs = costs
+        self.nfev = nfev
+        self.wall_time = wall_time
+        self.starts = len(costs)
+        self.requested = requested if requested is not None else self.starts
+        converged = isfinite(costs)
+        self.converged = np_sum(converged)
+        self.best = nanargmin(costs) if self.converged > 0 else None
+        # spread of the converged solutions, and the fraction of starts which found the best solution
+        self.spread = std(solutions[converged], axis=0) if self.converged > 0 else full(len(parameters), nan)
+        self.best_fraction = 0.
+        if self.converged > 0:
+            best_cost = nanmin(costs)
+            self.best_fraction = np_sum(costs[converged] <= best_cost * (1 + 1e-3) + 1e-12) / self.starts
+
+    def getSpread(self, p):
+        '''
+        Returns the standard deviation of a varied parameter over the converged solutions.
+        '''
+        return self.spread[self.parameters.index(p)]
+
+    def __str__(self):
+        spread = ', '.join('{:s} = {:.3g}'.format(p, s) for p, s in zip(self.parameters, self.spread))
+        starts = '{:d} starts'.format(self.starts)
+        if self.requested != self.starts:
+            starts += ' (of {:d} requested, duplicates dropped)'.format(self.requested)
+        return 'multi-start: {:s} in {:.3f} s, {:d} converged, {:.0%} found the best solution, spread: {:s}'.format(
+            starts, self.wall_time, self.converged, self.best_fraction, spread)
+
+
 class FitWrapper(object):
 
     models = _MODEL_DICT.keys()
+    methods = ['lm', 'trf', 'dogbox']
+    losses = ['linear', 'soft_l1', 'huber', 'cauchy', 'arctan']
+    # how uncertainties are estimated: from the jacobian, by bootstrapping
+    # only if the jacobian is unreliable, or always by bootstrapping
+    error_methods = ['jacobian', 'auto', 'bootstrap']
+    # maximum memory used by memoized model evaluations (in bytes)
+    evaluation_cache_bytes = 32 * 2 ** 20
+    # relative spread of the candidates reused by multi-start fits with more starts than candidates
+    multistart_jitter = 0.05
 
     def __init__(self, dataset, index):
         self.dataset = dataset
         self.index = index
+        # optimizer settings, see optimize.least_squares
+        self.method = 'lm'
+        self.loss = 'linear'
+        self.result = None
+        # uncertainty settings
+        self.error_method = 'jacobian'
+        self.bootstrap_samples = 200
+        self.bootstrap_workers = None
+        # multi-start settings
+        self.starts = 1
+        self.multistart_workers = None
+        self.multistart_seed = None
+        # set to abort a fit running in another thread
+        self._cancel = Event()
+        # process pool for bootstrapping and multi-start fits, created on first use,
+        # and the number of processes it was created with
+        self._executor = None
+        self._executor_workers = None
+        # memoized model evaluations, in order of least recent use
+        self.evaluation_cache = OrderedDict()
+        self._evaluation_cache_size = 0
 
     def setModel(self, model):
+        self.model_name = model
         self.model = _MODEL_DICT[model]()
+        self.result = None
 
     def getParameters(self):
         '''
@@ -64,6 +260,15 @@ class FitWrapper(object):
         except Exception as e:  # no fitted value exists yet
             return None
 
+    def getFittedError(self, p):
+        '''
+        Returns the standard error of the fitted value, or None if
+        there is no fit or the parameter was held fixed.
+        '''
+        if self.result is None:
+            return None
+        return self.result.getError(p)
+
     def setManualValue(self, p, value):
         self.model.parameters[p].manual_value = value
 
@@ -71,19 +276,153 @@ class FitWrapper(object):
         assert (value is True) or (value is False)
         self.model.parameters[p].vary = value
 
-    def doFit(self):
-        x = self.dataset.data[:, 0]
-        y = self.dataset.data[:, self.index + 1]
+    def getBounds(self, p):
+        bounds = self.model.parameters[p].bounds
+        if bounds is None:
+            return (-inf, inf)
+        return bounds
+
+    def setBounds(self, p, lower=-inf, upper=inf):
+        '''
+        Limits the fitted value of a parameter to [lower, upper].
+        Bounds aren't supported by the 'lm' method, so fits with bounds use 'trf' instead.
+        '''
+        assert lower < upper
+        if (lower == -inf) and (upper == inf):
+            self.model.parameters[p].bounds = None
+        else:
+            self.model.parameters[p].bounds = (lower, upper)
+
+    def setMethod(self, method):
+        '''
+        Sets the optimize.least_squares method, i.e. one of 'lm', 'trf', or 'dogbox'.
+        '''
+        assert method in self.methods
+        self.method = method
+
+    def setLoss(self, loss):
+        '''
+        Sets the optimize.least_squares loss function, e.g. 'soft_l1' for robustness against outliers.
+        Robust losses aren't supported by the 'lm' method, so they use 'trf' instead.
+        '''
+        assert loss in self.losses
+        self.loss = loss
+
+    def setErrorMethod(self, method, samples=None, max_workers=None):
+        '''
+        Sets how the uncertainties of the fitted parameters are estimated, i.e. one of:
+            'jacobian': from the covariance estimated by the fit.
+            'auto': by bootstrapping if the jacobian is rank deficient or ill-conditioned.
+            'bootstrap': always by bootstrapping.
+        samples: the number of resamplings of the data used for bootstrapping.
+        max_workers: the number of processes used for bootstrapping, see BatchFitWrapper.
+        '''
+        assert method in self.error_methods
+        self.error_method = method
+        if samples is not None:
+            self.bootstrap_samples = samples
+        self.bootstrap_workers = max_workers
+
+    def setMultiStart(self, starts, max_workers=None, seed=None):
+        '''
+        Enables multi-start fits, for models whose residuals have many local minima.
+        The fit is run from many starting points in parallel, and the best solution is refined as usual.
+        Starting points are drawn by latin hypercube sampling within the bounds of each varied parameter,
+        and from Model.frequency_candidates (e.g. peaks in the spectrum of the data).
+        Varied parameters without finite bounds or candidates start from their manual values.
+        Duplicate starting points are dropped, so multi-start is skipped if there is nothing to sample
+        (i.e. no varied parameter has finite bounds or candidates), which is reported in the fit summary.
+        starts: the number of starting points, including the manual values. 1 disables multi-start.
+        max_workers: the number of processes used for the starts, see BatchFitWrapper.
+        seed: the seed of the random number generator, for reproducible starting points.
+        '''
+        assert starts >= 1
+        self.starts = int(starts)
+        self.multistart_workers = max_workers
+        self.multistart_seed = seed
+
+    def cancel(self):
+        '''
+        Aborts a fit running in another thread.
+        The aborted doFit raises FitCancelled.
+        '''
+        self._cancel.set()
+
+    def shutdown(self):
+        '''
+        Shuts down the process pool used for bootstrapping and multi-start fits.
+        A new pool is created by the next fit which needs one.
+        '''
+        if self._executor is not None:
+            from .batch_fitting import _shutdown_executor
+            _shutdown_executor(self._executor)
+            self._executor = None
+
+    def doFit(self, x=None, y=None):
+        '''
+        Fits the model to the data using optimize.least_squares.
+        Analytic derivatives are used if the model provides them.
+        x, y: the data to fit. Defaults to the data held by the dataset.
+            Fits run outside the reactor thread should pass a copy of the data,
+            since the dataset may be updated while the fit is running.
+        Returns a FitResult holding the number of function/jacobian evaluations.
+        '''
+        if x is None:
+            x = self.dataset.data[:, 0]
+        if y is None:
+            y = self.dataset.data[:, self.index + 1]
+        self._cancel.clear()
 
         def residual(p):
+            if self._cancel.is_set():
+                raise FitCancelled()
             return y - self.model.reduced_model(x, p)
 
+        def jacobian(p):
+            if self._cancel.is_set():
+                raise FitCancelled()
+            return -self.model.reduced_jacobian(x, p)
+
         varied_positions = self.model.varied_positions()
         fixed_positions = self.model.fixed_positions()
-        x0 = [self.model.param_from_index(k).manual_value for k in varied_positions]
+        varied_params = [self.model.param_from_index(k) for k in varied_positions]
+        x0 = [param.manual_value for param in varied_params]
+
+        # start from the best solution of a multi-start search
+        multistart = None
+        starts = self.makeStarts(x, y) if self.starts > 1 else []
+        if len(starts) > 1:
+            multistart = self.multiStart(x, y, starts)
+            if multistart.best is not None:
+                x0 = list(multistart.solutions[multistart.best])
+            if self._cancel.is_set():
+                raise FitCancelled()
 
-        result = optimize.leastsq(residual, x0)
-        result = result[0]
+        # get bounds of the varied parameters
+        lower = [param.bounds[0] if param.bounds is not None else -inf for param in varied_params]
+        upper = [param.bounds[1] if param.bounds is not None else inf for param in varied_params]
+        bounded = any(isfinite(lower)) or any(isfinite(upper))
+        method = self.method
+        if (method == 'lm') and (bounded or (self.loss != 'linear')):
+            method = 'trf'
+        if bounded:
+            x0 = clip(x0, lower, upper)
+
+        jac = jacobian if self.model.has_jacobian() else '2-point'
+        # hold the parameter layout fixed for the duration of the fit
+        self.model.compile_layout()
+        try:
+            result = optimize.least_squares(residual, x0, jac=jac, bounds=(lower, upper),
+                                            method=method, loss=self.loss, x_scale='jac')
+        finally:
+            self.model.clear_layout()
+        self.result = FitResult(result, [p for p in self.getParameters() if self.getVary(p)])
+        self.result.method = method
+        self.result.multistart = multistart
+        if (self.starts > 1) and (multistart is None):
+            self.result.warnings.append('multi-start skipped, since no varied parameter has finite bounds '
+                                        'or candidates to start from')
+        result = result.x
 
         # after the fit, assign the fitted values to the parameters
         # For the fixed parameters, set the fit_value = manual_value
@@ -95,52 +434,205 @@ class FitWrapper(object):
         for pos in fixed_positions:
             param = self.model.param_from_index(pos)
             param.fit_value = param.manual_value
+        self.result.warnings += self.model.warnings(self.model.full_parameters(result))
+
+        if (self.error_method == 'bootstrap') or ((self.error_method == 'auto') and not self.result.jacobian_reliable):
+            if self._cancel.is_set():
+                raise FitCancelled()
+            self.result.setBootstrap(self.bootstrap(x, y))
+        return self.result
+
+    def bootstrap(self, x, y):
+        '''
+        Refits the data resampled with replacement, starting from the fitted values.
+        The refits are run in parallel by a BatchFitWrapper, and raise FitCancelled if the fit is cancelled.
+        x, y: the data which was fitted.
+        Returns a (bootstrap_samples, num_varied) array of the fitted values of the varied parameters,
+        which is NaN where the fit failed.
+        '''
+        indices = default_rng().integers(0, len(x), size=(self.bootstrap_samples, len(x)))
+        indices.sort(axis=1)
+        series_list = [(x[i], y[i]) for i in indices]
+
+        bfw = self._makeBatchFitter(self.getFittedValue, self.bootstrap_workers)
+        try:
+            result = bfw.fit(series_list)
+        except BrokenProcessPool:
+            self.shutdown()
+            raise
+        return column_stack([result.getParameter(p) for p in self.result.parameters])
+
+    def multiStart(self, x, y, starts=None):
+        '''
+        Fits the data from many starting points in parallel (see setMultiStart).
+        x, y: the data to fit.
+        starts: the starting points, see makeStarts. Made by makeStarts if None.
+        Returns a MultiStartResult. Raises FitCancelled if the fit is cancelled.
+        '''
+        start_time = perf_counter()
+        varied = [p for p in self.getParameters() if self.getVary(p)]
+        if starts is None:
+            starts = self.makeStarts(x, y)
+        bfw = self._makeBatchFitter(self.getManualValue, self.multistart_workers)
+        try:
+            result = bfw.fitStarts(x, y, starts)
+        except BrokenProcessPool:
+            self.shutdown()
+            raise
+        solutions = column_stack([result.getParameter(p) for p in varied])
+        return MultiStartResult(varied, solutions, result.data[:, -1], result.nfev, perf_counter() - start_time,
+                                requested=self.starts)
+
+    def makeStarts(self, x, y):
+        '''
+        Returns the starting values of the varied parameters for a multi-start fit.
+        The first start is empty, i.e. uses the manual values.
+        If there are fewer candidates than starts, the candidates are reused with a relative
+        jitter of multistart_jitter, so that each start explores a different point.
+        Duplicate starts are dropped, so fewer than self.starts may be returned
+        (e.g. a single start if there is nothing to sample).
+        x, y: the data to fit.
+        '''
+        rng = default_rng(self.multistart_seed)
+        num_starts = self.starts
+        starts = [{} for i in range(num_starts)]
+        varied = [p for p in self.getParameters() if self.getVary(p)]
+
+        # latin hypercube sampling over the finite bounds
+        bounded = [p for p in varied if all(isfinite(self.getBounds(p)))]
+        if bounded:
+            strata = rng.permuted(tile(arange(num_starts - 1), (len(bounded), 1)), axis=1).T
+            samples = (strata + rng.random(strata.shape)) / (num_starts - 1)
+            for i, start in enumerate(starts[1:]):
+                for j, p in enumerate(bounded):
+                    lower, upper = self.getBounds(p)
+                    start[p] = lower + samples[i, j] * (upper - lower)
 
-    def evaluateFittedParameters(self):
+        # cycle through the candidates suggested by the model
+        candidates = self.model.frequency_candidates(x, y)
+        for p, values in candidates.items():
+            if (p not in varied) or (len(values) == 0):
+                continue
+            lower, upper = self.getBounds(p)
+            for i, start in enumerate(starts[1:]):
+                value = values[i % len(values)]
+                if i >= len(values):
+                    value *= 1 + self.multistart_jitter * rng.standard_normal()
+                start[p] = float(clip(value, lower, upper))
+
+        # drop duplicates (e.g. candidates repeated when there are fewer of them than starts),
+        # since they would only repeat the same fit
+        unique_starts = []
+        seen = set()
+        for start in starts:
+            key = tuple(sorted(start.items()))
+            if key not in seen:
+                seen.add(key)
+                unique_starts.append(start)
+        return unique_starts
+
+    def _makeBatchFitter(self, get_value, max_workers):
+        '''
+        Creates a BatchFitWrapper with the same settings as this fit.
+        The batch fits share this wrapper's process pool, and are aborted by cancel.
+        get_value: returns the initial value of a parameter, e.g. getManualValue or getFittedValue.
+        '''
+        from .batch_fitting import BatchFitWrapper
+        # fits with a single worker are run in-process, so don't need the pool
+        executor = self._getExecutor(max_workers) if max_workers != 1 else None
+        bfw = BatchFitWrapper(self.model_name, max_workers=max_workers, warm_start=False,
+                              executor=executor, cancel=self._cancel)
+        bfw.setMethod(self.method)
+        bfw.setLoss(self.loss)
+        for p in self.getParameters():
+            bfw.setVary(p, self.getVary(p))
+            bfw.setBounds(p, *self.getBounds(p))
+            bfw.setManualValue(p, get_value(p))
+        return bfw
+
+    def _getExecutor(self, max_workers):
+        '''
+        Returns the process pool, creating it with max_workers processes (the number of CPUs if None).
+        The pool is recreated if a different number of processes is requested.
+        '''
+        from .batch_fitting import _make_executor
+        if (self._executor is not None) and (self._executor_workers != max_workers):
+            self.shutdown()
+        if self._executor is None:
+            self._executor = _make_executor(max_workers)
+            self._executor_workers = max_workers
+        return self._executor
+
+    def evaluateFittedParameters(self, xlim=None, num_points=None):
         '''
         Evaluate the model on a fine grid.
+        See evaluateParameters for the arguments.
         Return 2-d numpy array data where:
             data[:,0] = fine_grid
             data[:,1] = model evaluated on fitted parameters
         '''
-
-        x = self.dataset.data[:, 0]
-        n = len(x)
-        N = 10 * n
-        xmin = x[0];
-        xmax = x[-1]
-        fine_grid = linspace(xmin, xmax, N)
-
         p0 = []
         for p in self.getParameters():
             p0.append(self.getFittedValue(p))
-        y = self.model.model(fine_grid, p0)
-
-        data = zeros((N, 2))
-        data[:, 0] = fine_grid
-        data[:, 1] = y
-        return data
+        return self.evaluateParameters(p0, xlim, num_points)
 
-    def evaluateManualParameters(self):
+    def evaluateManualParameters(self, xlim=None, num_points=None):
         '''
         Evaluate the model on a fine grid.
+        See evaluateParameters for the arguments.
         Return 2-d numpy array data where:
             data[:,0] = fine_grid
             data[:,1] = model evaluated on manual parameters
         '''
-        x = self.dataset.data[:, 0]
-        n = len(x)
-        N = 10 * n
-        xmin = x[0];
-        xmax = x[-1]
-        fine_grid = linspace(xmin, xmax, N)
-
         p0 = []
         for p in self.getParameters():
             p0.append(self.getManualValue(p))
-        y = self.model.model(fine_grid, p0)
+        return self.evaluateParameters(p0, xlim, num_points)
+
+    def evaluateParameters(self, params, xlim=None, num_points=None):
+        '''
+        Evaluate the model on a fine grid.
+        Results are memoized by (model, params, xlim, num_points), so
+        repeatedly plotting the same curve (e.g. while scrubbing a parameter
+        back and forth, or panning the view) doesn't re-evaluate the model.
+        The returned array is shared with the cache, so it is read-only.
+        params: the values of all parameters, in order of index
+        xlim: the (xmin, xmax) range of the grid, e.g. the visible range of the graph.
+            Defaults to the range of the data.
+        num_points: the number of points in the grid, e.g. the width of the graph in pixels.
+            Defaults to 10x the number of data points.
+        Raises ValueError if a default is needed but the dataset has been closed.
+        Return 2-d numpy array data where:
+            data[:,0] = fine_grid
+            data[:,1] = model evaluated on params
+        '''
+        if ((xlim is None) or (num_points is None)) and (self.dataset.data is None):
+            raise ValueError('dataset has been closed.')
+        if xlim is None:
+            x = self.dataset.data[:, 0]
+            xlim = (x[0], x[-1])
+        if num_points is None:
+            num_points = 10 * len(self.dataset.data)
+        key = (type(self.model).__name__, tuple(params), float(xlim[0]), float(xlim[1]), int(num_points))
+        data = self.evaluation_cache.get(key)
+        if data is not None:
+            self.evaluation_cache.move_to_end(key)
+            return data
+
+        N = int(num_points)
+        fine_grid = linspace(xlim[0], xlim[1], N)
+        y = self.model.model(fine_grid, list(params))
 
         data = zeros((N, 2))
         data[:, 0] = fine_grid
         data[:, 1] = y
+        data.setflags(write=False)
+
+        # store result, and evict the least recently used results if the cache is full
+        if data.nbytes <= self.evaluation_cache_bytes:
+            self.evaluation_cache[key] = data
+            self._evaluation_cache_size += data.nbytes
+            while self._evaluation_cache_size > self.evaluation_cache_bytes:
+                _, data_old = self.evaluation_cache.popitem(last=False)
+                self._evaluation_cache_size -= data_old.nbytes
         return data
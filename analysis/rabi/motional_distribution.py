@@ -22,6 +22,39 @@ class motional_distribution(object):
         # level population probability for a given nbar, see Leibfried 2003 (57)
         return 1. / (nbar + 1.0) * (nbar / (nbar + 1.0)) ** n
 
+    @classmethod
+    def thermal_dimension(cls, nbar, tolerance=1e-6, max_dimension=10000):
+        """
+        Returns the number of fock states required to hold all but tolerance of the population
+        of a thermal distribution.
+        The population above N is (nbar / (nbar + 1))^N, so N = log(tolerance) / log(nbar / (nbar + 1)).
+        @param nbar: temperature
+        @param tolerance: the maximum population outside the truncated distribution
+        @param max_dimension: the maximum number of entries
+        """
+        ratio = abs(nbar / (nbar + 1.0))
+        if ratio == 0:
+            return 1
+        if not (ratio < 1):
+            return max_dimension
+        dimension = int(np.ceil(np.log(tolerance) / np.log(ratio)))
+        return min(max(dimension, 1), max_dimension)
+
+    @classmethod
+    def thermal_truncated(cls, nbar, tolerance=1e-6, max_dimension=10000):
+        """
+        Returns a thermal distribution truncated to the number of fock states
+        required to hold all but tolerance of the population.
+        @param nbar: temperature
+        @param tolerance: the maximum population outside the truncated distribution
+        @param max_dimension: the maximum number of entries
+        @return: (populations, truncation_error), where truncation_error is the population
+            outside the truncated distribution
+        """
+        dimension = cls.thermal_dimension(nbar, tolerance, max_dimension)
+        populations = cls.thermal(nbar, dimension)
+        return populations, 1. - np.sum(populations)
+
     @classmethod
     def displaced_thermal(cls, alpha, nbar, dimension):
         """
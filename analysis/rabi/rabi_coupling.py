@@ -1,4 +1,6 @@
 import numpy as np
+from functools import lru_cache
+from scipy.special import gammaln
 from scipy.special import eval_genlaguerre as laguerre
 
 
@@ -8,40 +10,45 @@ class rabi_coupling(object):
     def compute_rabi_coupling(cls, eta, sideband_order, nmax):
         '''
         Rabi couplings, see Leibfried (2003), eq:70.
+        Returns the relative Rabi frequencies of the n -> n + sideband_order transitions for n in [0, nmax).
+        Tables are cached, so the returned array is read-only.
+        Tables are computed for a power-of-two number of fock states and sliced,
+        so that models which adapt nmax (e.g. to the temperature) mostly hit the cache.
+        @param eta: the lamb-dicke parameter
+        @param sideband_order: the sideband order (any integer, positive or negative)
+        @param nmax: the number of fock states
         '''
-
-        if sideband_order == 0:
-            coupling_func = lambda n: np.exp(-1. / 2 * eta ** 2) * laguerre(n, 0, eta ** 2)
-        elif sideband_order == 1:
-            coupling_func = lambda n: np.exp(-1. / 2 * eta ** 2) * eta ** (1) * (1. / (n + 1.)) ** 0.5 * laguerre(n, 1,
-                                                                                                                  eta ** 2)
-        elif sideband_order == 2:
-            coupling_func = lambda n: np.exp(-1. / 2 * eta ** 2) * eta ** (2) * (
-                        1. / ((n + 1.) * (n + 2))) ** 0.5 * laguerre(n, 2, eta ** 2)
-        elif sideband_order == 3:
-            coupling_func = lambda n: np.exp(-1. / 2 * eta ** 2) * eta ** (3) * (
-                        1. / ((n + 1) * (n + 2) * (n + 3))) ** 0.5 * laguerre(n, 3, eta ** 2)
-        elif sideband_order == 4:
-            coupling_func = lambda n: np.exp(-1. / 2 * eta ** 2) * eta ** (4) * (
-                        1. / ((n + 1) * (n + 2) * (n + 3) * (n + 4))) ** 0.5 * laguerre(n, 4, eta ** 2)
-        elif sideband_order == 5:
-            coupling_func = lambda n: np.exp(-1. / 2 * eta ** 2) * eta ** (5) * (
-                        1. / ((n + 1) * (n + 2) * (n + 3) * (n + 4) * (n + 5))) ** 0.5 * laguerre(n, 5, eta ** 2)
-        elif sideband_order == -1:
-            coupling_func = lambda n: 0 if n == 0 else np.exp(-1. / 2 * eta ** 2) * eta ** (1) * (
-                        1. / (n)) ** 0.5 * laguerre(n - 1, 1, eta ** 2)
-        elif sideband_order == -2:
-            coupling_func = lambda n: 0 if n <= 1 else np.exp(-1. / 2 * eta ** 2) * eta ** (2) * (
-                        1. / ((n) * (n - 1.))) ** 0.5 * laguerre(n - 2, 2, eta ** 2)
-        elif sideband_order == -3:
-            coupling_func = lambda n: 0 if n <= 2 else np.exp(-1. / 2 * eta ** 2) * eta ** (3) * (
-                        1. / ((n) * (n - 1.) * (n - 2))) ** 0.5 * laguerre(n - 3, 3, eta ** 2)
-        elif sideband_order == -4:
-            coupling_func = lambda n: 0 if n <= 3 else np.exp(-1. / 2 * eta ** 2) * eta ** (4) * (
-                        1. / ((n) * (n - 1.) * (n - 2) * (n - 3))) ** 0.5 * laguerre(n - 4, 4, eta ** 2)
-        elif sideband_order == -5:
-            coupling_func = lambda n: 0 if n <= 4 else np.exp(-1. / 2 * eta ** 2) * eta ** (5) * (
-                        1. / ((n) * (n - 1.) * (n - 2) * (n - 3) * (n - 4))) ** 0.5 * laguerre(n - 5, 5, eta ** 2)
-        else:
+        if int(sideband_order) != sideband_order:
             raise NotImplementedError("Can't calculate rabi couplings sideband order {}".format(sideband_order))
-        return np.array([coupling_func(n) for n in range(nmax)])
+        nmax = int(nmax)
+        nmax_table = 2 ** int(np.ceil(np.log2(max(nmax, 16))))
+        return _rabi_coupling_table(float(eta), int(sideband_order), nmax_table)[:nmax]
+
+    @classmethod
+    def clear_cache(cls):
+        '''
+        Empties the cache of coupling tables.
+        '''
+        _rabi_coupling_table.cache_clear()
+
+
+# tables are cached since fits with a fixed eta request the same table on every model evaluation
+@lru_cache(maxsize=128)
+def _rabi_coupling_table(eta, sideband_order, nmax):
+    '''
+    Computes the rabi couplings for all fock states at once.
+    The coupling between n_< and n_> = n_< + |s| is
+        exp(-eta^2 / 2) * eta^|s| * sqrt(n_<! / n_>!) * L_{n_<}^{|s|}(eta^2),
+    where the factorial ratio is computed in log space to avoid overflow.
+    '''
+    order = abs(sideband_order)
+    n = np.arange(nmax)
+    # red sidebands (negative order) lower the fock state, so n_< = n - |s|
+    n_lower = n if sideband_order >= 0 else n - order
+    couplings = np.zeros(nmax)
+    valid = n_lower >= 0
+    n_lower = n_lower[valid]
+    factorial_ratio = np.exp(0.5 * (gammaln(n_lower + 1.) - gammaln(n_lower + order + 1.)))
+    couplings[valid] = np.exp(-0.5 * eta ** 2) * eta ** order * factorial_ratio * laguerre(n_lower, order, eta ** 2)
+    couplings.setflags(write=False)
+    return couplings
@@ -0,0 +1,207 @@
+"""
+Spectral estimates of oscillations, used to guess the initial parameters of oscillatory fit models.
+Evenly spaced data uses the FFT, while unevenly spaced data uses the Lomb-Scargle periodogram.
+Peak frequencies are refined by parabolic interpolation, and the amplitude, phase, and offset
+are then estimated by linear least squares at the peak frequency.
+"""
+
+__all__ = ["Oscillation", "power_spectrum", "spectral_peaks", "estimate_sinusoid", "estimate_decay",
+           "estimate_oscillation"]
+
+import numpy as np
+from scipy.signal import lombscargle
+
+
+class Oscillation(object):
+    """
+    Holds the estimated parameters of an oscillation y = offset + amplitude * exp(-x / tau) * cos(2 pi frequency x + phase).
+    """
+
+    def __init__(self, frequency, amplitude, phase, offset, tau=np.inf):
+        self.frequency = frequency
+        self.amplitude = amplitude
+        self.phase = phase
+        self.offset = offset
+        self.tau = tau
+
+    def __repr__(self):
+        return 'Oscillation(frequency={:.6g}, amplitude={:.6g}, phase={:.6g}, offset={:.6g}, tau={:.6g})'.format(
+            self.frequency, self.amplitude, self.phase, self.offset, self.tau)
+
+
+def _sorted(x, y):
+    """
+    Returns x and y as float arrays sorted by x, without non-finite points.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    finite = np.isfinite(x) & np.isfinite(y)
+    x, y = x[finite], y[finite]
+    order = np.argsort(x, kind='stable')
+    return x[order], y[order]
+
+
+def _is_uniform(x, tolerance=1e-3):
+    """
+    Whether the (sorted) x-values are evenly spaced.
+    """
+    dx = np.diff(x)
+    step = np.median(dx)
+    return (step > 0) and np.all(np.abs(dx - step) <= tolerance * step)
+
+
+def power_spectrum(x, y, oversampling=4):
+    """
+    Returns the power spectrum of y(x), with the mean removed.
+    Uses the zero-padded FFT if x is evenly spaced, and the Lomb-Scargle periodogram otherwise.
+    Arguments:
+        x, y    (np.array): the data.
+        oversampling (int): the number of frequencies per 1 / (span of x).
+    Returns:
+        (np.array, np.array): the frequencies (in cycles per unit of x), and the power at each frequency.
+    """
+    x, y = _sorted(x, y)
+    num_points = len(x)
+    if (num_points < 4) or (x[-1] <= x[0]):
+        return np.zeros(0), np.zeros(0)
+    y = y - np.mean(y)
+    if _is_uniform(x):
+        step = (x[-1] - x[0]) / (num_points - 1)
+        num_fft = oversampling * num_points
+        power = np.abs(np.fft.rfft(y, num_fft)) ** 2
+        freqs = np.fft.rfftfreq(num_fft, step)
+        return freqs, power
+    # average nyquist frequency of the uneven spacing
+    span = x[-1] - x[0]
+    fmax = 0.5 * (num_points - 1) / span
+    freqs = np.arange(0, fmax, 1. / (oversampling * span))
+    power = np.zeros_like(freqs)
+    power[1:] = lombscargle(x, y, 2 * np.pi * freqs[1:])
+    return freqs, power
+
+
+def spectral_peaks(x, y, num_peaks=3, oversampling=4):
+    """
+    Returns the frequencies of the largest peaks in the power spectrum of y(x), in order of power.
+    Peak frequencies are refined by parabolic interpolation of the log power around each peak.
+    Arguments:
+        x, y    (np.array): the data.
+        num_peaks    (int): the maximum number of peaks to return.
+        oversampling (int): see power_spectrum.
+    Returns:
+        [float]: the peak frequencies (in cycles per unit of x).
+    """
+    freqs, power = power_spectrum(x, y, oversampling)
+    if len(power) < 3:
+        return []
+    # local maxima, excluding the DC component
+    inner = power[1:-1]
+    peaks = np.nonzero((inner >= power[:-2]) & (inner > power[2:]))[0] + 1
+    peaks = peaks[np.argsort(power[peaks])[::-1]][:num_peaks]
+    # parabolic interpolation of the log power
+    log_power = np.log(power[np.add.outer(peaks, [-1, 0, 1])] + np.finfo(float).tiny)
+    left, center, right = log_power.T
+    curvature = left - 2 * center + right
+    offset = np.zeros(len(peaks))
+    valid = curvature < 0
+    offset[valid] = np.clip(0.5 * (left[valid] - right[valid]) / curvature[valid], -0.5, 0.5)
+    step = freqs[1] - freqs[0]
+    return list(freqs[peaks] + offset * step)
+
+
+def estimate_sinusoid(x, y, frequency):
+    """
+    Estimates the amplitude, phase, and offset of an oscillation with a known frequency
+    by linear least squares, i.e. y = offset + amplitude * cos(2 pi frequency x + phase).
+    Arguments:
+        x, y     (np.array): the data.
+        frequency   (float): the frequency of the oscillation (in cycles per unit of x).
+    Returns:
+        Oscillation: the estimated oscillation, with a positive amplitude and phase in (-pi, pi].
+    """
+    x, y = _sorted(x, y)
+    arg = 2 * np.pi * frequency * x
+    basis = np.column_stack((np.cos(arg), np.sin(arg), np.ones_like(x)))
+    (a, b, offset), _, _, _ = np.linalg.lstsq(basis, y, rcond=None)
+    # a cos(arg) + b sin(arg) = amplitude * cos(arg + phase)
+    return Oscillation(frequency, np.hypot(a, b), np.arctan2(-b, a), offset)
+
+
+def estimate_decay(x, y, frequency, offset=None):
+    """
+    Estimates the exponential decay time of an oscillation with a known frequency,
+    by fitting a line to the log of the amplitude within each period.
+    Arguments:
+        x, y     (np.array): the data.
+        frequency   (float): the frequency of the oscillation (in cycles per unit of x).
+        offset      (float): the offset of the oscillation. Estimated within each period if None.
+    Returns:
+        float: the decay time (in units of x). Infinite if the amplitude doesn't decay.
+    """
+    x, y = _sorted(x, y)
+    if (frequency <= 0) or (len(x) < 8):
+        return np.inf
+    period = 1. / frequency
+    periods = np.floor((x - x[0]) / period).astype(int)
+    num_periods = periods[-1] + 1
+    if num_periods < 2:
+        return np.inf
+    # amplitude within each period by linear least squares, solved for all periods at once
+    arg = 2 * np.pi * frequency * x
+    columns = [np.cos(arg), np.sin(arg)]
+    if offset is None:
+        columns.append(np.ones_like(x))
+    else:
+        y = y - offset
+    basis = np.stack(columns, axis=1)
+    normal = np.zeros((num_periods, len(columns), len(columns)))
+    np.add.at(normal, periods, basis[:, :, None] * basis[:, None, :])
+    projection = np.zeros((num_periods, len(columns)))
+    np.add.at(projection, periods, basis * y[:, None])
+    counts = np.bincount(periods, minlength=num_periods)
+    # only use periods which are sampled well enough to resolve the oscillation
+    valid = (counts > len(columns)) & (np.abs(np.linalg.det(normal)) > 1e-12 * counts.astype(float) ** len(columns))
+    if np.sum(valid) < 2:
+        return np.inf
+    coefficients = np.linalg.solve(normal[valid], projection[valid][:, :, None])[:, :, 0]
+    amplitudes = np.hypot(coefficients[:, 0], coefficients[:, 1])
+    centers = x[0] + (np.arange(num_periods)[valid] + 0.5) * period
+    positive = amplitudes > 0
+    if np.sum(positive) < 2:
+        return np.inf
+    slope, _ = np.polyfit(centers[positive], np.log(amplitudes[positive]), 1, w=np.sqrt(amplitudes[positive]))
+    if slope >= 0:
+        return np.inf
+    return -1. / slope
+
+
+def estimate_oscillation(x, y, frequency=None, decay=False):
+    """
+    Estimates the parameters of the dominant oscillation in the data.
+    Arguments:
+        x, y     (np.array): the data.
+        frequency   (float): the frequency of the oscillation, if known. Otherwise the largest spectral peak is used.
+        decay        (bool): whether to estimate the decay time.
+    Returns:
+        Oscillation: the estimated oscillation, or None if no oscillation was found.
+    """
+    if frequency is None:
+        peaks = spectral_peaks(x, y, num_peaks=1)
+        if len(peaks) == 0:
+            return None
+        frequency = peaks[0]
+    oscillation = estimate_sinusoid(x, y, frequency)
+    if decay:
+        oscillation.tau = estimate_decay(x, y, frequency, oscillation.offset)
+        if np.isfinite(oscillation.tau):
+            # the least squares amplitude is averaged over the decay, so extrapolate it to the start of the data
+            x_sorted, y_sorted = _sorted(x, y)
+            envelope = np.exp(-(x_sorted - x_sorted[0]) / oscillation.tau)
+            arg = 2 * np.pi * frequency * x_sorted
+            basis = np.column_stack((envelope * np.cos(arg), envelope * np.sin(arg), np.ones_like(arg)))
+            (a, b, offset), _, _, _ = np.linalg.lstsq(basis, y_sorted, rcond=None)
+            # amplitude at x = 0
+            oscillation.amplitude = np.hypot(a, b) * np.exp(x_sorted[0] / oscillation.tau)
+            oscillation.phase = np.arctan2(-b, a)
+            oscillation.offset = offset
+    return oscillation
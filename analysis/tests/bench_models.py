@@ -0,0 +1,62 @@
+"""
+Benchmarks the overhead of Model.reduced_model for every model in _MODEL_DICT,
+comparing the old per-call parameter dict walk against the compiled parameter layout
+used by FitWrapper.doFit, on a small dataset where the overhead matters most.
+"""
+import timeit
+import numpy as np
+
+from RealSimpleGrapher.analysis.fitting import _MODEL_DICT
+
+
+def legacy_full_parameters(model, p):
+    """
+    The old implementation, which walks the parameter dict and sorts the varied indices on every call.
+    """
+    n = len(model.parameters.keys())
+    full_params = [None for k in range(n)]
+    for key in model.parameters.keys():
+        if not model.parameters[key].vary:
+            full_params[model.parameters[key].index] = model.parameters[key].manual_value
+    varied = sorted([param.index for param in model.parameters.values() if param.vary])
+    for index, k in zip(varied, p):
+        full_params[index] = k
+    return full_params
+
+
+def time_calls(func, repeats, trials=5):
+    """
+    Returns the best time per call over several trials.
+    """
+    return min(timeit.repeat(func, number=repeats, repeat=trials)) / repeats
+
+
+num_points = 50
+repeats = 1000
+x = np.linspace(0.1, 10, num_points)
+y = 0.5 + 0.4 * np.cos(2 * np.pi * x / 5) * np.exp(-x / 10)
+
+print('time per residual call (us)')
+print('{:<18}{:>10}{:>16}{:>18}{:>18}{:>20}'.format('model', 'model', 'legacy params', 'compiled params',
+                                                      'legacy overhead', 'compiled overhead'))
+for name, model_class in _MODEL_DICT.items():
+    model = model_class()
+    # use the guessed parameters, since only the call overhead is of interest
+    for p, param in model.parameters.items():
+        try:
+            param.manual_value = float(model.guess_param(p, x, y))
+        except Exception:
+            param.manual_value = 1.
+    p_varied = np.array([model.param_from_index(k).manual_value for k in model.varied_positions()])
+    try:
+        time_legacy_params = time_calls(lambda: legacy_full_parameters(model, p_varied), repeats)
+        model.compile_layout()
+        time_compiled_params = time_calls(lambda: model.full_parameters(p_varied), repeats)
+        time_model = time_calls(lambda: model.model(x, model.full_parameters(p_varied)), repeats // 10 + 1)
+        model.clear_layout()
+    except Exception as e:
+        print('{:<18}failed: {}'.format(name, e))
+        continue
+    print('{:<18}{:>10.2f}{:>16.2f}{:>18.2f}{:>17.1f}%{:>19.1f}%'.format(
+        name, 1e6 * time_model, 1e6 * time_legacy_params, 1e6 * time_compiled_params,
+        100 * time_legacy_params / time_model, 100 * time_compiled_params / time_model))
@@ -0,0 +1,76 @@
+"""
+Benchmarks the vectorized, cached rabi coupling table against the old per-fock-state implementation,
+both for computing the table and for the wall time of a Rabi flop fit.
+"""
+import time
+import numpy as np
+from scipy.special import eval_genlaguerre as laguerre
+
+from RealSimpleGrapher.analysis import FitWrapper
+from RealSimpleGrapher.analysis.rabi import rabi_coupling as rc
+from RealSimpleGrapher.analysis.fit_models import Rabi
+
+
+def legacy_rabi_coupling(eta, sideband_order, nmax):
+    """
+    The old implementation, which evaluates the coupling one fock state at a time.
+    """
+    order = int(abs(sideband_order))
+    prefactor = lambda n, k: np.exp(-1. / 2 * eta ** 2) * eta ** order * (1. / np.prod(np.arange(n + 1, n + k + 1, dtype=float))) ** 0.5
+    if sideband_order >= 0:
+        coupling_func = lambda n: prefactor(n, order) * laguerre(n, order, eta ** 2)
+    else:
+        coupling_func = lambda n: 0 if n < order else prefactor(n - order, order) * laguerre(n - order, order, eta ** 2)
+    return np.array([coupling_func(n) for n in range(nmax)])
+
+
+class dataset(object):
+    def __init__(self, x, y):
+        self.data = np.column_stack((x, y))
+
+
+def time_fit(repeats=3):
+    np.random.seed(0)
+    x = np.linspace(0, 30, 300)
+    true_params = [2 * np.pi / 10, 10, 0.05, 0., 0, 0.6]
+    y = Rabi().model(x, true_params) + 0.02 * np.random.normal(size=len(x))
+    start = time.perf_counter()
+    for i in range(repeats):
+        fw = FitWrapper(dataset(x, y), 0)
+        fw.setModel('Rabi')
+        for p in fw.getParameters():
+            fw.getManualValue(p)  # force guess of initial parameters
+        fw.doFit()
+    return (time.perf_counter() - start) / repeats
+
+
+nmax = 1000
+repeats = 20
+
+# coupling table
+for sideband_order in (0, 1, -1, 5, -5):
+    start = time.perf_counter()
+    for i in range(repeats):
+        legacy_rabi_coupling(0.05, sideband_order, nmax)
+    time_legacy = (time.perf_counter() - start) / repeats
+    rc.clear_cache()
+    start = time.perf_counter()
+    for i in range(repeats):
+        rc.compute_rabi_coupling(0.05 + 1e-6 * i, sideband_order, nmax)
+    time_uncached = (time.perf_counter() - start) / repeats
+    start = time.perf_counter()
+    for i in range(repeats):
+        rc.compute_rabi_coupling(0.05, sideband_order, nmax)
+    time_cached = (time.perf_counter() - start) / repeats
+    print('sideband order {:d}: legacy {:.3f} ms, vectorized {:.3f} ms, cached {:.4f} ms'.format(
+        sideband_order, 1e3 * time_legacy, 1e3 * time_uncached, 1e3 * time_cached))
+
+# fit wall time
+time_new = time_fit()
+compute_rabi_coupling = rc.__dict__['compute_rabi_coupling']
+rc.compute_rabi_coupling = staticmethod(legacy_rabi_coupling)
+try:
+    time_old = time_fit()
+finally:
+    rc.compute_rabi_coupling = compute_rabi_coupling
+print('Rabi fit: legacy {:.3f} s, vectorized + cached {:.3f} s'.format(time_old, time_new))
@@ -0,0 +1,105 @@
+"""
+Benchmarks the chunked RotRamsey/RotRabi evaluation against the old implementation,
+which builds several dense (8 * sigma_l + 1) x N matrices per evaluation.
+Each evaluation is run in a separate process so that its peak memory (max RSS) can be measured.
+Requires the resource module, i.e. a unix system.
+Usage: python -m RealSimpleGrapher.analysis.tests.bench_rotational
+"""
+import sys
+import time
+import resource
+import subprocess
+import numpy as np
+
+from RealSimpleGrapher.analysis.fit_models import RotRamsey, RotRabi
+
+
+def legacy_rot_ramsey(model, times, order, sigma_l, Omega_MHz, delta_kHz=0.0, scale=1.0):
+    """
+    The old implementation of RotRamsey.rot_ramsey.
+    """
+    sigma_l = min(sigma_l, 3000.0)
+    Omega = Omega_MHz * 2 * np.pi * 1e6
+    delta = delta_kHz * 2 * np.pi * 1e3
+    (l_vals, c_ls) = model.calc_ls_cls(sigma_l)
+    delta_ls = 2 * model.omega_r * order * l_vals - delta
+    Omega_gens = np.sqrt(Omega ** 2 + delta_ls ** 2)
+    u1s = np.pi * Omega_gens / (4 * Omega)
+    u2s = 1 / 2.0 * np.outer(delta_ls, times)
+    return scale * np.sum(np.outer(np.abs(c_ls) ** 2, np.ones(len(times)))
+                          * (np.outer(2 * Omega / Omega_gens ** 2 * np.sin(u1s), np.ones(len(times)))
+                             * (np.outer(Omega_gens * np.cos(u1s), np.ones(len(times))) * np.cos(u2s)
+                                - np.outer(delta_ls * np.sin(u1s), np.ones(len(times))) * np.sin(u2s))) ** 2, axis=0)
+
+
+def legacy_rot_rabi_flop(model, times, order, sigma_l, Omega_MHz, delta_kHz=0.0, scale=1.0):
+    """
+    The old implementation of RotRabi.rot_rabi_flop.
+    """
+    sigma_l = min(sigma_l, 3000.0)
+    Omega = Omega_MHz * 2 * np.pi * 1e6
+    delta = delta_kHz * 2 * np.pi * 1e3
+    (l_vals, c_ls) = model.calc_ls_cls(sigma_l)
+    delta_ls = 2 * model.omega_r * order * l_vals - delta
+    return scale * np.sum(np.outer(c_ls ** 2 * Omega ** 2 / (Omega ** 2 + delta_ls ** 2), np.ones(len(times)))
+                          * np.sin(np.outer(np.sqrt(Omega ** 2 + delta_ls ** 2) / 2, times)) ** 2, axis=0)
+
+
+MODELS = {'RotRamsey': (RotRamsey, 'rot_ramsey', legacy_rot_ramsey),
+          'RotRabi': (RotRabi, 'rot_rabi_flop', legacy_rot_rabi_flop)}
+
+
+def evaluate(model_name, implementation, sigma_l, num_times, delta_kHz, repeats=3):
+    """
+    Evaluates a model and returns the time per evaluation (in s), and the result.
+    """
+    model_class, method, legacy = MODELS[model_name]
+    model = model_class()
+    model.omega_r = model.calc_omega_r(0.845, 0.1)
+    times = 1e-6 * np.linspace(0, 200, num_times)
+    args = (times, 4, sigma_l, 0.01, delta_kHz)
+    if implementation == 'legacy':
+        func = lambda: legacy(model, *args)
+    else:
+        model.use_symmetry = (implementation == 'symmetric')
+        func = lambda: getattr(model, method)(*args)
+    result = func()
+    start = time.perf_counter()
+    for i in range(repeats):
+        func()
+    return (time.perf_counter() - start) / repeats, result
+
+
+def run(model_name, implementation, sigma_l, num_times, delta_kHz):
+    """
+    Runs an evaluation in a separate process, and returns its time, peak memory (in MB), and result.
+    """
+    output = subprocess.run([sys.executable, '-m', __spec__.name, model_name, implementation,
+                             str(sigma_l), str(num_times), str(delta_kHz)],
+                            capture_output=True, text=True, check=True).stdout.split()
+    return float(output[0]), float(output[1]), np.array(output[2:], dtype=float)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        # evaluate in this process
+        model_name, implementation = sys.argv[1:3]
+        sigma_l, num_times, delta_kHz = float(sys.argv[3]), int(sys.argv[4]), float(sys.argv[5])
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        elapsed, result = evaluate(model_name, implementation, sigma_l, num_times, delta_kHz)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kB on linux
+        print(elapsed, (peak - baseline) / 1024., ' '.join(repr(value) for value in result))
+    else:
+        print('{:<10}{:>8}{:>6}{:>7}{:>12}{:>12}{:>14}{:>11}'.format(
+            'model', 'sigma_l', 'N', 'delta', 'impl', 'time (ms)', 'peak (MB)', 'max error'))
+        for model_name in MODELS:
+            for sigma_l, num_times, delta_kHz in ((300, 500, 0.), (3000, 500, 0.), (3000, 500, 2.)):
+                legacy_result = None
+                for implementation in ('legacy', 'chunked', 'symmetric'):
+                    elapsed, peak, result = run(model_name, implementation, sigma_l, num_times, delta_kHz)
+                    if legacy_result is None:
+                        legacy_result = result
+                    print('{:<10}{:>8}{:>6}{:>7}{:>12}{:>12.2f}{:>14.1f}{:>11.1e}'.format(
+                        model_name, sigma_l, num_times, delta_kHz, implementation, 1e3 * elapsed, peak,
+                        np.max(np.abs(result - legacy_result))))
@@ -53,6 +53,7 @@ class ModelTest(object):
 
     def print_results(self):
         print('***** FIT RESULTS *****')
-        print('{}\t{}\t{}'.format('PARAM', 'TRUE', 'FITTED'))
+        print('{}\t{}\t{}\t{}'.format('PARAM', 'TRUE', 'FITTED', 'ERROR'))
         for i, p in enumerate(self.fw.getParameters()):
-            print('{}\t{}\t{}'.format(p, self.true_params[i], self.fw.getFittedValue(p)))
+            print('{}\t{}\t{}\t{}'.format(p, self.true_params[i], self.fw.getFittedValue(p), self.fw.getFittedError(p)))
+        print(self.fw.result.summary())
@@ -0,0 +1,30 @@
+"""
+Test for batch fitting.
+Fits Lorentzians with a drifting center to many series, and prints the fitted center vs series index.
+"""
+import time
+import numpy as np
+from RealSimpleGrapher.analysis import BatchFitWrapper
+from RealSimpleGrapher.analysis.fit_models import Lorentzian
+
+
+if __name__ == '__main__':
+    num_series = 200
+    x = np.linspace(100, 200, 200)
+    true_centers = np.linspace(130., 170., num_series)
+    model = Lorentzian()
+    series_list = [(x, model.model(x, [center, 1., 5., 0.1]) + 0.02 * np.random.normal(size=len(x)))
+                   for center in true_centers]
+
+    for max_workers in (1, None):
+        bfw = BatchFitWrapper('Lorentzian', max_workers=max_workers)
+        start = time.perf_counter()
+        result = bfw.fit(series_list)
+        elapsed = time.perf_counter() - start
+        print('max_workers = {}: {:d} fits in {:.3f} s ({:d} function evaluations)'.format(
+            max_workers, num_series, elapsed, result.nfev))
+
+    print('***** FIT RESULTS *****')
+    print('{}\t{}\t{}'.format('INDEX', 'TRUE', 'FITTED'))
+    for i in range(0, num_series, 20):
+        print('{}\t{:.3f}\t{:.3f}'.format(i, true_centers[i], result.getParameter('center')[i]))
@@ -0,0 +1,35 @@
+"""
+Test for multi-start fitting.
+Fits multimodal models from their default guesses, with and without multi-start,
+and prints the fitted parameters, cost, wall time, and spread of the converged solutions.
+"""
+import numpy as np
+from RealSimpleGrapher.analysis import FitWrapper
+from RealSimpleGrapher.analysis.fit_models import RamseyDecay, Bessel
+
+
+class dataset(object):
+    def __init__(self, x, y):
+        self.data = np.column_stack((x, y))
+
+
+def compare(name, model, x, true_params, starts=16):
+    y = model.model(x, list(true_params)) + 0.02 * np.random.normal(size=len(x))
+    print('***** {} *****'.format(name))
+    print('TRUE\t{}'.format(true_params))
+    for num_starts in (1, starts):
+        fw = FitWrapper(dataset(x, y), 0)
+        fw.setModel(name)
+        for p in fw.getParameters():
+            fw.getManualValue(p)  # force guess of initial parameters
+        fw.setMultiStart(num_starts)
+        result = fw.doFit()
+        print('{:d} start(s)\t{}\tcost = {:.4g}'.format(
+            num_starts, [round(fw.getFittedValue(p), 4) for p in fw.getParameters()], result.cost))
+        if result.multistart is not None:
+            print(result.multistart)
+
+
+if __name__ == '__main__':
+    compare('RamseyDecay', RamseyDecay(), np.linspace(0, 200, 400), [52000, 150, 1, 0.5])
+    compare('Bessel', Bessel(), np.linspace(-100, 100, 800), [3, 1500, 2, 0.01, 1.2, 27.3, 6])
@@ -0,0 +1,33 @@
+"""
+Test for the spectral initial guesses of oscillatory models.
+Prints the true, guessed, and fitted parameters for evenly and unevenly sampled data.
+"""
+import numpy as np
+from RealSimpleGrapher.analysis import FitWrapper
+from RealSimpleGrapher.analysis.fit_models import Sinusoid, Sinusoid2, RamseyDecay, Rabi
+
+
+class dataset(object):
+    def __init__(self, x, y):
+        self.data = np.column_stack((x, y))
+
+
+def compare(name, model, x, true_params, noise=0.02):
+    y = model.model(x, list(true_params)) + noise * np.random.normal(size=len(x))
+    fw = FitWrapper(dataset(x, y), 0)
+    fw.setModel(name)
+    guess = [fw.getManualValue(p) for p in fw.getParameters()]
+    result = fw.doFit()
+    print('***** {} ({} function evaluations) *****'.format(name, result.nfev))
+    print('{}\t{}\t{}\t{}'.format('PARAM', 'TRUE', 'GUESS', 'FITTED'))
+    for i, p in enumerate(fw.getParameters()):
+        print('{}\t{}\t{:.6g}\t{:.6g}'.format(p, true_params[i], guess[i], fw.getFittedValue(p)))
+
+
+if __name__ == '__main__':
+    uneven = lambda xmin, xmax, steps: np.sort(np.random.uniform(xmin, xmax, steps))
+    compare('Sinusoid', Sinusoid(), np.linspace(0, 720, 60), [0.8, 200, 0])
+    compare('Sinusoid2', Sinusoid2(), uneven(0, 360, 60), [0.6, 35, 0])
+    compare('RamseyDecay', RamseyDecay(), np.linspace(0, 200, 400), [52000, 150, 1, 0.5])
+    compare('RamseyDecay', RamseyDecay(), uneven(0, 200, 400), [31000, 80, 0.9, 0.5])
+    compare('Rabi', Rabi(), np.linspace(0, 30, 200), [2 * np.pi / 7, 8, 0.05, 0, 0, 1.0])
@@ -10,8 +10,8 @@ from twisted.internet.task import LoopingCall
 from twisted.internet.defer import inlineCallbacks, returnValue
 
 from RealSimpleGrapher.TraceListWidget import TraceList
-from RealSimpleGrapher.DataVaultListWidget import DataVaultList
-from RealSimpleGrapher.pyqtgraph_widgets.artists import artistParameters, colorList
+from RealSimpleGrapher.DataVaultListWidget import DataVaultList, Dataset
+from RealSimpleGrapher.pyqtgraph_widgets.artists import artistParameters, colorList, AppendCurve
 
 from sys import settrace
 settrace(None)
@@ -25,7 +25,12 @@ class Graph_PyQtGraph(QWidget):
     """
 
     # SETUP
-    def __init__(self, reactor, config, cxn=None, parent=None, root=None):
+    def __init__(self, reactor, config, cxn=None, parent=None, root=None, live_update=True):
+        """
+        Arguments:
+            live_update (bool): whether the graph runs its own update loop. This should be False
+                                if the graph is updated externally (e.g. by the GraphWindow frame scheduler).
+        """
         # todo: clean up/modularize/document better
         super().__init__(parent)
         self.root = root
@@ -44,6 +49,9 @@ class Graph_PyQtGraph(QWidget):
         self.show_points = config.show_points
         self.grid_on = config.grid_on
         self.scatter_plot = config.scatter_plot
+        # dataset retention policy
+        self.max_rows = config.max_rows
+        self.max_span = config.max_span
         # set lines from config
         self.vline_name, self.vline_param = (config.vline, config.vline_param)
         self.hline_name, self.hline_param = (config.hline, config.hline_param)
@@ -55,12 +63,15 @@ class Graph_PyQtGraph(QWidget):
         # which is where points are received from the dataset objects
         # and pushed onto the plotwidget
         self.live_update_loop = LoopingCall(self._update_figure)
-        self.live_update_loop.start(0.25)
+        if live_update:
+            self.live_update_loop.start(0.25)
         # colors
         self.colorList = colorList
         self.colorChooser = cycle(colorList)
         # autoranging
         self.autoRangeEnable = True
+        # current x-axis limits of the view (used to decimate traces)
+        self.current_limits = None
         # startup
         self.initUI()
 
@@ -176,8 +187,11 @@ class Graph_PyQtGraph(QWidget):
             # update existing values
             existing_trace_names = self.datasets[dataset_ident]['trace_names']
             self.datasets[dataset_ident]['trace_names'] = set(dataset_trace_names)
-            # get old dataset
-            dataset = self.datasets[dataset_ident]['dataset']
+            # get old dataset and release the reference we were given
+            dataset_old = self.datasets[dataset_ident]['dataset']
+            if isinstance(dataset, Dataset):
+                dataset.release()
+            dataset = dataset_old
         # otherwise add new dataset to self.datasets
         else:
             self.datasets[dataset_ident] = {
@@ -185,6 +199,10 @@ class Graph_PyQtGraph(QWidget):
                 'trace_names': set(dataset_trace_names)
             }
             self.tracelist.addDataset(dataset_ident)
+            # limit the data held in memory for live monitor graphs
+            # (datasets may be shared between graphs, so each graph sets its own policy)
+            if isinstance(dataset, Dataset):
+                dataset.setRetention(self.max_rows, self.max_span, consumer=self)
         # get different traces and add each trace to artists
         diff_trace_names = list(set(dataset_trace_names) - existing_trace_names)
         for trace_name in diff_trace_names:
@@ -200,6 +218,15 @@ class Graph_PyQtGraph(QWidget):
         Arguments:
             dataset_ident   (dataset_location, dataset_name):  a unique identifier for a dataset.
         """
+        # remove auxiliary traces (e.g. fits) of the dataset, which aren't among its trace_names
+        # and would otherwise be left on the graph without a tracelist entry
+        trace_names = self.datasets.get(dataset_ident, {}).get('trace_names', set())
+        for artist_ident in [ident for ident in self.artists
+                             if (tuple(ident[:2]) == dataset_ident) and (ident[2] not in trace_names)]:
+            self.remove_artist(artist_ident)
+        # nothing else to remove for headers without a dataset (e.g. of a predicted spectrum)
+        if dataset_ident not in self.datasets:
+            return
         try:
             # get all traces currently in use
             existing_trace_names = self.datasets[dataset_ident]['trace_names']
@@ -224,14 +251,13 @@ class Graph_PyQtGraph(QWidget):
         if artist_ident not in self.artists.keys():
             new_color = next(self.colorChooser)
             trace_name = artist_ident[2]
+            # use append-only artists so that only new rows are drawn
             if self.show_points and (not no_points):
-                line = self.pw.plot([], [],
-                                    symbol=None, symbolBrush=new_color, pen=new_color,
-                                    name=trace_name, connect=self.scatter_plot,
-                                    SkipFiniteCheck=True)
+                line = AppendCurve(symbol=None, symbolBrush=new_color, pen=new_color,
+                                   name=trace_name, connect=self.scatter_plot)
             else:
-                line = self.pw.plot([], [],
-                                    symbol=None, pen=new_color, name=trace_name)
+                line = AppendCurve(symbol=None, pen=new_color, name=trace_name)
+            self.pw.addItem(line)
             if self.grid_on:
                 self.pw.showGrid(x=True, y=True)
             # add artist to holding dictionary and tracelist
@@ -252,16 +278,24 @@ class Graph_PyQtGraph(QWidget):
             artist = self.artists[artist_ident].artist
             # remove references to the artist
             self.pw.removeItem(artist)
+            # delete the artist
+            del self.artists[artist_ident]
             # remove the artist from dataset holder
             dataset_location, dataset_name, trace_name = artist_ident
             dataset_ident = (dataset_location, dataset_name)
+            # auxiliary traces (e.g. fits) don't belong to a dataset
+            if (dataset_ident not in self.datasets) or (trace_name not in self.datasets[dataset_ident]['trace_names']):
+                return
             trace_names = self.datasets[dataset_ident]['trace_names']
             trace_names.remove(trace_name)
-            # delete the artist
-            del self.artists[artist_ident]
             # if dataset has no active traces, remove the dataset
             if len(trace_names) == 0:
+                dataset = self.datasets[dataset_ident]['dataset']
                 del self.datasets[dataset_ident]
+                # release the dataset so it can stop listening and free its memory once unused
+                if isinstance(dataset, Dataset):
+                    dataset.removeRetention(self)
+                    dataset.release()
         except KeyError:
             print("Error in graphwidget.remove_artist: artist already deleted.")
             print("\tident:", artist_ident)
@@ -361,20 +395,74 @@ class Graph_PyQtGraph(QWidget):
         """
         The main update loop which updates the artists
         with data from the Datasets.
+        Dataset.data is a chronological view of the dataset buffer
+        (even for circular buffers), so no data is copied here.
+        Artists are redrawn if their dataset has been updated or if the view has changed,
+        since long traces are decimated according to the view.
         """
+        if len(self.artists) == 0:
+            return
+        view = self._getView()
         for artist_params in self.artists.values():
             if artist_params.shown:
                 try:
                     ds = artist_params.dataset
                     current_update = ds.updateCounter
-                    if artist_params.last_update < current_update:
+                    if (artist_params.last_update < current_update) or (artist_params.last_view != view):
                         x = ds.data[:, 0]
                         y = ds.data[:, artist_params.index + 1]
                         artist_params.last_update = current_update
-                        artist_params.artist.setData(x, y)
+                        artist_params.last_view = view
+                        self._draw(artist_params, x, y, view)
                 except Exception as e:
                     print('Error in graphwidget._update_figure:', e)
 
+    def _getView(self):
+        """
+        Returns the x-axis limits and pixel width of the view, which are used to decimate traces.
+        The limits are None if the x-axis is autoranging, since the full trace must be drawn
+        for the autorange to be correct.
+        """
+        vb = self.pw.plotItem.vb
+        width = int(vb.width())
+        if vb.autoRangeEnabled()[0] or (self.current_limits is None):
+            return (None, width)
+        return (tuple(self.current_limits), width)
+
+    def _draw(self, artist_params, x, y, view):
+        """
+        Draws a trace onto its artist.
+        Long traces are decimated so that only ~2 points per pixel are drawn.
+        Each bucket of points is drawn as its minimum and maximum, so the envelope of the trace is preserved.
+        Otherwise, only the rows of a Dataset which haven't been drawn yet are appended to the artist.
+        Arguments:
+            artist_params   (artistParameters): the artist to draw.
+            x               (np.array)        : the x-values of the trace.
+            y               (np.array)        : the y-values of the trace.
+            view            (limits, width)   : the view returned by _getView.
+        """
+        ds = artist_params.dataset
+        artist = artist_params.artist
+        limits, width = view
+        # fit/spectrum traces aren't Dataset objects, and their data is replaced instead of appended to
+        if isinstance(ds, Dataset):
+            offset, source = ds.offset, ds.buffer
+        else:
+            offset, source = 0, None
+        # decimation is done in linear x-space
+        if artist_params.logModeX or (width <= 0) or (len(x) <= 2 * width):
+            if source is None:
+                artist.setData(x, y)
+            else:
+                artist.extendData(x, y, offset, source)
+            return
+        pyramid = artist_params.pyramid
+        # data which is replaced (rather than appended to) must rebuild the pyramid
+        pyramid.extend(x, y, offset, ds.data if source is None else source)
+        if limits is None:
+            limits = (x[0], x[-1])
+        artist.setData(*pyramid.decimate(x, y, offset, limits[0], limits[1], width))
+
     def _makeDatasetIdent(self, dataset_ident):
         """
         Creates an identifier unique to each dataset.
@@ -1,4 +1,5 @@
-from queue import Queue, Full as QueueFull
+import time
+from collections import OrderedDict
 
 import pyqtgraph as pg
 from itertools import cycle
@@ -10,7 +11,9 @@ from twisted.internet.task import LoopingCall
 from twisted.internet.defer import inlineCallbacks, returnValue
 
 from RealSimpleGrapher.TraceListWidget import TraceList
+from RealSimpleGrapher.DataVaultListWidget import Dataset
 from RealSimpleGrapher.pyqtgraph_widgets.artists import artistParameters, colorList
+from RealSimpleGrapher.pyqtgraph_widgets.histogram import HistogramAccumulator
 # todo: make an offshoot of graphwidgetpyqtgraph
 
 
@@ -19,8 +22,17 @@ class Hist_PyQtGraph(QWidget):
     todo: document
     """
 
-    def __init__(self, reactor, config, cxn=None, parent=None):
+    # minimum time between redraws (in seconds)
+    redraw_interval = 0.1
+
+    def __init__(self, reactor, config, cxn=None, parent=None, root=None, live_update=True):
+        """
+        Arguments:
+            live_update (bool): whether the graph runs its own update loop. This should be False
+                                if the graph is updated externally (e.g. by the GraphWindow frame scheduler).
+        """
         super(Hist_PyQtGraph, self).__init__(parent)
+        self.root = root
         self.cxn = cxn
         # get parameter vault
         for server_name in self.cxn.servers.keys():
@@ -32,9 +44,16 @@ class Hist_PyQtGraph(QWidget):
         self.name = config.name
         self.vline_name = config.vline
         self.vline_param = config.vline_param
-        self.dataset_queue = Queue(config.max_datasets)
+        # datasets and the names of their traces, in order of use (least recently used first)
+        self.datasets = OrderedDict()
+        self.max_datasets = config.max_datasets
+        # binning of the histograms
+        self.bin_width = config.bin_width
+        self.bin_range = config.bin_range
+        self.last_redraw = 0
         self.live_update_loop = LoopingCall(self.update_figure)
-        self.live_update_loop.start(0)
+        if live_update:
+            self.live_update_loop.start(0.25)
         self.colorChooser = cycle(colorList)
         self.initUI()
 
@@ -87,44 +106,70 @@ class Hist_PyQtGraph(QWidget):
         return color_dict[color]
 
     def update_figure(self):
+        """
+        Adds the new rows of each dataset to the histograms of its artists,
+        and redraws the histograms which changed.
+        Only rows which haven't been binned yet are added (see HistogramAccumulator),
+        and updates are limited to one every redraw_interval, however often this is called.
+        """
+        now = time.monotonic()
+        if now - self.last_redraw < self.redraw_interval:
+            return
+        self.last_redraw = now
         for ident, params in self.artists.items():
             if params.shown:
                 try:
                     ds = params.dataset
-                    index = params.index
                     current_update = ds.updateCounter
-                    if params.last_update < current_update:
-                        x = ds.data[:, 0]
-                        x = list(x) + [x[-1] + 1]
-                        y = ds.data[:, index + 1]
+                    if (params.last_update < current_update) and (ds.data is not None):
                         params.last_update = current_update
-                        params.artist.setData(x, y)
-                except:
-                    pass
+                        params.histogram.extend(ds.data[:, 0], ds.data[:, params.index + 1], ds.offset, ds.buffer)
+                    if params.histogram.changed:
+                        params.histogram.changed = False
+                        params.artist.setData(params.histogram.edges(), params.histogram.counts)
+                except Exception as e:
+                    print('Error in histwidget.update_figure:', e)
 
     def add_artist(self, ident, dataset, index, no_points=False):
         """
         no_points is an override parameter to the global show_points setting.
         It is to allow data fits to be plotted without points
         """
-        new_color = self.colorChooser.next()
+        new_color = next(self.colorChooser)
         hist = pg.PlotCurveItem([0, 1], [1], stepMode=True, fillLevel=0, brush=new_color, pen=None)
         self.artists[ident] = artistParameters(hist, dataset, index, True)
+        self.artists[ident].histogram = HistogramAccumulator(self.bin_width, self.bin_range)
         self.pw.addItem(hist)
         self.tracelist.addTrace(ident, new_color)
 
     def remove_artist(self, ident):
+        """
+        Removes an artist (i.e. trace) from the PlotWidget.
+        Called by the TraceListWidget, which removes the trace from itself.
+        The dataset is released once all its traces are removed.
+        Arguments:
+            ident   (dataset_location, dataset_name, trace_name): a unique identifier for an artist.
+        """
         try:
             artist = self.artists[ident].artist
             self.pw.removeItem(artist)
-            self.tracelist.removeTrace(ident)
             self.artists[ident].shown = False
-            try:
-                del self.artists[ident]
-            except KeyError:
-                pass
+            del self.artists[ident]
+            dataset_ident, trace_name = ident[:2], ident[2]
+            if dataset_ident not in self.datasets:
+                return
+            trace_names = self.datasets[dataset_ident]['trace_names']
+            trace_names.discard(trace_name)
+            # if dataset has no active traces, remove and release the dataset
+            if len(trace_names) == 0:
+                dataset = self.datasets.pop(dataset_ident)['dataset']
+                if isinstance(dataset, Dataset):
+                    dataset.release()
+        except KeyError:
+            print("Error in histwidget.remove_artist: artist already deleted.")
+            print("\tident:", ident)
         except Exception as e:
-            print("Remove failed")
+            print("Error in histwidget.remove_artist: remove failed:", e)
 
     def display(self, ident, shown):
         try:
@@ -141,9 +186,9 @@ class Hist_PyQtGraph(QWidget):
     def checkboxChanged(self):
         for ident, item in self.tracelist.trace_dict.items():
             try:
-                if item.checkState() and not self.artists[ident].shown:
+                if item.checkState(0) and not self.artists[ident].shown:
                     self.display(ident, True)
-                if not item.checkState() and self.artists[ident].shown:
+                if not item.checkState(0) and self.artists[ident].shown:
                     self.display(ident, False)
             except KeyError:  # this means the artist has been deleted.
                 pass
@@ -155,21 +200,77 @@ class Hist_PyQtGraph(QWidget):
 
     @inlineCallbacks
     def add_dataset(self, dataset):
+        """
+        Adds a dataset, evicting the least recently used datasets if there are more than max_datasets.
+        Adding a dataset which is already shown marks it as the most recently used.
+        Arguments:
+            dataset (Dataset): the dataset to add.
+        """
+        dataset_ident = self._makeDatasetIdent(dataset.dataset_location)
+        if dataset_ident in self.datasets:
+            self.datasets.move_to_end(dataset_ident)
+            # release the reference we were given (shared datasets are the same object,
+            # but each add still holds its own reference)
+            if isinstance(dataset, Dataset):
+                dataset.release()
+            return
+        # reserve the entry while the labels are fetched, so the dataset isn't added twice
+        # if it's added again in the meantime
+        entry = {
+            'dataset': dataset,
+            'trace_names': set()
+        }
+        self.datasets[dataset_ident] = entry
         try:
-            self.dataset_queue.put(dataset, block=False)
-        except QueueFull:
-            remove_ds = self.dataset_queue.get()
-            self.remove_dataset(remove_ds)
-            self.dataset_queue.put(dataset, block=False)
-        labels = yield dataset.getLabels()
+            labels = yield dataset.getLabels()
+        except Exception:
+            if self.datasets.get(dataset_ident) is entry:
+                del self.datasets[dataset_ident]
+            raise
+        # the dataset was removed (and released) while the labels were fetched
+        if self.datasets.get(dataset_ident) is not entry:
+            return
+        entry['trace_names'] = set(labels)
+        self.tracelist.addDataset(dataset_ident)
         for i, label in enumerate(labels):
-            self.add_artist(label, dataset, i)
+            self.add_artist((*dataset_ident, label), dataset, i)
+        # evict the least recently used datasets
+        while (self.max_datasets is not None) and (len(self.datasets) > self.max_datasets):
+            self._evict(next(iter(self.datasets)))
 
-    @inlineCallbacks
-    def remove_dataset(self, dataset):
-        labels = yield dataset.getLabels()
-        for label in labels:
-            self.remove_artist(label)
+    def _evict(self, dataset_ident):
+        """
+        Removes a dataset and all its traces from the graph and the TraceListWidget.
+        The traces are looked up locally, so no data vault calls are needed.
+        """
+        if dataset_ident in self.tracelist.dataset_dict:
+            # removes the header, which calls remove_dataset
+            self.tracelist.removeDataset(dataset_ident)
+        else:
+            self.remove_dataset(dataset_ident)
+
+    def remove_dataset(self, dataset_ident):
+        """
+        Removes all the traces of a dataset, which releases the dataset.
+        Arguments:
+            dataset_ident   (dataset_location, dataset_name): a unique identifier for a dataset.
+        """
+        if dataset_ident not in self.datasets:
+            return
+        for trace_name in tuple(self.datasets[dataset_ident]['trace_names']):
+            self.remove_artist((*dataset_ident, trace_name))
+        # release datasets without any traces
+        entry = self.datasets.pop(dataset_ident, None)
+        if (entry is not None) and isinstance(entry['dataset'], Dataset):
+            entry['dataset'].release()
+
+    def _makeDatasetIdent(self, dataset_ident):
+        """
+        Creates an identifier unique to each dataset.
+        """
+        directory_list, dataset_name = dataset_ident
+        dataset_location = '\\'.join(directory_list)
+        return (dataset_location, dataset_name)
 
     def set_xlimits(self, limits):
         self.pw.setXRange(limits[0], limits[1])
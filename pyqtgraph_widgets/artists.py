@@ -2,10 +2,14 @@
 Contains helper objects used by the pyqtgraph widgets
 to create and store traces.
 """
+import numpy as np
+import pyqtgraph as pg
 from itertools import cycle
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QColor
 
+from RealSimpleGrapher.pyqtgraph_widgets.decimation import DecimationPyramid
+
 
 class artistParameters:
     """
@@ -28,6 +32,243 @@ class artistParameters:
         # lodModeX/Y: keeps track of log mode
         self.logModeX = False
         self.logModeY = False
+        # pyramid: level-of-detail cache used to decimate long traces
+        # last_view: the view (x-range and pixel width) which was last drawn
+        self.pyramid = DecimationPyramid()
+        self.last_view = None
+
+
+class AppendCurve(pg.ItemGroup):
+    """
+    An append-only trace which only draws rows that it hasn't already drawn.
+    Rows are drawn in fixed-size chunks, each of which is held by its own PlotDataItem.
+    Appending rows only redraws the last (i.e. open) chunk; full chunks are never redrawn.
+    The data bounds of each chunk are cached so that autoranging doesn't rescan the data.
+    Can be used in place of the PlotDataItem returned by PlotWidget.plot.
+    """
+
+    # number of rows held by each chunk
+    chunk_rows = 10000
+
+    def __init__(self, **opts):
+        """
+        Arguments:
+            opts: style options passed to each PlotDataItem (e.g. pen, symbol, name).
+        """
+        super(AppendCurve, self).__init__()
+        self.opts = opts
+        self.logMode = [False, False]
+        self.chunks = []
+        # bounds: cached data bounds of all chunks, i.e. [[xmin, xmax], [ymin, ymax]]
+        self.bounds = None
+        # source: the storage holding the rows that were drawn (e.g. a DataBuffer)
+        # offset: the absolute index of the first row that is drawn
+        # rendered: the absolute index one past the last row that was drawn,
+        #   or None if the drawn data isn't a sequence of rows (i.e. after setData)
+        self.source = None
+        self.offset = 0
+        self.rendered = None
+
+    def name(self):
+        return self.opts.get('name', None)
+
+    def setData(self, *args, **kwargs):
+        """
+        Sets the style options of the trace, and replaces the drawn data if x and y are given.
+        Arguments:
+            args    (x, y): the data to draw.
+            kwargs        : style options passed to each PlotDataItem.
+        """
+        if kwargs:
+            self.opts.update(kwargs)
+            for chunk in self.chunks:
+                chunk.item.setData(**kwargs)
+        if len(args) == 2:
+            self._clear()
+            self._push(np.asarray(args[0]), np.asarray(args[1]))
+            self.rendered = None
+
+    def extendData(self, x, y, offset=0, source=None):
+        """
+        Draws any rows which haven't been drawn yet.
+        Chunks whose rows have all been discarded from the source are removed.
+        Arguments:
+            x       (np.array): the x-values of all rows held by the source.
+            y       (np.array): the y-values of all rows held by the source.
+            offset  (int)     : the absolute index of the first row (i.e. the number of rows discarded).
+            source  (object)  : the storage holding the rows. Everything is redrawn if it changes.
+        """
+        end = offset + len(x)
+        # redraw everything if the rows can't be appended to those already drawn
+        if (self.rendered is None) or (source is not self.source) or (offset < self.offset)\
+                or (end < self.rendered) or (offset > self.rendered):
+            self._clear()
+            self.source = source
+            self.rendered = offset
+        elif offset > self.offset:
+            self._discard(offset)
+        self.offset = offset
+        if end > self.rendered:
+            self._push(x[self.rendered - offset:], y[self.rendered - offset:], self.rendered)
+            self.rendered = end
+
+    def setLogMode(self, xMode, yMode):
+        self.logMode = [bool(xMode), bool(yMode)]
+        for chunk in self.chunks:
+            chunk.item.setLogMode(*self.logMode)
+        self.informViewBoundsChanged()
+
+    def dataBounds(self, ax, frac=1.0, orthoRange=None):
+        """
+        Returns the cached data bounds along an axis. Called by the ViewBox when autoranging.
+        """
+        if self.bounds is None:
+            return [None, None]
+        lower, upper = self.bounds[ax]
+        if self.logMode[ax]:
+            if lower <= 0:
+                return [None, None]
+            lower, upper = np.log10(lower), np.log10(upper)
+        return [lower, upper]
+
+    def _push(self, x, y, start=0):
+        """
+        Draws rows after the rows which have already been drawn.
+        """
+        i = 0
+        while i < len(x):
+            if (len(self.chunks) == 0) or self.chunks[-1].full():
+                self._addChunk(start + i)
+            chunk = self.chunks[-1]
+            i += chunk.append(x[i:], y[i:])
+        self._updateBounds()
+        self.informViewBoundsChanged()
+
+    def _addChunk(self, start):
+        """
+        Starts a new chunk. The chunk begins with the last point of the previous chunk
+        so that the trace is drawn without any gaps.
+        """
+        chunk = _curveChunk(self.chunk_rows, start, self.opts)
+        chunk.item.setLogMode(*self.logMode)
+        chunk.item.setParentItem(self)
+        if len(self.chunks) > 0:
+            chunk.setFirstPoint(*self.chunks[-1].lastPoint())
+        self.chunks.append(chunk)
+
+    def _discard(self, offset):
+        """
+        Removes chunks whose rows have all been discarded,
+        and trims the discarded rows from the front of the first remaining chunk.
+        """
+        while (len(self.chunks) > 0) and (self.chunks[0].stop <= offset):
+            self._removeChunk(self.chunks.pop(0))
+        if len(self.chunks) > 0:
+            self.chunks[0].trim(offset)
+        self._updateBounds()
+        self.informViewBoundsChanged()
+
+    def _clear(self):
+        """
+        Removes all chunks.
+        """
+        for chunk in self.chunks:
+            self._removeChunk(chunk)
+        self.chunks = []
+        self.bounds = None
+
+    def _removeChunk(self, chunk):
+        scene = chunk.item.scene()
+        chunk.item.setParentItem(None)
+        if scene is not None:
+            scene.removeItem(chunk.item)
+
+    def _updateBounds(self):
+        """
+        Combines the cached bounds of each chunk.
+        """
+        chunk_bounds = [chunk.bounds for chunk in self.chunks if chunk.bounds is not None]
+        if len(chunk_bounds) == 0:
+            self.bounds = None
+            return
+        chunk_bounds = np.array(chunk_bounds)
+        self.bounds = [[chunk_bounds[:, 0].min(), chunk_bounds[:, 1].max()],
+                       [chunk_bounds[:, 2].min(), chunk_bounds[:, 3].max()]]
+
+
+class _curveChunk(object):
+    """
+    Holds a fixed-size chunk of rows for an AppendCurve.
+    """
+
+    def __init__(self, chunk_rows, start, opts):
+        self.item = pg.PlotDataItem(**opts)
+        # one extra point is reserved for the last point of the previous chunk
+        self.x = np.zeros(chunk_rows + 1)
+        self.y = np.zeros(chunk_rows + 1)
+        self.count = 0
+        # absolute indices of the rows held by the chunk
+        self.start = start
+        self.stop = start
+        # bounds: [xmin, xmax, ymin, ymax] of the rows held by the chunk
+        self.bounds = None
+
+    def full(self):
+        return self.count == len(self.x)
+
+    def setFirstPoint(self, x, y):
+        self.x[0], self.y[0] = x, y
+        self.count = 1
+
+    def lastPoint(self):
+        return self.x[self.count - 1], self.y[self.count - 1]
+
+    def append(self, x, y):
+        """
+        Appends as many rows as fit into the chunk and redraws the chunk.
+        Returns:
+            int: the number of rows appended.
+        """
+        num_rows = min(len(x), len(self.x) - self.count)
+        self.x[self.count: self.count + num_rows] = x[:num_rows]
+        self.y[self.count: self.count + num_rows] = y[:num_rows]
+        self.count += num_rows
+        self.stop += num_rows
+        self.item.setData(self.x[:self.count], self.y[:self.count])
+        # update cached bounds with the new rows
+        new_bounds = self._rowBounds(x[:num_rows], y[:num_rows])
+        if new_bounds is not None:
+            if self.bounds is None:
+                self.bounds = new_bounds
+            else:
+                self.bounds = [min(self.bounds[0], new_bounds[0]), max(self.bounds[1], new_bounds[1]),
+                               min(self.bounds[2], new_bounds[2]), max(self.bounds[3], new_bounds[3])]
+        return num_rows
+
+    def trim(self, offset):
+        """
+        Removes the rows before the given absolute index (including the last point
+        of the previous chunk), and redraws the chunk.
+        """
+        # the rows of the chunk are the last (stop - start) points
+        num_points = min(self.count, self.stop - max(offset, self.start))
+        if num_points >= self.count:
+            return
+        self.x[:num_points] = self.x[self.count - num_points: self.count]
+        self.y[:num_points] = self.y[self.count - num_points: self.count]
+        self.count = num_points
+        self.start = max(offset, self.start)
+        self.item.setData(self.x[:self.count], self.y[:self.count])
+        self.bounds = self._rowBounds(self.x[:self.count], self.y[:self.count])
+
+    def _rowBounds(self, x, y):
+        """
+        Returns [xmin, xmax, ymin, ymax] of the finite values of the rows, or None if there are none.
+        """
+        x, y = x[np.isfinite(x)], y[np.isfinite(y)]
+        if (len(x) == 0) or (len(y) == 0):
+            return None
+        return [x.min(), x.max(), y.min(), y.max()]
 
 
 """
@@ -0,0 +1,186 @@
+"""
+Level-of-detail decimation for long traces.
+Used by the pyqtgraph widgets to only send ~2 points per pixel to pyqtgraph.
+"""
+import numpy as np
+from RealSimpleGrapher.DataVaultListWidget.DataBuffer import DataBuffer
+
+
+class DecimationPyramid(object):
+    """
+    A min/max decimation pyramid for a single trace.
+    Level k divides the trace into buckets of (base_rows * 2**k) rows,
+    and stores the (index, value) of the minimum and maximum y-value within each bucket.
+    The pyramid is extended incrementally as rows are appended to the trace,
+    and buckets are dropped from the front as rows are discarded from the trace.
+    Indices are absolute, i.e. they count rows discarded from the front of the dataset.
+    """
+
+    # number of rows per bucket at the lowest level
+    base_rows = 8
+    # maximum number of levels
+    max_levels = 32
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Clears the pyramid.
+        """
+        self.source = None
+        # each level is a DataBuffer with columns [min_index, min_y, max_index, max_y]
+        self.levels = []
+        # absolute bucket number of the first bucket stored in each level
+        self.level_first = []
+        # absolute index of the first/last rows of the trace seen so far
+        self.offset = 0
+        self.end = 0
+        # decimation relies on searchsorted, so x must be monotonically increasing
+        self.monotonic = True
+        self.last_x = None
+
+    def extend(self, x, y, offset=0, source=None):
+        """
+        Updates the pyramid with the current state of the trace.
+        Arguments:
+            x       (np.array): the x-values of the trace.
+            y       (np.array): the y-values of the trace.
+            offset  (int)     : the absolute index of the first row (i.e. the number of rows discarded).
+            source  (object)  : identifies the storage holding the trace. The pyramid is rebuilt
+                                if the source changes (e.g. if the storage was replaced).
+        """
+        end = offset + len(x)
+        # rebuild if the trace was replaced or shrunk
+        if (source is not self.source) or (offset < self.offset) or (end < self.end):
+            self.reset()
+            self.source = source
+            self.offset = offset
+            self.end = offset
+        # drop buckets which contain discarded rows
+        if offset > self.offset:
+            self._trim(offset)
+        # check that the new x-values keep the trace monotonic
+        start = max(self.end, offset)
+        if self.monotonic and (end > start):
+            x_new = x[start - offset:]
+            if self.last_x is not None:
+                x_new = np.concatenate(([self.last_x], x_new))
+            if not np.all(np.diff(x_new) >= 0):
+                self.monotonic = False
+            self.last_x = x[-1]
+        self.offset = offset
+        self.end = end
+        # add new buckets to each level
+        self._extendBase(y, offset)
+        for level in range(1, self.max_levels):
+            if not self._extendLevel(level):
+                break
+
+    def decimate(self, x, y, offset, xmin, xmax, width):
+        """
+        Returns the points of the trace to draw within the given x-range.
+        The pyramid must already be extended with the current state of the trace.
+        Arguments:
+            x       (np.array): the x-values of the trace.
+            y       (np.array): the y-values of the trace.
+            offset  (int)     : the absolute index of the first row.
+            xmin    (float)   : the lower limit of the x-range.
+            xmax    (float)   : the upper limit of the x-range.
+            width   (int)     : the width of the x-range in pixels.
+        Returns:
+            (np.array, np.array): the decimated x and y values.
+        """
+        num_rows = len(x)
+        if (not self.monotonic) or (num_rows == 0) or (width <= 0):
+            return x, y
+        # include one point on either side of the range so lines reach the edges
+        i0 = max(np.searchsorted(x, xmin, side='left') - 1, 0)
+        i1 = min(np.searchsorted(x, xmax, side='right') + 1, num_rows)
+        if i1 - i0 <= 2 * width:
+            return x[i0: i1], y[i0: i1]
+        # get the coarsest level which still has at most one bucket per pixel
+        rows_per_pixel = (i1 - i0) / width
+        level = int(np.floor(np.log2(rows_per_pixel / self.base_rows))) if rows_per_pixel >= self.base_rows else -1
+        level = min(level, len(self.levels) - 1)
+        while (level >= 0) and (self.levels[level].size == 0):
+            level -= 1
+        if level < 0:
+            return x[i0: i1], y[i0: i1]
+        bucket_rows = self.base_rows * 2 ** level
+        buffer = self.levels[level]
+        first = self.level_first[level]
+        # get the buckets which lie completely within the range
+        b0 = max(-(-(offset + i0) // bucket_rows), first)
+        b1 = min((offset + i1) // bucket_rows, first + buffer.size)
+        if b1 <= b0:
+            return x[i0: i1], y[i0: i1]
+        buckets = buffer.data[b0 - first: b1 - first]
+        # draw the min and max of each bucket in order of their x-values
+        bucket_indices = np.empty(2 * len(buckets), dtype=np.int64)
+        bucket_indices[0::2] = np.minimum(buckets[:, 0], buckets[:, 2])
+        bucket_indices[1::2] = np.maximum(buckets[:, 0], buckets[:, 2])
+        # draw rows which aren't covered by the buckets as-is
+        indices = np.concatenate((np.arange(i0, b0 * bucket_rows - offset),
+                                  bucket_indices - offset,
+                                  np.arange(b1 * bucket_rows - offset, i1)))
+        return x[indices], y[indices]
+
+    def _trim(self, offset):
+        """
+        Drops all buckets which start before the given absolute index.
+        """
+        for level, buffer in enumerate(self.levels):
+            bucket_rows = self.base_rows * 2 ** level
+            num_buckets = -(-offset // bucket_rows) - self.level_first[level]
+            if num_buckets > 0:
+                buffer.discard(num_buckets)
+                self.level_first[level] += num_buckets
+
+    def _extendBase(self, y, offset):
+        """
+        Adds all new complete buckets to the lowest level.
+        """
+        if len(self.levels) == 0:
+            # first bucket must not contain any discarded rows
+            first = -(-offset // self.base_rows)
+            self.levels.append(DataBuffer(4))
+            self.level_first.append(first)
+        buffer = self.levels[0]
+        start = (self.level_first[0] + buffer.size) * self.base_rows
+        stop = (self.end // self.base_rows) * self.base_rows
+        if stop <= start:
+            return
+        segment = y[start - offset: stop - offset].reshape(-1, self.base_rows)
+        bucket_starts = np.arange(start, stop, self.base_rows)
+        rows = np.arange(len(segment))
+        min_index = np.argmin(segment, axis=1)
+        max_index = np.argmax(segment, axis=1)
+        buffer.append(np.column_stack((bucket_starts + min_index, segment[rows, min_index],
+                                       bucket_starts + max_index, segment[rows, max_index])))
+
+    def _extendLevel(self, level):
+        """
+        Adds all new complete buckets to a level by merging pairs of buckets from the level below.
+        Returns:
+            bool: whether the level holds any buckets.
+        """
+        below = self.levels[level - 1]
+        below_first = self.level_first[level - 1]
+        if len(self.levels) <= level:
+            if below.size < 2:
+                return False
+            self.levels.append(DataBuffer(4))
+            self.level_first.append(-(-below_first // 2))
+        buffer = self.levels[level]
+        # merge pairs which haven't been merged yet
+        start = self.level_first[level] + buffer.size
+        stop = (below_first + below.size) // 2
+        if stop > start:
+            pairs = below.data[2 * start - below_first: 2 * stop - below_first]
+            left, right = pairs[0::2], pairs[1::2]
+            merged = np.where((left[:, 1] <= right[:, 1])[:, None], left, right)
+            merged_max = np.where((left[:, 3] >= right[:, 3])[:, None], left, right)
+            merged[:, 2:] = merged_max[:, 2:]
+            buffer.append(merged)
+        return buffer.size > 0
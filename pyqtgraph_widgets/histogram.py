@@ -0,0 +1,159 @@
+"""
+Incremental histograms for the histogram widget.
+Only rows which haven't been binned yet are added to the histogram.
+"""
+import numpy as np
+
+
+class HistogramAccumulator(object):
+    """
+    A histogram of a trace which is accumulated incrementally as rows are appended to the trace.
+    Each row adds its y-value to the bin containing its x-value, so a trace can either be
+    a histogram itself (e.g. x = photon counts, y = number of occurrences) or raw shots (y = 1).
+    Bins are evenly spaced, and are either fixed (rows outside the range are dropped),
+    or adaptive, in which case the bins grow to cover the data and pairs of bins are
+    merged (doubling the bin width) whenever there are more than max_bins.
+    The histogram is rebuilt from the remaining rows if rows are discarded from the front of the trace,
+    since the counts of the discarded rows can't be subtracted.
+    """
+
+    # maximum number of adaptive bins
+    max_bins = 4096
+    # tolerance for x-values which lie on a bin edge, as a fraction of the bin width
+    edge_tolerance = 1e-6
+
+    def __init__(self, bin_width=None, bin_range=None):
+        """
+        Arguments:
+            bin_width   (float)       : the width of each bin. If None, the bin width is taken from
+                                        the smallest spacing of the first x-values (e.g. 1 for photon counts).
+            bin_range   (float, float): fixes the bins to cover this range. If None, the bins are adaptive.
+        """
+        self.bin_width = bin_width
+        self.bin_range = bin_range
+        self.reset()
+
+    def reset(self):
+        """
+        Clears the histogram and its bins.
+        """
+        self.source = None
+        # bin k covers [origin + (first + k) * width, origin + (first + k + 1) * width)
+        self.origin = None
+        self.width = None
+        self.first = 0
+        self.counts = np.zeros(0)
+        # number of rows which fell outside of fixed bins
+        self.outside = 0
+        # absolute index of the first/last rows of the trace seen so far
+        self.offset = 0
+        self.end = 0
+        # whether the histogram changed since it was last drawn
+        self.changed = True
+        if self.bin_range is not None:
+            self.origin = self.bin_range[0]
+            self.width = self.bin_width if self.bin_width is not None else 1.
+            num_bins = max(int(np.ceil((self.bin_range[1] - self.bin_range[0]) / self.width)), 1)
+            self.counts = np.zeros(num_bins)
+
+    def edges(self):
+        """
+        Returns the edges of the bins, i.e. len(counts) + 1 values.
+        """
+        if self.origin is None:
+            return np.zeros(1)
+        return self.origin + (self.first + np.arange(len(self.counts) + 1)) * self.width
+
+    def extend(self, x, y, offset=0, source=None):
+        """
+        Updates the histogram with the current state of the trace.
+        Arguments:
+            x       (np.array): the x-values of the trace.
+            y       (np.array): the y-values of the trace.
+            offset  (int)     : the absolute index of the first row (i.e. the number of rows discarded).
+            source  (object)  : identifies the storage holding the trace. The histogram is rebuilt
+                                if the source changes (e.g. if the storage was replaced).
+        """
+        end = offset + len(x)
+        # rebuild if the trace was replaced or shrunk
+        if (source is not self.source) or (offset < self.offset) or (end < self.end):
+            self.reset()
+            self.source = source
+            self.end = offset
+        # rebuild from the remaining rows if rows were discarded, keeping the current bins
+        elif offset > self.offset:
+            self.counts[:] = 0
+            self.outside = 0
+            self.end = offset
+            self.changed = True
+        self.offset = offset
+        if end > self.end:
+            self._add(x[self.end - offset:], y[self.end - offset:])
+            self.end = end
+
+    def _add(self, x, y):
+        """
+        Adds rows to the histogram.
+        """
+        finite = np.isfinite(x) & np.isfinite(y)
+        x, y = x[finite], y[finite]
+        if len(x) == 0:
+            return
+        if self.origin is None:
+            self._setupBins(x)
+        indices = np.floor((x - self.origin) / self.width + self.edge_tolerance).astype(np.int64)
+        if self.bin_range is None:
+            indices = self._growBins(indices)
+        indices -= self.first
+        inside = (indices >= 0) & (indices < len(self.counts))
+        self.outside += int(np.sum(~inside))
+        self.counts += np.bincount(indices[inside], weights=y[inside], minlength=len(self.counts))
+        self.changed = True
+
+    def _setupBins(self, x):
+        """
+        Places the adaptive bins using the first x-values.
+        """
+        self.origin = np.min(x)
+        self.width = self.bin_width
+        if self.width is None:
+            spacing = np.diff(np.unique(x))
+            self.width = np.min(spacing) if len(spacing) > 0 else 1.
+        self.first = 0
+        self.counts = np.zeros(0)
+
+    def _growBins(self, indices):
+        """
+        Grows the adaptive bins to cover the given bin indices, merging bins if there are too many.
+        Returns:
+            np.array: the indices of the bins in terms of the (possibly merged) bins.
+        """
+        low = min(np.min(indices), self.first) if len(self.counts) else np.min(indices)
+        high = max(np.max(indices) + 1, self.first + len(self.counts)) if len(self.counts) else np.max(indices) + 1
+        # merge pairs of bins until the range fits within max_bins
+        while high - low > self.max_bins:
+            self._merge()
+            indices = indices // 2
+            low, high = low // 2, -(-high // 2)
+        if len(self.counts) == 0:
+            self.first = low
+            self.counts = np.zeros(high - low)
+        elif (low < self.first) or (high > self.first + len(self.counts)):
+            self.counts = np.pad(self.counts, (self.first - low, high - self.first - len(self.counts)))
+            self.first = low
+        return indices
+
+    def _merge(self):
+        """
+        Merges pairs of bins, doubling the bin width. Bin edges are kept aligned to the origin,
+        so each merged bin holds exactly the rows of the two bins it replaces.
+        """
+        counts = self.counts
+        if self.first % 2:
+            counts = np.concatenate(([0.], counts))
+            self.first -= 1
+        if len(counts) % 2:
+            counts = np.concatenate((counts, [0.]))
+        self.counts = counts.reshape(-1, 2).sum(axis=1)
+        self.first //= 2
+        self.width *= 2
@@ -14,7 +14,7 @@ from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import QMainWindow, QWidget, QHBoxLayout
 
 from GraphWindow import GraphWindow
-from DataVaultListWidget import Dataset
+from DataVaultListWidget import DatasetRegistry
 
 
 class RSG_client(QMainWindow):
@@ -30,6 +30,7 @@ class RSG_client(QMainWindow):
         self.clipboard = clipboard
         self.reactor = reactor
         self.cxn = None
+        self.registry = None
         # create random client ID
         self.ID = randrange(int(3e5), int(1e6))
         self.setWindowTitle(self.name)
@@ -56,6 +57,9 @@ class RSG_client(QMainWindow):
                 setattr(self, "pv", self.cxn.servers[server_name])
             elif ("data" in server_name.lower()) and ("vault" in server_name.lower()):
                 setattr(self, "dv", self.cxn.servers[server_name])
+        # share datasets between graphs so each dataset is only fetched and stored once
+        if self.registry is None:
+            self.registry = DatasetRegistry(self.cxn, self.dv, self.reactor)
         # connect to signals
             # rsg signal
         # yield self.rsg.signal__plot_update(self.ID)
@@ -93,13 +97,15 @@ class RSG_client(QMainWindow):
     # PLOTTING
     def make_dataset(self, dataset_location):
         """
-        Create and initialize a dataset object.
-        # todo: is this really necessary? why is it separate?
+        Gets a dataset object from the registry, creating it if it isn't already open.
+        Each graph the dataset is added to must hold its own reference, which the
+        graph releases once it stops displaying the dataset.
         Arguments:
             dataset_location    ([str]): the dataset directory location in the data vault.
+        Returns:
+            Dataset: the shared dataset object.
         """
-        cxt = self.cxn.context()
-        return Dataset(self.dv, cxt, dataset_location, reactor)
+        return self.registry.acquire(dataset_location)
 
     def do_plot(self, dataset_location, graph, send_to_current):
         """
@@ -109,15 +115,12 @@ class RSG_client(QMainWindow):
             graph:
             send_to_current:
         """
-        # create a dataset object
-        ds = self.make_dataset(dataset_location)
-
         if (graph != 'current') and send_to_current:
             # add plot to the "current" tab as well as additional specified tab for later examination
             # look in dict for existing if same name but different loc, then add new
-            self.gui.graphDict['current'].add_dataset(ds)
+            self.gui.graphDict['current'].add_dataset(self.make_dataset(dataset_location))
 
-        self.gui.graphDict[graph].add_dataset(ds)
+        self.gui.graphDict[graph].add_dataset(self.make_dataset(dataset_location))
 
     def plot_image(self, data, image_size, graph, name):
         """
@@ -0,0 +1,29 @@
+# benchmarks appending data to a DataBuffer against the old np.append approach
+# i.e. a long-running monitor trace receiving data in 1k-row grabs
+
+import time
+import numpy as np
+from RealSimpleGrapher.DataVaultListWidget.DataBuffer import DataBuffer
+
+rows_total = 10000000
+rows_per_grab = 1000
+columns = 2
+grab = np.random.random((rows_per_grab, columns))
+
+# DataBuffer: amortized O(1) appends
+buffer = DataBuffer(columns)
+start = time.perf_counter()
+for i in range(rows_total // rows_per_grab):
+    buffer.append(grab)
+elapsed = time.perf_counter() - start
+print('DataBuffer: {:d} rows in {:.3f} s ({:.2f} us/grab)'.format(buffer.size, elapsed, 1e6 * elapsed / (rows_total // rows_per_grab)))
+print('\tsize: {:d}, capacity: {:d}'.format(buffer.size, buffer.capacity))
+
+# np.append: copies the whole history on every grab, so only do a fraction of the rows
+rows_total_append = rows_total // 20
+data = np.zeros((0, columns))
+start = time.perf_counter()
+for i in range(rows_total_append // rows_per_grab):
+    data = np.append(data, grab, axis=0)
+elapsed = time.perf_counter() - start
+print('np.append: {:d} rows in {:.3f} s ({:.2f} us/grab)'.format(data.shape[0], elapsed, 1e6 * elapsed / (rows_total_append // rows_per_grab)))
@@ -0,0 +1,34 @@
+# benchmarks fitting the predicted spectrum parameters to a simulated 729 spectrum
+# i.e. peak finding, line assignment, and the coarse to fine least squares
+
+import time
+import numpy as np
+from RealSimpleGrapher.TraceListWidget.PredictSpectrumWidget import Transitions_SD, select_transitions, enumerate_lines,\
+    synthesize_spectrum, line_terms, find_lines, fit_lines
+
+# true parameters: B field (G), line center (MHz), and the mode frequencies (MHz)
+true_params = np.array([3.2, 1.234, 1.31, 2.07, 0.42])
+initial_params = np.array([3.0, 1.2, 1.34, 2.04, 0.45])
+mode_orders = [2, 1, 1]
+manifolds, delta_ms = ['+', '-'], [0, 2, 4]
+transitions = Transitions_SD()
+
+# simulate the spectrum
+carriers = select_transitions(transitions.get_transition_energies(true_params[0] * 1e-4, true_params[1]), manifolds, delta_ms)
+line_freqs, line_orders = enumerate_lines([freq for name, freq in carriers], true_params[2:], mode_orders)
+freqs = np.arange(-30, 30, 0.002)
+counts = synthesize_spectrum(freqs, line_freqs, line_orders) + 0.01 * np.random.standard_normal(len(freqs))
+
+# fit
+start = time.perf_counter()
+coefficients = [coefficient * 1e-4 for name, coefficient in
+                select_transitions(transitions.get_transition_coefficients(), manifolds, delta_ms)]
+terms, drive_orders, line_orders = line_terms(coefficients, mode_orders)
+peak_freqs, peak_heights = find_lines(freqs, counts, prominence=0.1)
+result = fit_lines(peak_freqs, terms, drive_orders, initial_params, [True] * 5, tolerance=0.1,
+                   peak_heights=peak_heights, line_orders=line_orders)
+elapsed = time.perf_counter() - start
+print('fit: {:d} points, {:d} lines, {:d} peaks in {:.1f} ms'.format(len(freqs), len(terms), len(peak_freqs), 1e3 * elapsed))
+print('\tmatched: {:d}, rms residual: {:.2f} kHz, iterations: {:d}, converged: {}'.format(
+    result.num_matched, 1e3 * result.rms, result.iterations, result.converged))
+print('\terror in parameters:', result.parameters - true_params)
@@ -0,0 +1,110 @@
+# checks that the histogram graph releases shared datasets when they're evicted,
+# i.e. re-adding a dataset doesn't leak a registry reference (even while its labels are being fetched),
+# and that evicted traces are removed from the tracelist
+# uses an in-memory stand-in for the data vault, so no labrad connection is needed
+
+import os
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+from twisted.internet import reactor
+from twisted.internet.defer import succeed, Deferred
+
+app = QApplication.instance() or QApplication([])
+
+from RealSimpleGrapher.GUIConfig import graphConfig
+from RealSimpleGrapher.pyqtgraph_widgets import Hist_PyQtGraph
+from RealSimpleGrapher.DataVaultListWidget.DatasetRegistry import DatasetRegistry
+
+
+class DataVault(object):
+    """
+    Holds a single dataset with two dependent variables.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.listeners = 0
+        # holds the pending calls to variables if not None, so they can be completed later
+        self.pending = None
+
+    def cd(self, *args, **kwargs):
+        return succeed(['', 'histograms'])
+
+    def open(self, name, **kwargs):
+        return succeed((None, name))
+
+    def shape(self, **kwargs):
+        return succeed((len(self.rows), self.rows.shape[1]))
+
+    def variables(self, **kwargs):
+        result = ([('counts', '')], [('shots', 'a', ''), ('shots', 'b', '')])
+        if self.pending is None:
+            return succeed(result)
+        d = Deferred()
+        self.pending.append((d, result))
+        return d
+
+    def complete(self):
+        pending, self.pending = self.pending, None
+        for d, result in pending:
+            d.callback(result)
+
+    def signal__data_available(self, *args, **kwargs):
+        return succeed(None)
+
+    def addListener(self, **kwargs):
+        self.listeners += 1
+        return succeed(None)
+
+    def removeListener(self, **kwargs):
+        self.listeners -= 1
+        return succeed(None)
+
+    def get(self, num_rows, **kwargs):
+        return succeed(self.rows.tolist())
+
+
+class Connection(object):
+
+    def __init__(self, data_vault):
+        self.data_vault = data_vault
+        self.servers = {'data_vault': data_vault}
+
+    def context(self):
+        return 1
+
+
+dv = DataVault(np.column_stack((np.arange(10.), np.ones(10), np.ones(10))))
+cxn = Connection(dv)
+registry = DatasetRegistry(cxn, dv, reactor)
+graph = Hist_PyQtGraph(reactor, graphConfig('histogram', isHist=True, max_datasets=2), cxn=cxn, live_update=False)
+locations = [(['', 'histograms'], 'histogram {:d}'.format(i)) for i in range(3)]
+
+# add the first dataset twice (e.g. plotted again), then two more so that it's evicted
+first = registry.acquire(locations[0])
+graph.add_dataset(first)
+graph.add_dataset(registry.acquire(locations[0]))
+print('refcount after re-adding:', registry.refcounts[registry.makeKey(locations[0])])
+graph.add_dataset(registry.acquire(locations[1]))
+graph.add_dataset(registry.acquire(locations[2]))
+
+print('graph datasets:', [ident[1] for ident in graph.datasets])
+print('evicted dataset closed:', first.closed, '| still in registry:', registry.makeKey(locations[0]) in registry.datasets)
+print('open listeners:', dv.listeners)
+print('tracelist traces:', len(graph.tracelist.trace_dict))
+assert first.closed and (registry.makeKey(locations[0]) not in registry.datasets)
+assert dv.listeners == 2
+assert len(graph.tracelist.trace_dict) == 2 * len(graph.datasets)
+
+# add a dataset again while its labels are still being fetched
+dv.pending = []
+location = (['', 'histograms'], 'histogram 3')
+graph.add_dataset(registry.acquire(location))
+graph.add_dataset(registry.acquire(location))
+dv.complete()
+key = registry.makeKey(location)
+print('refcount after re-adding while pending:', registry.refcounts[key], '| artists:', len(graph.artists))
+assert registry.refcounts[key] == 1
+assert len(graph.artists) == 2 * len(graph.datasets) == len(graph.tracelist.trace_dict)
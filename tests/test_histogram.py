@@ -0,0 +1,67 @@
+# checks that the incremental histograms of the histogram widget match np.histogram of the retained rows,
+# i.e. across chunked appends, merging of adaptive bins, rows discarded by the retention policy,
+# and fixed bins
+
+import numpy as np
+
+from RealSimpleGrapher.pyqtgraph_widgets.histogram import HistogramAccumulator
+
+
+def check(name, hist, x, y):
+    """
+    Compares the histogram with np.histogram of the given rows (within the bins).
+    """
+    edges = hist.edges()
+    expected, _ = np.histogram(x, bins=edges, weights=y)
+    error = np.max(np.abs(hist.counts - expected)) if len(expected) else 0.
+    print('{:s}: {:d} bins of width {:g}, max error {:g}'.format(name, len(hist.counts), hist.width, error))
+    assert len(hist.counts) == len(edges) - 1
+    assert error < 1e-9
+
+
+rng = np.random.default_rng(1)
+buffer = object()
+
+# raw shots of photon counts, appended in chunks of varying size
+x = rng.poisson(12, size=5000).astype(float)
+y = np.ones(len(x))
+hist = HistogramAccumulator()
+for end in np.cumsum(rng.integers(1, 200, size=100)):
+    end = min(end, len(x))
+    hist.extend(x[:end], y[:end], 0, buffer)
+check('chunked appends', hist, x[:end], y[:end])
+assert hist.width == 1 and np.sum(hist.counts) == end
+
+# a growing range of x-values merges the adaptive bins
+hist = HistogramAccumulator()
+hist.max_bins = 16
+x = np.round(rng.normal(0, 1, size=3000) * np.linspace(1, 200, 3000))
+y = rng.uniform(0, 2, size=len(x))
+for end in range(100, len(x) + 1, 100):
+    hist.extend(x[:end], y[:end], 0, buffer)
+check('merged bins', hist, x, y)
+assert (len(hist.counts) <= hist.max_bins) and (hist.width > 1)
+
+# rows discarded from the front of the trace (e.g. by a rolling window) rebuild the histogram
+hist = HistogramAccumulator()
+x = rng.poisson(30, size=4000).astype(float)
+y = np.ones(len(x))
+keep = 1000
+for end in range(250, len(x) + 1, 250):
+    offset = max(end - keep, 0)
+    hist.extend(x[offset:end], y[offset:end], offset, buffer)
+    check('retained rows {:d}-{:d}'.format(offset, end), hist, x[offset:end], y[offset:end])
+
+# replacing the storage rebuilds the histogram from scratch
+hist.extend(x[:10], y[:10], 0, object())
+check('replaced storage', hist, x[:10], y[:10])
+
+# fixed bins drop the rows outside of their range
+hist = HistogramAccumulator(bin_width=0.5, bin_range=(0, 10))
+x = rng.uniform(-2, 12, size=2000)
+y = np.ones(len(x))
+for end in range(200, len(x) + 1, 200):
+    hist.extend(x[:end], y[:end], 0, buffer)
+inside = (x >= 0) & (x < 10)
+check('fixed bins', hist, x[inside], y[inside])
+assert (len(hist.counts) == 20) and (hist.outside == np.sum(~inside))